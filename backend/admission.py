@@ -0,0 +1,108 @@
+"""
+Admission control for the analyze endpoints. Each request class (lane) runs a fixed
+number of requests at once and lets a few more wait briefly; past that, requests are
+turned away with 429 (queue full) or 503 (waited too long), both with Retry-After,
+instead of piling up in the threadpool while Gemini is slow. Cheap requests (no Gemini
+calls, small enough to analyze inline) have their own lane, so they never wait behind
+requests that are blocked on the LLM. Limits and counters are per API process.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+FAST_SLOTS = int(os.environ.get("ADMISSION_FAST_SLOTS", "4"))
+FAST_QUEUE = int(os.environ.get("ADMISSION_FAST_QUEUE", "32"))
+SLOTS = int(os.environ.get("ADMISSION_SLOTS", "8"))
+QUEUE = int(os.environ.get("ADMISSION_QUEUE", "8"))
+QUEUE_SECONDS = float(os.environ.get("ADMISSION_QUEUE_SECONDS", "5"))
+
+
+class Rejected(Exception):
+    """The request was not admitted; retry after `retry_after` seconds."""
+
+    def __init__(self, status_code: int, message: str, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Lane:
+    """`slots` requests run at once; up to `queue` more wait at most `queue_seconds` for a slot.
+    Used from the event loop only."""
+
+    def __init__(self, name: str, slots: int, queue: int, queue_seconds: float = QUEUE_SECONDS):
+        self.name = name
+        self.slots = max(1, slots)
+        self.queue = max(0, queue)
+        self.queue_seconds = queue_seconds
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected: Counter = Counter()  # queue_full | queue_timeout
+        self._semaphore: Optional[asyncio.Semaphore] = None  # created on the serving loop
+        self._avg_seconds = 1.0  # moving average of time in a slot, for Retry-After
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a slot for the body of the `async with`. Raises Rejected when the lane is full."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.slots)
+        semaphore = self._semaphore
+        if semaphore.locked() or self.waiting:  # no free slot, or others are already waiting for one
+            if self.waiting >= self.queue:
+                self.rejected["queue_full"] += 1
+                raise Rejected(429, f"too many {self.name} requests in progress; try again later", self.retry_after())
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(semaphore.acquire(), self.queue_seconds)
+            except asyncio.TimeoutError:
+                self.rejected["queue_timeout"] += 1
+                raise Rejected(503, f"{self.name} requests are backed up; try again later", self.retry_after())
+            finally:
+                self.waiting -= 1
+        else:
+            await semaphore.acquire()
+        self.in_flight += 1
+        self.admitted += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (time.monotonic() - start)
+            semaphore.release()
+
+    def retry_after(self) -> int:
+        """Seconds until the queue as it stands now would likely have drained."""
+        return max(1, math.ceil(self._avg_seconds * (self.waiting + 1) / self.slots))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "slots": self.slots,
+            "in_flight": self.in_flight,
+            "queue_limit": self.queue,
+            "queued": self.waiting,
+            "admitted": self.admitted,
+            "rejected": {"queue_full": self.rejected["queue_full"], "queue_timeout": self.rejected["queue_timeout"]},
+        }
+
+
+class Admission:
+    """The fast lane (no Gemini, inline-sized input) and the standard lane for everything else."""
+
+    def __init__(self, fast: Optional[Lane] = None, standard: Optional[Lane] = None):
+        self.fast = fast or Lane("fast", FAST_SLOTS, FAST_QUEUE)
+        self.standard = standard or Lane("standard", SLOTS, QUEUE)
+
+    def lane(self, cheap: bool) -> Lane:
+        return self.fast if cheap else self.standard
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {lane.name: lane.stats() for lane in (self.fast, self.standard)}
+
+
+gate = Admission()
@@ -0,0 +1,246 @@
+"""
+Size-aware routing for /api/analyze. Small inputs are analyzed inline on the request
+thread; large ones go to a pool of worker processes (spawned once, with the analyzers
+already imported) so their AST work never holds the API process's GIL. Python modules
+over ANALYSIS_SPLIT_MIN_BYTES are also split into units that are analyzed across the
+workers and merged here.
+
+Every run has a Deadline (wall-clock and CPU budget); analyses that outlast it stop
+early and return a truncated report. Pooled jobs also have hard limits for code that
+can't stop itself (e.g. one huge parse): ANALYSIS_HARD_LIMIT_GRACE seconds past the
+deadline the job is interrupted, and this side stops waiting shortly after; each worker
+also has an address-space limit. Workers are replaced after a fixed number of jobs to
+keep their memory in check.
+"""
+import logging
+import os
+import signal
+import sys
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+
+from analyzers.limits import CPU_SECONDS, Deadline
+from analyzers.pipeline import STAGES, analyze_unit, check_request, required_stages, run_analysis
+from analyzers.rules import RuleConfig, Suppressions
+from analyzers.source import SourceText
+from analyzers.units import split_units
+
+try:
+    import resource
+except ImportError:  # Windows: no per-job CPU or memory limit
+    resource = None
+
+log = logging.getLogger(__name__)
+
+INLINE_MAX_BYTES = int(os.environ.get("ANALYSIS_INLINE_MAX_BYTES", "32768"))
+WORKERS = int(os.environ.get("ANALYSIS_WORKERS", str(min(4, os.cpu_count() or 1))))
+MAX_TASKS_PER_WORKER = int(os.environ.get("ANALYSIS_MAX_TASKS_PER_WORKER", "50"))
+HARD_LIMIT_GRACE = float(os.environ.get("ANALYSIS_HARD_LIMIT_GRACE", "2"))
+WORKER_MEMORY_MB = int(os.environ.get("ANALYSIS_WORKER_MEMORY_MB", "1024"))  # on top of the idle worker; 0 = no limit
+SPLIT_MIN_BYTES = int(os.environ.get("ANALYSIS_SPLIT_MIN_BYTES", "262144"))
+UNITS_PER_WORKER = 2  # a little slack so one slow unit doesn't leave the other workers idle
+
+
+class AnalysisTimeout(Exception):
+    """A pooled job went past its hard CPU or wall-clock limit without stopping; it has no report."""
+
+
+class AnalysisOutOfMemory(Exception):
+    """A pooled job needed more than ANALYSIS_WORKER_MEMORY_MB."""
+
+
+class AnalysisUnavailable(Exception):
+    """The worker pool broke (a worker was killed); the job was not completed."""
+
+
+# --- Worker side ---
+
+class _LimitExceeded(BaseException):
+    # Not an Exception: broad `except Exception` handlers (e.g. around Gemini calls) must not swallow it
+    pass
+
+
+_base_limit = None
+
+
+def _on_limit(signum, frame):
+    raise _LimitExceeded("CPU" if signum == signal.SIGXCPU else "wall-clock")
+
+
+def _init_worker() -> None:
+    """Runs once per worker process. Importing this module has already loaded the analyzers."""
+    global _base_limit
+    if resource is not None:
+        _base_limit = resource.getrlimit(resource.RLIMIT_CPU)
+        signal.signal(signal.SIGXCPU, _on_limit)
+        signal.signal(signal.SIGALRM, _on_limit)
+        _limit_memory()
+
+
+def _limit_memory() -> None:
+    # Address space, so the baseline (interpreter, analyzers, NumPy) is measured rather than guessed
+    if WORKER_MEMORY_MB <= 0 or not os.path.exists("/proc/self/statm"):
+        return
+    with open("/proc/self/statm") as fh:
+        used = int(fh.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    hard = resource.getrlimit(resource.RLIMIT_AS)[1]
+    soft = used + WORKER_MEMORY_MB * 1024 * 1024
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+def _run_limited(fn: Callable[..., Any], *args, deadline: Deadline, **kwargs) -> Any:
+    """fn(*args, deadline=deadline, **kwargs), interrupted HARD_LIMIT_GRACE seconds after the deadline
+    (wall-clock or CPU) if it has not returned by then."""
+    if resource is None or _base_limit is None:
+        return fn(*args, deadline=deadline, **kwargs)
+    remaining = deadline.remaining()
+    if remaining is not None:
+        signal.setitimer(signal.ITIMER_REAL, remaining + HARD_LIMIT_GRACE)
+    if CPU_SECONDS > 0:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime + CPU_SECONDS + HARD_LIMIT_GRACE) + 1
+        hard = _base_limit[1]
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    try:
+        return fn(*args, deadline=deadline, **kwargs)
+    except _LimitExceeded as e:
+        raise AnalysisTimeout(f"analysis went over its {e} limit and was stopped")
+    except MemoryError:
+        raise AnalysisOutOfMemory(f"analysis needed more than {WORKER_MEMORY_MB} MB")
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        resource.setrlimit(resource.RLIMIT_CPU, _base_limit)
+
+
+def _noop() -> None:
+    pass
+
+
+# --- API side ---
+
+class AnalysisPool:
+    """Runs run_analysis inline or in a worker process depending on the input size."""
+
+    def __init__(self, workers: int = WORKERS, max_tasks_per_worker: int = MAX_TASKS_PER_WORKER,
+                 inline_max_bytes: int = INLINE_MAX_BYTES, split_min_bytes: int = SPLIT_MIN_BYTES):
+        self.workers = max(1, workers)
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.inline_max_bytes = inline_max_bytes
+        self.split_min_bytes = split_min_bytes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs = 0
+        self._lock = threading.Lock()
+
+    def run(self, code: Union[str, SourceText], language: str, analyzers: Optional[Iterable[str]] = None,
+            ai: str = "summary", config: Optional[RuleConfig] = None, deadline: Optional[Deadline] = None,
+            stats: bool = False) -> Dict[str, Any]:
+        """Analysis report. Raises ValueError for bad arguments; AnalysisTimeout, AnalysisOutOfMemory or
+        AnalysisUnavailable for pooled jobs. A SourceText is sent to a worker as bytes, never as a decoded copy.
+        `deadline` (default: a new one) covers the whole run, including waiting for a worker."""
+        deadline = deadline or Deadline()
+        size = code.nbytes if isinstance(code, SourceText) else len(code.encode("utf-8"))
+        if size <= self.inline_max_bytes:
+            return run_analysis(code, language, analyzers, ai, config=config, deadline=deadline, stats=stats)
+        check_request(language, ai)
+        analyzers = list(analyzers) if analyzers is not None else None
+        executor = self._get_executor()
+        try:
+            if language == "python" and self.workers > 1 and size >= self.split_min_bytes:
+                text = code.text if isinstance(code, SourceText) else code
+                return self._run_split(executor, text, language, analyzers, ai, config, deadline, stats)
+            future = executor.submit(_run_limited, run_analysis, code, language, analyzers, ai, config=config,
+                                     deadline=deadline, stats=stats)
+            return self._wait(executor, future, deadline)
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise AnalysisUnavailable("analysis worker died; try again")
+
+    def _run_split(self, executor: ProcessPoolExecutor, code: str, language: str, analyzers: Optional[list], ai: str,
+                   config: Optional[RuleConfig], deadline: Deadline, stats: bool) -> Dict[str, Any]:
+        """Analyze units of the module across the workers, then merge them in this process.
+        Falls back to one whole-module job when the module can't be split into parsable units."""
+        unit_config = (config or RuleConfig()).without(Suppressions(code).file_rules)
+        stages = required_stages(STAGES if analyzers is None else analyzers, unit_config)
+        chunks = split_units(code, code.count("\n") // (self.workers * UNITS_PER_WORKER) + 1)
+        if len(chunks) > 1:
+            futures = [executor.submit(_run_limited, analyze_unit, text, first, language, unit_config, stages,
+                                       deadline=deadline)
+                       for first, text in chunks]
+            try:
+                units = [self._wait(executor, f, deadline) for f in futures]
+            finally:
+                for f in futures:
+                    f.cancel()
+            if all(u is not None for u in units):
+                return run_analysis(code, language, analyzers, ai, config=config, units=units, deadline=deadline,
+                                    stats=stats)
+        future = executor.submit(_run_limited, run_analysis, code, language, analyzers, ai, config=config,
+                                 deadline=deadline, stats=stats)
+        return self._wait(executor, future, deadline)
+
+    def _wait(self, executor: ProcessPoolExecutor, future: Future, deadline: Deadline) -> Any:
+        """The job's result. A worker normally stops itself HARD_LIMIT_GRACE seconds past the deadline;
+        one that is stuck past twice that (e.g. in C code, where signals wait) is killed with its pool."""
+        remaining = deadline.remaining()
+        try:
+            return future.result(timeout=None if remaining is None else remaining + 2 * HARD_LIMIT_GRACE)
+        except FutureTimeout:
+            if not future.cancel():  # still queued jobs just never start
+                self._discard(executor, kill=True)
+            raise AnalysisTimeout("analysis went over its wall-clock limit and was stopped")
+
+    def warm(self) -> None:
+        """Start the workers now rather than on the first large request."""
+        executor = self._get_executor()
+        for f in [executor.submit(_noop) for _ in range(self.workers)]:
+            f.result()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            old = None
+            if self._executor is not None and sys.version_info < (3, 11) and self.max_tasks_per_worker > 0:
+                # No max_tasks_per_child before 3.11: replace the whole pool after the same number of jobs
+                self._jobs += 1
+                if self._jobs > self.max_tasks_per_worker * self.workers:
+                    old, self._executor, self._jobs = self._executor, None, 1
+            if self._executor is None:
+                kwargs = {}
+                if sys.version_info >= (3, 11) and self.max_tasks_per_worker > 0:
+                    kwargs["max_tasks_per_child"] = self.max_tasks_per_worker
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=get_context("spawn"), initializer=_init_worker, **kwargs
+                )
+            executor = self._executor
+        if old is not None:
+            old.shutdown(wait=False)
+        return executor
+
+    def _discard(self, executor: ProcessPoolExecutor, kill: bool = False) -> None:
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        if kill:
+            log.warning("Analysis worker stuck past its deadline; replacing the pool")
+            # No public API for this; the other jobs in the pool fail with BrokenProcessPool
+            for process in list((getattr(executor, "_processes", None) or {}).values()):
+                process.kill()
+        else:
+            log.warning("Analysis worker pool broke; starting a new one")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+pool = AnalysisPool()
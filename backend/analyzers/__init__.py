@@ -1,12 +1,22 @@
 # CodeRefine analyzers package
+from .context import AnalysisContext
+from .issues import Issue
+from .limits import IssueBudget
+from .source import SourceText
 from .static_analyzer import StaticAnalyzer
 from .logic_analyzer import LogicAnalyzer
 from .complexity_analyzer import ComplexityAnalyzer
 from .optimization_engine import OptimizationEngine
+from .pipeline import run_analysis
 
 __all__ = [
+    "AnalysisContext",
+    "Issue",
+    "IssueBudget",
+    "SourceText",
     "StaticAnalyzer",
     "LogicAnalyzer",
     "ComplexityAnalyzer",
     "OptimizationEngine",
+    "run_analysis",
 ]
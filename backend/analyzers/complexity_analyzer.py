@@ -5,113 +5,146 @@ Loop and recursion analysis; performance bottleneck highlighting.
 
 import ast
 import re
-from typing import List, Dict, Any, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from .context import AnalysisContext
+from .issues import Issue
+from .limits import WALK_CHECK_EVERY, Deadline, walk
+
+
+# Python estimates, least to most expensive
+ESTIMATES = ("O(1)", "O(n)", "O(n²)", "O(n³) or higher / recursion")
+
+
+class ComplexityResult(NamedTuple):
+    issues: Tuple[Issue, ...]
+    estimated_complexity: str
+
+
+class RecursionFacts(NamedTuple):
+    """What the recursion check needs from a module (or the merged facts of its parts)."""
+    recursive: Set[str]  # functions that call themselves
+    calls: List[Tuple[int, str]]  # (line, name) of every call to a plain name, in walk order
 
 
 class ComplexityAnalyzer:
-    """Estimates time complexity and highlights bottlenecks."""
+    """Estimates time complexity and highlights bottlenecks. Stateless; shared across requests."""
 
     def __init__(self, language: str):
         self.language = language.lower()
-        self.issues: List[Dict[str, Any]] = []
-        self.estimated_complexity: str = "O(1)"
-
-    def analyze(self, source: str) -> Tuple[List[Dict[str, Any]], str]:
-        """Returns (list of complexity-related issues, overall complexity string)."""
-        self.issues = []
-        self.estimated_complexity = "O(1)"
-        if self.language == "python":
-            self._analyze_python(source)
-        else:
-            self._analyze_c(source)
-        return self.issues, self.estimated_complexity
-
-    def _add(self, line: int, issue_type: str, message: str, complexity: str, snippet: str = ""):
-        self.issues.append({
-            "line": line,
-            "type": issue_type,
-            "message": message,
-            "complexity": complexity,
-            "snippet": snippet or "",
-            "category": "complexity",
-        })
-
-    def _analyze_python(self, source: str) -> None:
-        try:
-            tree = ast.parse(source)
-        except SyntaxError:
+
+    def analyze(self, ctx: AnalysisContext, select: Callable[[Iterable[Issue]], Sequence[Issue]] = tuple) -> ComplexityResult:
+        """Complexity-related issues plus the overall complexity string.
+        `select` consumes the issue stream (e.g. an IssueBudget cap); if it stops early (a Deadline),
+        the estimate only covers the part of the module that was walked."""
+        found = {"estimate": "O(1)"}
+        scan = self._analyze_python if self.language == "python" else self._analyze_c
+        issues = select(scan(ctx, found))
+        return ComplexityResult(tuple(issues), found["estimate"])
+
+    @staticmethod
+    def _issue(line: int, issue_type: str, message: str, complexity: str, snippet: str = "") -> Issue:
+        return Issue(line, issue_type, message, snippet or "", "complexity", complexity=complexity)
+
+    def _analyze_python(self, ctx: AnalysisContext, found: Dict[str, str]) -> Iterator[Issue]:
+        tree = ctx.tree
+        if tree is None:
             return
-        lines = source.splitlines()
         has_recursion = False
         max_depth = 0
+        enabled = ctx.config.enabled
+        # Loop depth always feeds estimated_complexity; the per-loop issues are optional
+        emit = {t: enabled(t, "complexity") for t in ("loop", "nested_loop", "deep_loop")}
+        builtins = enabled("builtin_loop", "complexity")
+        recursive = recursion_facts(tree, ctx.deadline).recursive if enabled("recursion", "complexity") else set()
+        loops = loop_chains(tree, ctx.deadline)
+        if loops is None:
+            return
 
-        def depth_of(node: ast.AST, d: int) -> int:
-            if isinstance(node, (ast.For, ast.While)):
-                inner = d + 1
-                for child in ast.iter_child_nodes(node):
-                    inner = max(inner, depth_of(child, d + 1))
-                return inner
-            out = d
-            for child in ast.iter_child_nodes(node):
-                out = max(out, depth_of(child, d))
-            return out
-
-        for node in ast.walk(tree):
+        for node in ctx.walk(tree):
             if isinstance(node, (ast.For, ast.While)):
-                depth = depth_of(node, 1)
+                depth = loops[node] + 1
                 max_depth = max(max_depth, depth)
                 if depth == 1:
-                    self._add(node.lineno, "loop", "Single loop typically O(n).", "O(n)", _line(lines, node.lineno))
+                    if emit["loop"]:
+                        yield self._issue(node.lineno, "loop", "Single loop typically O(n).", "O(n)", ctx.line(node.lineno))
                 elif depth == 2:
-                    self._add(node.lineno, "nested_loop", "Nested loop can be O(n²) or O(n*m).", "O(n²)", _line(lines, node.lineno))
-                else:
-                    self._add(node.lineno, "deep_loop", "Deep nesting may cause high time complexity.", "O(n³)+", _line(lines, node.lineno))
-            if isinstance(node, ast.Call) and isinstance(getattr(node.func, "id", None), str):
+                    if emit["nested_loop"]:
+                        yield self._issue(node.lineno, "nested_loop", "Nested loop can be O(n²) or O(n*m).", "O(n²)", ctx.line(node.lineno))
+                elif emit["deep_loop"]:
+                    yield self._issue(node.lineno, "deep_loop", "Deep nesting may cause high time complexity.", "O(n³)+", ctx.line(node.lineno))
+            if builtins and isinstance(node, ast.Call) and isinstance(getattr(node.func, "id", None), str):
                 if node.func.id in ("sorted", "min", "max", "sum"):
-                    self._add(node.lineno, "builtin_loop", "Built-in may add O(n) per call.", "O(n)", _line(lines, node.lineno))
-            if isinstance(node, ast.Call):
-                f = node.func
-                if isinstance(f, ast.Name) and f.id and _calls_self(tree, f.id):
-                    has_recursion = True
-                    self._add(node.lineno, "recursion", "Recursion: check base case and depth.", "O(recursion depth)", _line(lines, node.lineno))
-
-        if max_depth >= 3 or has_recursion:
-            self.estimated_complexity = "O(n³) or higher / recursion"
-        elif max_depth == 2:
-            self.estimated_complexity = "O(n²)"
-        elif max_depth == 1:
-            self.estimated_complexity = "O(n)"
-        else:
-            self.estimated_complexity = "O(1)"
+                    yield self._issue(node.lineno, "builtin_loop", "Built-in may add O(n) per call.", "O(n)", ctx.line(node.lineno))
+            if recursive and isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in recursive:
+                has_recursion = True
+                yield self._recursion_issue(node.lineno, ctx)
+
+        found["estimate"] = ESTIMATES[3 if has_recursion else min(max_depth, 3)]
 
-    def _analyze_c(self, source: str) -> None:
-        lines = source.splitlines()
+    def recursive_calls(self, facts: RecursionFacts, ctx: AnalysisContext) -> Iterator[Issue]:
+        """Recursion issues from facts gathered separately (e.g. merged from parts of a module)."""
+        for lineno, name in facts.calls:
+            if name in facts.recursive:
+                yield self._recursion_issue(lineno, ctx)
+
+    def _recursion_issue(self, lineno: int, ctx: AnalysisContext) -> Issue:
+        return self._issue(lineno, "recursion", "Recursion: check base case and depth.", "O(recursion depth)", ctx.line(lineno))
+
+    def _analyze_c(self, ctx: AnalysisContext, found: Dict[str, str]) -> Iterator[Issue]:
+        emit = {t: ctx.config.enabled(t, "complexity") for t in ("loop", "nested_loop", "deep_loop")}
         depth = 0
-        for i, line in enumerate(lines, 1):
+        for i, line in ctx.iter_lines():
             if re.match(r"\s*(for|while)\s*\(", line):
                 depth += 1
                 if depth == 1:
-                    self._add(i, "loop", "Single loop typically O(n).", "O(n)", line.strip())
+                    if emit["loop"]:
+                        yield self._issue(i, "loop", "Single loop typically O(n).", "O(n)", line.strip())
                 elif depth == 2:
-                    self._add(i, "nested_loop", "Nested loop can be O(n²).", "O(n²)", line.strip())
-                elif depth >= 3:
-                    self._add(i, "deep_loop", "Deep nesting may cause high complexity.", "O(n³)+", line.strip())
+                    if emit["nested_loop"]:
+                        yield self._issue(i, "nested_loop", "Nested loop can be O(n²).", "O(n²)", line.strip())
+                elif emit["deep_loop"]:
+                    yield self._issue(i, "deep_loop", "Deep nesting may cause high complexity.", "O(n³)+", line.strip())
             if re.match(r"\s*}", line):
                 depth = max(0, depth - 1)
-        self.estimated_complexity = "O(n²)" if depth >= 2 else ("O(n)" if depth >= 1 else "O(1)")
+        found["estimate"] = "O(n²)" if depth >= 2 else ("O(n)" if depth >= 1 else "O(1)")
+
+
+def loop_chains(tree: ast.AST, deadline: Optional[Deadline] = None) -> Optional[Dict[ast.AST, int]]:
+    """For every node, the most loops on one path down from it (the node included). One iterative
+    post-order pass, so the cost is linear and deeply nested input can't exhaust the call stack.
+    None when `deadline` runs out first."""
+    below: Dict[ast.AST, int] = {}
+    stack: List[Tuple[ast.AST, bool]] = [(tree, False)]
+    steps = 0
+    while stack:
+        steps += 1
+        if deadline is not None and steps % WALK_CHECK_EVERY == 0 and not deadline.check():
+            return None
+        node, visited = stack.pop()
+        if not visited:
+            stack.append((node, True))
+            stack.extend((child, False) for child in ast.iter_child_nodes(node))
+        else:
+            inner = max((below[child] for child in ast.iter_child_nodes(node)), default=0)
+            below[node] = inner + isinstance(node, (ast.For, ast.While))
+    return below
 
 
-def _line(lines: List[str], lineno: int) -> str:
-    if 1 <= lineno <= len(lines):
-        return lines[lineno - 1].strip()
-    return ""
+def recursion_facts(tree: ast.AST, deadline: Optional[Deadline] = None) -> RecursionFacts:
+    """Functions defined in `tree` that call themselves, and every call to a plain name.
+    Once `deadline` runs out the facts cover only the part walked: fewer findings, never false ones."""
+    facts = RecursionFacts(set(), [])
+    for node in walk(tree, deadline):
+        if isinstance(node, ast.FunctionDef) and node.name not in facts.recursive and _calls_name(node, node.name, deadline):
+            facts.recursive.add(node.name)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id:
+            facts.calls.append((node.lineno, node.func.id))
+    return facts
 
 
-def _calls_self(tree: ast.AST, func_name: str) -> bool:
-    """Check if function named func_name is defined and calls itself."""
-    for node in ast.walk(tree):
-        if isinstance(node, ast.FunctionDef) and node.name == func_name:
-            for n in ast.walk(node):
-                if isinstance(n, ast.Call) and isinstance(getattr(n.func, "id", None), str) and n.func.id == func_name:
-                    return True
+def _calls_name(func: ast.FunctionDef, name: str, deadline: Optional[Deadline] = None) -> bool:
+    for n in walk(func, deadline):
+        if isinstance(n, ast.Call) and isinstance(n.func, ast.Name) and n.func.id == name:
+            return True
     return False
@@ -0,0 +1,77 @@
+"""
+AnalysisContext: everything one analysis run reads. Analyzers are shared, stateless
+objects; all per-request data (source, rule config, parsed views) lives here, and the
+line index, line metrics and Python AST are built once and reused by every analyzer.
+"""
+
+import ast
+from typing import Iterator, Optional, Tuple, Union
+
+from .limits import PARSE_SECONDS_PER_MB, Deadline, walk
+from .metrics import LineMetrics, line_metrics
+from .rules import RuleConfig
+from .source import SourceText
+
+
+class AnalysisContext:
+    """Input for one analysis. Not shared between requests; derived views are cached on first use.
+    With a `deadline`, parsing and AST walks (walk()) stop early once it runs out."""
+
+    __slots__ = ("source_text", "language", "config", "deadline", "_tree", "_syntax_error", "_metrics")
+
+    def __init__(self, source: Union[str, SourceText], language: str, config: Optional[RuleConfig] = None,
+                 deadline: Optional[Deadline] = None):
+        self.source_text = source if isinstance(source, SourceText) else SourceText(source)
+        self.language = language.lower()
+        self.config = config or RuleConfig()
+        self.deadline = deadline
+        self._tree: Optional[ast.AST] = None
+        self._syntax_error: Optional[SyntaxError] = None
+        self._metrics: Optional[LineMetrics] = None
+
+    @property
+    def source(self) -> str:
+        """The whole source as a str (decoded on first use for byte/mmap input)."""
+        return self.source_text.text
+
+    @property
+    def tree(self) -> Optional[ast.AST]:
+        """Parsed Python module, or None when the source does not parse (see syntax_error) or the
+        deadline leaves too little time to parse it (deadline.truncated is then set)."""
+        if self._tree is None and self._syntax_error is None:
+            if self.deadline is not None and (
+                self.deadline.truncated
+                or not self.deadline.time_for(self.source_text.nbytes / 1e6 * PARSE_SECONDS_PER_MB)
+            ):
+                return None
+            try:
+                self._tree = ast.parse(self.source)
+            except SyntaxError as e:
+                self._syntax_error = e
+            except (RecursionError, MemoryError):  # a + a + ... or - - - ... 1 thousands of terms long
+                self._syntax_error = SyntaxError("too deeply nested to analyze")
+        return self._tree
+
+    @property
+    def syntax_error(self) -> Optional[SyntaxError]:
+        self.tree
+        return self._syntax_error
+
+    @property
+    def line_metrics(self) -> LineMetrics:
+        """Length, indentation and trailing whitespace of every line (see metrics.py)."""
+        if self._metrics is None:
+            self._metrics = line_metrics(self.source_text)
+        return self._metrics
+
+    def walk(self, node: ast.AST) -> Iterator[ast.AST]:
+        """ast.walk() bounded by the deadline."""
+        return walk(node, self.deadline)
+
+    def line(self, lineno: int) -> str:
+        """Stripped text of a 1-based line, or "" when out of range."""
+        return self.source_text.line(lineno).strip()
+
+    def iter_lines(self) -> Iterator[Tuple[int, str]]:
+        """(line number, raw line) for every line, without building a list of them."""
+        return self.source_text.iter_lines()
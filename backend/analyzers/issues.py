@@ -0,0 +1,59 @@
+"""
+Issue record shared by all analyzers: a slotted object instead of a dict per finding.
+Keeps dict-style read access (issue["line"], issue.get("snippet")) for existing callers.
+"""
+
+from typing import Any, Dict, Optional
+
+
+class Issue:
+    """One finding. `complexity` is set by ComplexityAnalyzer, `ai_summary` by OptimizationEngine."""
+
+    __slots__ = ("line", "type", "message", "snippet", "category", "complexity", "ai_summary")
+
+    def __init__(
+        self,
+        line: int,
+        type: str,
+        message: str,
+        snippet: str = "",
+        category: str = "static",
+        complexity: Optional[str] = None,
+        ai_summary: Optional[str] = None,
+    ):
+        self.line = line
+        self.type = type
+        self.message = message
+        self.snippet = snippet
+        self.category = category
+        self.complexity = complexity
+        self.ai_summary = ai_summary
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON shape; optional fields are included only when set."""
+        d = {"line": self.line, "type": self.type, "message": self.message, "snippet": self.snippet, "category": self.category}
+        if self.complexity is not None:
+            d["complexity"] = self.complexity
+        if self.ai_summary is not None:
+            d["ai_summary"] = self.ai_summary
+        return d
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Issue):
+            return NotImplemented
+        return all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    def __hash__(self) -> int:
+        return hash((self.line, self.type, self.message, self.category))
+
+    def __repr__(self) -> str:
+        return f"Issue({self.category}:{self.type} @ line {self.line}: {self.message!r})"
@@ -0,0 +1,171 @@
+"""
+Caps on how many issues one report carries, and how long it may take. Analyzers yield
+issues lazily; IssueBudget keeps the most severe per category with a bounded heap and
+counts whatever it drops, so a generated file with 50k long lines stays a small report.
+Deadline stops the issue streams, the AST walks (see walk()) and the Gemini calls once an
+analysis has used its wall-clock or CPU time, and the report keeps what was finished.
+"""
+
+import ast
+import heapq
+import os
+import time
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+from .issues import Issue
+
+MAX_ISSUES_PER_CATEGORY = int(os.environ.get("MAX_ISSUES_PER_CATEGORY", "200"))
+MAX_ISSUES_TOTAL = int(os.environ.get("MAX_ISSUES_TOTAL", "500"))
+DEADLINE_SECONDS = float(os.environ.get("ANALYSIS_DEADLINE_SECONDS", "10"))
+CPU_SECONDS = float(os.environ.get("ANALYSIS_CPU_SECONDS", "20"))
+MIN_AI_SECONDS = 0.5  # don't start a Gemini call with less time than this left
+# ast.parse can't be interrupted: it is skipped when less than this (per MB of source) is left
+PARSE_SECONDS_PER_MB = float(os.environ.get("ANALYSIS_PARSE_SECONDS_PER_MB", "1.5"))
+WALK_CHECK_EVERY = 1024  # AST nodes visited between deadline checks
+
+T = TypeVar("T")
+
+# Higher is more severe; unknown types rank 1
+SEVERITY: Dict[str, int] = {
+    "syntax_error": 5,
+    "unreachable_code": 4,
+    "remove_dead_code": 4,
+    "recursion": 3,
+    "deep_loop": 3,
+    "nested_loop": 3,
+    "complexity": 3,
+    "flatten_loop": 3,
+    "loop_optimization": 3,
+    "unused_variable": 2,
+    "bad_practice": 2,
+    "redundant_computation": 2,
+    "cache_len": 2,
+    "remove_unused": 2,
+    "style_fix": 2,
+    "loop": 1,
+    "builtin_loop": 1,
+    "formatting": 0,
+}
+
+
+def severity(issue: Issue) -> int:
+    return SEVERITY.get(issue.type, 1)
+
+
+def top_k(issues: Iterable[Issue], k: int) -> Tuple[List[Issue], Counter]:
+    """The k most severe issues (ties go to the earlier one), in their original order,
+    plus a per-type count of the ones left out. Memory is O(k) whatever the input size."""
+    heap: List[Tuple[int, int, Issue]] = []  # (severity, -seq, issue); root is the weakest kept
+    dropped: Counter = Counter()
+    for seq, issue in enumerate(issues):
+        entry = (severity(issue), -seq, issue)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif k > 0 and entry[:2] > heap[0][:2]:
+            dropped[heapq.heapreplace(heap, entry)[2].type] += 1
+        else:
+            dropped[issue.type] += 1
+    heap.sort(key=lambda e: -e[1])
+    return [e[2] for e in heap], dropped
+
+
+class IssueBudget:
+    """Per-request caps. select() applies the per-category cap as a stage's issues stream in;
+    limit_total() trims the finished report to the total cap across categories."""
+
+    def __init__(self, per_category: int = MAX_ISSUES_PER_CATEGORY, total: int = MAX_ISSUES_TOTAL):
+        self.per_category = max(0, per_category)
+        self.total = max(0, total)
+        self.dropped: Dict[str, Counter] = {}
+
+    def select(self, category: str, issues: Iterable[Issue]) -> List[Issue]:
+        kept, dropped = top_k(issues, self.per_category)
+        self._record(category, dropped)
+        return kept
+
+    def limit_total(self, groups: Dict[str, List[Issue]]) -> Dict[str, List[Issue]]:
+        """groups maps category -> kept issues; returns the same mapping trimmed to `total`.
+        The total is shared out evenly (small categories keep everything and their unused
+        share goes to the rest), then each category keeps its most severe issues."""
+        if sum(len(v) for v in groups.values()) <= self.total:
+            return groups
+        remaining, left = self.total, len(groups)
+        out: Dict[str, List[Issue]] = {}
+        for cat, items in sorted(groups.items(), key=lambda kv: len(kv[1])):
+            share = min(len(items), remaining // left)
+            out[cat], dropped = top_k(items, share)
+            self._record(cat, dropped)
+            remaining -= share
+            left -= 1
+        return {cat: out[cat] for cat in groups}
+
+    def add_dropped(self, dropped: Dict[str, Counter]) -> None:
+        """Count drops made by another budget on part of the same input (see IssueBudget.dropped)."""
+        for category, counts in dropped.items():
+            self._record(category, counts)
+
+    def _record(self, category: str, dropped: Counter) -> None:
+        if dropped:
+            self.dropped.setdefault(category, Counter()).update(dropped)
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """{category: {issue_type: dropped}} for categories that lost anything."""
+        return {cat: dict(c) for cat, c in self.dropped.items()}
+
+
+class Deadline:
+    """Wall-clock and CPU-time budget for one analysis (<= 0 means no limit). CPU time is the
+    calling thread's. Work that stops because the budget ran out sets `truncated`.
+    Pickling (e.g. to a worker process) carries the remaining budget, not the start time."""
+
+    def __init__(self, seconds: float = DEADLINE_SECONDS, cpu_seconds: float = CPU_SECONDS):
+        self._wall_end = time.monotonic() + seconds if seconds > 0 else None
+        self._cpu_end = time.thread_time() + cpu_seconds if cpu_seconds > 0 else None
+        self.truncated = False
+
+    def __reduce__(self):
+        cpu = max(0.001, self._cpu_end - time.thread_time()) if self._cpu_end is not None else 0
+        return (Deadline, (self.remaining() or 0, cpu))
+
+    def remaining(self) -> Optional[float]:
+        """Wall-clock seconds left (at least a millisecond), or None without a wall-clock limit."""
+        if self._wall_end is None:
+            return None
+        return max(0.001, self._wall_end - time.monotonic())
+
+    def check(self) -> bool:
+        """True while there is time left; once there isn't, marks the analysis truncated."""
+        if not self.truncated and (
+            (self._wall_end is not None and time.monotonic() >= self._wall_end)
+            or (self._cpu_end is not None and time.thread_time() >= self._cpu_end)
+        ):
+            self.truncated = True
+        return not self.truncated
+
+    def time_for(self, seconds: float) -> bool:
+        """Like check(), but also False (and truncated) when less than `seconds` of wall-clock time is left."""
+        remaining = self.remaining()
+        if remaining is not None and remaining < seconds:
+            self.truncated = True
+        return self.check()
+
+    def guard(self, issues: Iterable[Issue]) -> Iterator[Issue]:
+        """`issues` until the budget runs out."""
+        for issue in issues:
+            yield issue
+            if not self.check():
+                break
+
+    def bounded(self, items: Iterable[T], every: int = WALK_CHECK_EVERY) -> Iterator[T]:
+        """`items`, checking the budget every `every` of them; stops once it runs out."""
+        for n, item in enumerate(items, 1):
+            if n % every == 0 and not self.check():
+                return
+            yield item
+
+
+def walk(node: ast.AST, deadline: Optional[Deadline] = None) -> Iterator[ast.AST]:
+    """ast.walk() that stops once `deadline` runs out (then deadline.truncated is set)."""
+    nodes = ast.walk(node)
+    return nodes if deadline is None else deadline.bounded(nodes)
@@ -0,0 +1,146 @@
+"""
+Line metrics for the formatting checks and the report's per-file stats: the length,
+indentation and trailing whitespace of every line, computed in one pass. With NumPy the
+pass works on the file's UTF-8 bytes as arrays (one newline search yields every line's
+bounds, and the other metrics are array operations over those bounds); without it, a
+plain loop over the lines fills the same arrays.
+"""
+
+from array import array
+from typing import Any, Dict, Iterator, Tuple
+
+from .source import SourceText
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python fallback below
+    np = None
+
+_NL, _CR, _TAB, _SPACE = 10, 13, 9, 32
+
+
+class LineMetrics:
+    """Per-line metrics of one file, indexed from 0 (line 1). Lengths count characters without
+    the line break; indent counts the leading spaces and tabs, `tabs` the tabs among them."""
+
+    __slots__ = ("lengths", "indent", "tabs", "trailing")
+
+    def __init__(self, lengths, indent, tabs, trailing):
+        self.lengths = lengths
+        self.indent = indent
+        self.tabs = tabs
+        self.trailing = trailing  # 1 when the line ends in a space or tab
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def flagged(self, max_line_length: int) -> Iterator[Tuple[int, bool, bool, bool]]:
+        """(line number, too long, mixed indentation, trailing whitespace) for each line with any of them."""
+        if np is not None and isinstance(self.lengths, np.ndarray):
+            long = self.lengths > max_line_length
+            mixed = (self.tabs > 0) & (self.tabs < self.indent)
+            trailing = self.trailing.astype(bool)
+            for i in np.flatnonzero(long | mixed | trailing).tolist():
+                yield i + 1, bool(long[i]), bool(mixed[i]), bool(trailing[i])
+            return
+        for i, length in enumerate(self.lengths):
+            tabs = self.tabs[i]
+            too_long, mixed = length > max_line_length, 0 < tabs < self.indent[i]
+            if too_long or mixed or self.trailing[i]:
+                yield i + 1, too_long, mixed, bool(self.trailing[i])
+
+    def stats(self, max_line_length: int) -> Dict[str, Any]:
+        """Per-file totals for the report."""
+        n = len(self)
+        if not n:
+            return {"lines": 0, "blank_lines": 0, "max_line_length": 0, "avg_line_length": 0.0, "long_lines": 0,
+                    "max_indent": 0, "tab_indented_lines": 0, "mixed_indent_lines": 0, "trailing_whitespace_lines": 0}
+        if np is not None and isinstance(self.lengths, np.ndarray):
+            lengths, indent, tabs = self.lengths, self.indent, self.tabs
+            return {
+                "lines": n,
+                "blank_lines": int(np.count_nonzero(lengths == indent)),
+                "max_line_length": int(lengths.max()),
+                "avg_line_length": round(float(lengths.mean()), 1),
+                "long_lines": int(np.count_nonzero(lengths > max_line_length)),
+                "max_indent": int(indent[indent < lengths].max(initial=0)),
+                "tab_indented_lines": int(np.count_nonzero(tabs)),
+                "mixed_indent_lines": int(np.count_nonzero((tabs > 0) & (tabs < indent))),
+                "trailing_whitespace_lines": int(np.count_nonzero(self.trailing)),
+            }
+        blank = long = max_indent = tabbed = mixed = 0
+        for length, ind, tab in zip(self.lengths, self.indent, self.tabs):
+            blank += length == ind
+            long += length > max_line_length
+            if ind < length:
+                max_indent = max(max_indent, ind)
+            tabbed += tab > 0
+            mixed += 0 < tab < ind
+        return {
+            "lines": n,
+            "blank_lines": blank,
+            "max_line_length": max(self.lengths),
+            "avg_line_length": round(sum(self.lengths) / n, 1),
+            "long_lines": long,
+            "max_indent": max_indent,
+            "tab_indented_lines": tabbed,
+            "mixed_indent_lines": mixed,
+            "trailing_whitespace_lines": sum(self.trailing),
+        }
+
+
+def line_metrics(source: SourceText) -> LineMetrics:
+    """Metrics for every line of `source` (vectorized when NumPy is installed)."""
+    if np is not None:
+        return _metrics_numpy(*source.buffer())
+    return _metrics_python(source)
+
+
+def _metrics_numpy(buf, skip: int) -> LineMetrics:
+    """Array pass over UTF-8 bytes; `skip` is the offset of the first line (after a BOM).
+    Extra memory is about one byte per input byte plus a few integers per line."""
+    data = np.frombuffer(buf, dtype=np.uint8)
+    size = data.size
+    newlines = np.flatnonzero(data == _NL)
+    starts = np.concatenate(([skip], newlines + 1))
+    ends = np.concatenate((newlines, [size]))
+    if starts[-1] >= size:  # nothing after the last newline
+        starts, ends = starts[:-1], ends[:-1]
+    if not starts.size:
+        empty = np.zeros(0, dtype=np.int64)
+        return LineMetrics(empty, empty, empty, np.zeros(0, dtype=np.uint8))
+    last = data[np.maximum(ends - 1, 0)]
+    ends = ends - ((ends > starts) & (last == _CR))
+    widths = ends - starts
+    lengths = widths
+    if (data >= 0x80).any():
+        # Characters, not bytes: don't count UTF-8 continuation bytes (0b10xxxxxx)
+        continuation = (data & 0xC0) == 0x80
+        lengths = widths - np.add.reduceat(continuation, starts, dtype=np.int64)
+    # Leading whitespace: advance every line still in its indentation by one byte per step,
+    # so the loop runs once per column of the deepest indent, not once per line
+    indent = np.zeros(starts.size, dtype=np.int64)
+    tabs = np.zeros(starts.size, dtype=np.int64)
+    active = np.flatnonzero(widths > 0)
+    while active.size:
+        c = data[starts[active] + indent[active]]
+        is_tab = c == _TAB
+        blank = is_tab | (c == _SPACE)
+        active = active[blank]
+        tabs[active] += is_tab[blank]
+        indent[active] += 1
+        active = active[indent[active] < widths[active]]
+    last = data[np.maximum(ends - 1, 0)]
+    trailing = ((widths > 0) & ((last == _SPACE) | (last == _TAB))).astype(np.uint8)
+    return LineMetrics(lengths, indent, tabs, trailing)
+
+
+def _metrics_python(source: SourceText) -> LineMetrics:
+    lengths, indent, tabs, trailing = array("q"), array("q"), array("q"), bytearray()
+    for _, line in source.iter_lines():
+        body = line.lstrip(" \t")
+        lengths.append(len(line))
+        indent.append(len(line) - len(body))
+        tabs.append(line.count("\t", 0, len(line) - len(body)))
+        trailing.append(1 if line[-1:] in (" ", "\t") else 0)
+    return LineMetrics(lengths, indent, tabs, trailing)
@@ -3,9 +3,18 @@ Optimization and suggestion engine: rule-based detection plus Gemini for
 short explanations. Merges rule-based results with AI summaries (3-5 bullets).
 """
 
-from typing import List, Dict, Any, Optional
+from functools import partial
+from itertools import chain
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 import ast
-import re
+
+from .context import AnalysisContext
+from .issues import Issue
+from .limits import MIN_AI_SECONDS, Deadline, IssueBudget
+from .rules import RULES, Suppressions
+
+# (GeminiClient method name, args) producing a suggestion's AI summary
+Explain = Tuple[str, Tuple[str, ...]]
 
 # Optional Gemini for summaries (works when run from backend or project root)
 try:
@@ -18,98 +27,160 @@ except ImportError:
 
 
 class OptimizationEngine:
-    """Rule-based optimization detection; uses Gemini only for short explanations."""
+    """Rule-based optimization detection; uses Gemini only for short explanations.
+    Stateless: one instance per language (sharing one GeminiClient) serves every request."""
 
-    def __init__(self, language: str, use_gemini: bool = True):
+    def __init__(self, language: str, gemini: Optional["GeminiClient"] = None):
         self.language = language.lower()
-        self.gemini = GeminiClient() if (use_gemini and GeminiClient) else None
-        self.suggestions: List[Dict[str, Any]] = []
+        self.gemini = gemini
+
+    def analyze(
+        self,
+        ctx: AnalysisContext,
+        static_issues: Sequence[Issue],
+        logic_issues: Sequence[Issue],
+        complexity_issues: Sequence[Issue],
+        budget: Optional[IssueBudget] = None,
+        suppress: Optional[Suppressions] = None,
+        explain: bool = True,
+        found: Sequence[Tuple[Issue, Explain]] = (),
+        deadline: Optional[Deadline] = None,
+    ) -> Tuple[Issue, ...]:
+        """suggest() then, when `explain` and a client are set, explain() on everything it kept."""
+        kept, pending = self.suggest(ctx, static_issues, logic_issues, complexity_issues, budget, suppress, found,
+                                     deadline)
+        if explain:
+            self.explain(kept, pending, deadline)
+        return tuple(kept)
+
+    def suggest(
+        self,
+        ctx: AnalysisContext,
+        static_issues: Sequence[Issue],
+        logic_issues: Sequence[Issue],
+        complexity_issues: Sequence[Issue],
+        budget: Optional[IssueBudget] = None,
+        suppress: Optional[Suppressions] = None,
+        found: Sequence[Tuple[Issue, Explain]] = (),
+        deadline: Optional[Deadline] = None,
+    ) -> Tuple[List[Issue], Dict[int, Explain]]:
+        """Suggestions that survive `budget`'s cap and `suppress`, without AI summaries, and the Gemini
+        request for each (by id()); pass the ones finally reported to explain().
+        `found` adds suggestions made elsewhere (cache_len_suggestions() on parts of the module).
+        Past `deadline`, no more suggestions are built."""
+        pending: Dict[int, Explain] = {}
+        suggestions = self._rules(ctx, static_issues, logic_issues, complexity_issues, pending)
+        if found:
+            pending.update((id(s), request) for s, request in found)
+            suggestions = chain(suggestions, (s for s, _ in found))
+        if suppress is not None:
+            suggestions = suppress.filter(suggestions)
+        if deadline is not None:
+            suggestions = deadline.guard(suggestions)
+        kept = budget.select("optimization", suggestions) if budget is not None else list(suggestions)
+        return kept, pending
+
+    def explain(self, suggestions: Sequence[Issue], pending: Dict[int, Explain],
+                deadline: Optional[Deadline] = None) -> None:
+        """Set ai_summary on `suggestions` from their `pending` requests, in order. Stops once `deadline`
+        leaves too little time for a call; each call is limited to the time left."""
+        if self.gemini is None:
+            return
+        for s in suggestions:
+            request = pending.get(id(s))
+            if request is None:
+                continue
+            if deadline is not None and not deadline.time_for(MIN_AI_SECONDS):
+                break
+            timeout = deadline.remaining() if deadline is not None else None
+            s.ai_summary = getattr(self.gemini, request[0])(*request[1], timeout=timeout)
+
+    def iter_suggestions(self, ctx: AnalysisContext, static: Sequence[Issue], logic: Sequence[Issue],
+                         complexity: Sequence[Issue]) -> Iterator[Issue]:
+        """Rule-based suggestions without AI summaries, in rule order."""
+        return self._rules(ctx, static, logic, complexity, {})
+
+    def cache_len_suggestions(self, ctx: AnalysisContext) -> List[Tuple[Issue, Explain]]:
+        """The Python cache_len rule on its own, with each suggestion's explain request."""
+        pending: Dict[int, Explain] = {}
+        return [(s, pending[id(s)]) for s in self._cache_len(ctx, partial(self._suggest, pending))]
 
-    def analyze(self, source: str, static_issues: List[Dict], logic_issues: List[Dict], complexity_issues: List[Dict]) -> List[Dict[str, Any]]:
-        """Build optimization suggestions from issues; add Gemini summary when available."""
-        self.suggestions = []
+    def _rules(self, ctx: AnalysisContext, static: Sequence[Issue], logic: Sequence[Issue], complexity: Sequence[Issue],
+               pending: Dict[int, Explain]) -> Iterator[Issue]:
         if self.language == "python":
-            self._rules_python(source, static_issues, logic_issues, complexity_issues)
-        else:
-            self._rules_c(source, static_issues, logic_issues, complexity_issues)
-        return self.suggestions
-
-    def _add(self, line: int, opt_type: str, message: str, snippet: str = "", ai_summary: Optional[str] = None):
-        self.suggestions.append({
-            "line": line,
-            "type": opt_type,
-            "message": message,
-            "snippet": snippet or "",
-            "ai_summary": ai_summary,
-            "category": "optimization",
-        })
-
-    def _gemini_explain(self, issue_type: str, context: str, line_ref: str = "") -> Optional[str]:
-        if not self.gemini:
-            return None
-        return self.gemini.explain_issue(issue_type, context, line_ref)
-
-    def _gemini_summarize_opt(self, opt_type: str, code: str) -> Optional[str]:
-        if not self.gemini:
-            return None
-        return self.gemini.summarize_optimization(opt_type, code)
-
-    def _rules_python(self, source: str, static: List, logic: List, complexity: List) -> None:
-        lines = source.splitlines()
-        # Map issues to optimizations and ask Gemini for short explanation
+            return self._rules_python(ctx, static, logic, complexity, pending)
+        return self._rules_c(ctx, static, logic, complexity, pending)
+
+    @staticmethod
+    def _suggest(pending: Dict[int, Explain], line: int, opt_type: str, message: str, snippet: str, explain: Explain) -> Issue:
+        """New suggestion; `explain` is recorded in `pending` and only run if the suggestion is kept."""
+        issue = Issue(line, opt_type, message, snippet or "", "optimization")
+        pending[id(issue)] = explain
+        return issue
+
+    @staticmethod
+    def _enabled_rules(ctx: AnalysisContext) -> set:
+        return {r for r in RULES["optimization"] if ctx.config.enabled(r, "optimization")}
+
+    def _rules_python(self, ctx: AnalysisContext, static: Sequence[Issue], logic: Sequence[Issue],
+                      complexity: Sequence[Issue], pending: Dict[int, Explain]) -> Iterator[Issue]:
+        on = self._enabled_rules(ctx)
+        suggest = partial(self._suggest, pending)
+        # Map issues to optimizations; Gemini explains the ones that are kept
         for iss in static:
-            if iss.get("type") == "unused_variable":
-                ctx = iss.get("message", "") + " " + iss.get("snippet", "")
-                summary = self._gemini_explain("unused variable", ctx, f"Line {iss['line']}")
-                self._add(iss["line"], "remove_unused", "Remove unused variable to reduce clutter.", iss.get("snippet", ""), summary)
-            elif iss.get("type") == "bad_practice":
-                ctx = iss.get("message", "") + " " + iss.get("snippet", "")
-                summary = self._gemini_explain("bad practice", ctx, f"Line {iss['line']}")
-                self._add(iss["line"], "style_fix", iss["message"], iss.get("snippet", ""), summary)
+            if iss.type == "unused_variable" and "remove_unused" in on:
+                context = iss.message + " " + iss.snippet
+                yield suggest(iss.line, "remove_unused", "Remove unused variable to reduce clutter.", iss.snippet,
+                              ("explain_issue", ("unused variable", context, f"Line {iss.line}")))
+            elif iss.type == "bad_practice" and "style_fix" in on:
+                context = iss.message + " " + iss.snippet
+                yield suggest(iss.line, "style_fix", iss.message, iss.snippet,
+                              ("explain_issue", ("bad practice", context, f"Line {iss.line}")))
         for iss in logic:
-            if iss.get("type") == "nested_loop":
-                snippet = iss.get("snippet", "") or _get_line(lines, iss["line"])
-                summary = self._gemini_summarize_opt("nested loop optimization", snippet)
-                self._add(iss["line"], "flatten_loop", "Consider flattening or early exit.", snippet, summary)
-            elif iss.get("type") == "unreachable_code":
-                summary = self._gemini_explain("unreachable code", iss.get("message", ""), f"Line {iss['line']}")
-                self._add(iss["line"], "remove_dead_code", "Remove unreachable code.", iss.get("snippet", ""), summary)
-        for iss in complexity:
-            if iss.get("type") in ("nested_loop", "deep_loop"):
-                snippet = iss.get("snippet", "") or _get_line(lines, iss["line"])
-                summary = self._gemini_summarize_opt("time complexity", snippet)
-                self._add(iss["line"], "complexity", f"Complexity: {iss.get('complexity', '')}. Consider better algorithm.", snippet, summary)
+            if iss.type == "nested_loop" and "flatten_loop" in on:
+                snippet = iss.snippet or ctx.line(iss.line)
+                yield suggest(iss.line, "flatten_loop", "Consider flattening or early exit.", snippet,
+                              ("summarize_optimization", ("nested loop optimization", snippet)))
+            elif iss.type == "unreachable_code" and "remove_dead_code" in on:
+                yield suggest(iss.line, "remove_dead_code", "Remove unreachable code.", iss.snippet,
+                              ("explain_issue", ("unreachable code", iss.message, f"Line {iss.line}")))
+        for iss in complexity if "complexity" in on else ():
+            if iss.type in ("nested_loop", "deep_loop"):
+                snippet = iss.snippet or ctx.line(iss.line)
+                yield suggest(iss.line, "complexity", f"Complexity: {iss.complexity or ''}. Consider better algorithm.", snippet,
+                              ("summarize_optimization", ("time complexity", snippet)))
 
+        if "cache_len" in on:
+            yield from self._cache_len(ctx, suggest)
+
+    @staticmethod
+    def _cache_len(ctx: AnalysisContext, suggest: Callable[..., Issue]) -> Iterator[Issue]:
         # Rule-based: repeated computation in loop (len inside for)
+        if ctx.tree is None:
+            return
         seen_len_lines = set()
-        try:
-            tree = ast.parse(source)
-            for node in ast.walk(tree):
-                if isinstance(node, ast.For):
-                    for n in ast.walk(node):
-                        if isinstance(n, ast.Call) and isinstance(getattr(n.func, "id", None), str):
-                            if n.func.id == "len" and isinstance(n.args[0], ast.Name) and n.lineno not in seen_len_lines:
-                                seen_len_lines.add(n.lineno)
-                                self._add(n.lineno, "cache_len", "Move len() outside loop if iterable size is constant.", _get_line(lines, n.lineno), self._gemini_summarize_opt("cache length in loop", _get_line(lines, n.lineno)))
-                                break
-        except SyntaxError:
-            pass
-
-    def _rules_c(self, source: str, static: List, logic: List, complexity: List) -> None:
-        lines = source.splitlines()
-        for iss in static:
-            if iss.get("type") == "unused_variable":
-                ctx = iss.get("message", "") + " " + iss.get("snippet", "")
-                summary = self._gemini_explain("unused variable in C", ctx, f"Line {iss['line']}")
-                self._add(iss["line"], "remove_unused", "Remove unused variable.", iss.get("snippet", ""), summary)
-        for iss in logic + complexity:
-            if "nested" in iss.get("type", "") or "loop" in iss.get("type", ""):
-                snippet = iss.get("snippet", "") or _get_line(lines, iss["line"])
-                summary = self._gemini_summarize_opt("loop optimization in C", snippet)
-                self._add(iss["line"], "loop_optimization", iss.get("message", "Consider optimizing loop."), snippet, summary)
-
-
-def _get_line(lines: List[str], lineno: int) -> str:
-    if 1 <= lineno <= len(lines):
-        return lines[lineno - 1].strip()
-    return ""
+        for node in ctx.walk(ctx.tree):
+            if isinstance(node, ast.For):
+                for n in ctx.walk(node):
+                    if isinstance(n, ast.Call) and isinstance(getattr(n.func, "id", None), str):
+                        if n.func.id == "len" and isinstance(n.args[0], ast.Name) and n.lineno not in seen_len_lines:
+                            seen_len_lines.add(n.lineno)
+                            snippet = ctx.line(n.lineno)
+                            yield suggest(n.lineno, "cache_len", "Move len() outside loop if iterable size is constant.", snippet,
+                                          ("summarize_optimization", ("cache length in loop", snippet)))
+                            break
+
+    def _rules_c(self, ctx: AnalysisContext, static: Sequence[Issue], logic: Sequence[Issue],
+                 complexity: Sequence[Issue], pending: Dict[int, Explain]) -> Iterator[Issue]:
+        on = self._enabled_rules(ctx)
+        suggest = partial(self._suggest, pending)
+        for iss in static if "remove_unused" in on else ():
+            if iss.type == "unused_variable":
+                context = iss.message + " " + iss.snippet
+                yield suggest(iss.line, "remove_unused", "Remove unused variable.", iss.snippet,
+                              ("explain_issue", ("unused variable in C", context, f"Line {iss.line}")))
+        for iss in (*logic, *complexity) if "loop_optimization" in on else ():
+            if "nested" in iss.type or "loop" in iss.type:
+                snippet = iss.snippet or ctx.line(iss.line)
+                yield suggest(iss.line, "loop_optimization", iss.message or "Consider optimizing loop.", snippet,
+                              ("summarize_optimization", ("loop optimization in C", snippet)))
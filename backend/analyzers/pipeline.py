@@ -0,0 +1,268 @@
+"""
+Per-request analysis pipeline: runs the stages a request selects plus the stages
+they depend on, and only as much Gemini enrichment as the `ai` mode asks for.
+Large Python modules can instead be analyzed as units (see units.py): analyze_unit()
+per unit, then run_analysis(..., units=...) merges them. Every run has a Deadline; stages
+it cuts short keep the issues found so far and the report says `truncated`.
+"""
+
+import os
+from functools import partial
+from itertools import chain
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from .complexity_analyzer import ESTIMATES, ComplexityAnalyzer, recursion_facts
+from .context import AnalysisContext
+from .issues import Issue
+from .limits import MAX_ISSUES_PER_CATEGORY, MIN_AI_SECONDS, Deadline, IssueBudget, top_k
+from .logic_analyzer import LogicAnalyzer
+from .optimization_engine import Explain, GeminiClient, OptimizationEngine
+from .rules import RuleConfig, Suppressions
+from .source import SourceText
+from .static_analyzer import StaticAnalyzer, name_facts
+from .units import CROSS_UNIT_RULES, UnitResult, merge_names, merge_recursion
+
+LANGUAGES = ("python", "c")
+STAGES = ("static", "logic", "complexity", "optimization")  # topological order
+DEPENDS_ON: Dict[str, tuple] = {
+    "static": (),
+    "logic": (),
+    "complexity": (),
+    "optimization": ("static", "logic", "complexity"),
+}
+# Stages each optimization rule reads; disabled rules don't pull their inputs in
+OPTIMIZATION_INPUTS: Dict[str, tuple] = {
+    "remove_unused": ("static",),
+    "style_fix": ("static",),
+    "flatten_loop": ("logic",),
+    "remove_dead_code": ("logic",),
+    "complexity": ("complexity",),
+    "loop_optimization": ("logic", "complexity"),
+    "cache_len": (),
+}
+REPORT_KEYS = {
+    "static": "static_issues",
+    "logic": "logic_issues",
+    "complexity": "complexity_issues",
+    "optimization": "optimizations",
+}
+
+# none: no Gemini calls; summary: short summaries on kept optimizations;
+# full: also explain the overall complexity and the most severe static/logic issues
+AI_MODES = ("none", "summary", "full")
+MAX_AI_EXPLANATIONS = int(os.environ.get("MAX_AI_EXPLANATIONS", "10"))
+
+
+class LanguageAnalyzers(NamedTuple):
+    static: StaticAnalyzer
+    logic: LogicAnalyzer
+    complexity: ComplexityAnalyzer
+    optimization: OptimizationEngine
+
+
+def build_analyzers(gemini: Optional["GeminiClient"] = None) -> Dict[str, LanguageAnalyzers]:
+    """One stateless analyzer set per language; every set shares the same Gemini client."""
+    return {
+        lang: LanguageAnalyzers(StaticAnalyzer(lang), LogicAnalyzer(lang), ComplexityAnalyzer(lang),
+                                OptimizationEngine(lang, gemini))
+        for lang in LANGUAGES
+    }
+
+
+def _default_gemini() -> Optional["GeminiClient"]:
+    return GeminiClient() if (GeminiClient and os.environ.get("GEMINI_API_KEY")) else None
+
+
+ANALYZERS: Dict[str, LanguageAnalyzers] = build_analyzers(_default_gemini())
+
+
+def required_stages(requested: Iterable[str], config: Optional[RuleConfig] = None) -> List[str]:
+    """Requested stages plus their dependencies, in run order. Raises ValueError on unknown names.
+    With a config, optimization only depends on the stages its enabled rules read."""
+    needed = set()
+    pending = [s.strip().lower() for s in requested]
+    while pending:
+        stage = pending.pop()
+        if stage not in DEPENDS_ON:
+            raise ValueError(f"unknown analyzer '{stage}' (expected one of: {', '.join(STAGES)})")
+        if stage not in needed:
+            needed.add(stage)
+            pending.extend(_depends_on(stage, config))
+    return [s for s in STAGES if s in needed]
+
+
+def _depends_on(stage: str, config: Optional[RuleConfig]) -> tuple:
+    if stage != "optimization" or config is None:
+        return DEPENDS_ON[stage]
+    return tuple({dep for rule, deps in OPTIMIZATION_INPUTS.items() if config.enabled(rule, "optimization") for dep in deps})
+
+
+def check_request(language: str, ai: str) -> None:
+    """Raise ValueError for an unknown language or ai mode."""
+    if ai not in AI_MODES:
+        raise ValueError(f"ai must be one of: {', '.join(AI_MODES)}")
+    if language not in ANALYZERS:
+        raise ValueError(f"language must be one of: {', '.join(LANGUAGES)}")
+
+
+def uses_gemini(language: str, ai: str) -> bool:
+    """Whether an analysis of `language` in `ai` mode may call Gemini."""
+    analyzer = ANALYZERS.get(language)
+    return ai != "none" and analyzer is not None and analyzer.optimization.gemini is not None
+
+
+def run_analysis(
+    code: Union[str, SourceText],
+    language: str,
+    analyzers: Optional[Iterable[str]] = None,
+    ai: str = "summary",
+    budget: Optional[IssueBudget] = None,
+    config: Optional[RuleConfig] = None,
+    units: Optional[Sequence[UnitResult]] = None,
+    deadline: Optional[Deadline] = None,
+    stats: bool = False,
+) -> Dict[str, Any]:
+    """Report with one key per requested stage (plus estimated_complexity when complexity is
+    requested) and dropped_issues for those stages. Dependencies run but are not reported.
+    The file's line stats are added when the formatting check runs (it computes the same metrics) or `stats` is set.
+    Rules disabled by `config` or an ignore-file comment are not run; ignore comments drop single lines.
+    `code` may be a SourceText (e.g. a memory-mapped upload): line-based checks then stream over it.
+    With `units` (analyze_unit() on every chunk of split_units(code)), only the merge phase runs here.
+    Once `deadline` (default: ANALYSIS_DEADLINE_SECONDS / ANALYSIS_CPU_SECONDS from now) passes, the running
+    stage stops, later stages and Gemini calls are skipped, and the report has truncated=True
+    (estimated_complexity is then None unless the complexity stage had finished)."""
+    check_request(language, ai)
+    analyzer = ANALYZERS[language]
+    deadline = deadline or Deadline()
+    suppress = Suppressions(code)
+    ctx = AnalysisContext(code, language, (config or RuleConfig()).without(suppress.file_rules), deadline)
+    requested = list(STAGES) if analyzers is None else [s.strip().lower() for s in analyzers]
+    run = required_stages(requested, ctx.config)
+    budget = budget or IssueBudget()
+    gemini = analyzer.optimization.gemini if ai != "none" else None
+
+    results: Dict[str, List[Issue]] = {}
+    estimated_complexity = None
+    found: List[Tuple[Issue, Explain]] = []
+    if units is not None:
+        estimated_complexity = _merge_units(analyzer, ctx, run, units, budget, suppress, results, deadline)
+        found = [f for unit in units for f in unit.cache_len]
+        # The units already ran cache_len; this keeps the optimization stage from parsing the whole module
+        ctx.config = ctx.config.without(("cache_len",))
+    else:
+        if "static" in run and deadline.check():
+            results["static"] = _select_filtered(budget, "static", suppress, deadline, analyzer.static.iter_issues(ctx))
+        if "logic" in run and deadline.check():
+            results["logic"] = _select_filtered(budget, "logic", suppress, deadline, analyzer.logic.iter_issues(ctx))
+        if "complexity" in run and deadline.check():
+            select = partial(_select_filtered, budget, "complexity", suppress, deadline)
+            results["complexity"], estimated_complexity = analyzer.complexity.analyze(ctx, select)
+            if deadline.truncated:  # the estimate only covers the part that was walked
+                estimated_complexity = None
+    pending: Dict[int, Explain] = {}
+    if "optimization" in run and deadline.check():
+        inputs = [results.get(s, ()) for s in ("static", "logic", "complexity")]
+        results["optimization"], pending = analyzer.optimization.suggest(ctx, *inputs, budget, suppress, found, deadline)
+
+    kept = budget.limit_total({s: results.get(s, []) for s in STAGES if s in requested})
+    if gemini is not None and kept.get("optimization"):  # only what the report keeps is summarized
+        analyzer.optimization.explain(kept["optimization"], pending, deadline)
+    report: Dict[str, Any] = {REPORT_KEYS[s]: items for s, items in kept.items()}
+    if "complexity" in requested:
+        report["estimated_complexity"] = estimated_complexity
+    if ai == "full" and gemini is not None:
+        _explain_full(gemini, kept, estimated_complexity, report, deadline)
+    report["dropped_issues"] = {s: n for s, n in budget.summary().items() if s in requested}
+    if stats or ("static" in run and ctx.config.enabled("formatting", "static")):
+        report["stats"] = ctx.line_metrics.stats(ctx.config.max_line_length)
+    report["truncated"] = deadline.truncated
+    return report
+
+
+def analyze_unit(
+    text: str,
+    first_line: int,
+    language: str,
+    config: RuleConfig,
+    stages: Iterable[str],
+    per_category: int = MAX_ISSUES_PER_CATEGORY,
+    deadline: Optional[Deadline] = None,
+) -> Optional[UnitResult]:
+    """Per-unit checks of `stages` and the cross-unit facts for one chunk from split_units().
+    `config` must already include the whole file's ignore-file rules. None when the chunk does not
+    parse on its own; analyze the whole module with run_analysis() then. A unit cut short by
+    `deadline` has truncated=True and no cross-unit facts for the stages it did not finish."""
+    deadline = deadline or Deadline()
+    ctx = AnalysisContext("\n" * (first_line - 1) + text, language, config.without(CROSS_UNIT_RULES), deadline)
+    tree = ctx.tree
+    if tree is None and ctx.syntax_error is None:  # no time left to parse it
+        return UnitResult([], [], [], ESTIMATES[0], [], None, None, {}, True)
+    if tree is None:
+        return None
+    analyzer = ANALYZERS[language]
+    suppress = Suppressions(ctx.source)
+    budget = IssueBudget(per_category)
+    stages = set(stages)
+    static = logic = complexity = ()
+    estimate = ESTIMATES[0]
+    names = recursion = None
+    if "static" in stages and deadline.check():
+        static = _select_filtered(budget, "static", suppress, deadline, analyzer.static.iter_issues(ctx))
+        if config.enabled("unused_variable", "static") and deadline.check():
+            names = name_facts(tree, deadline)
+    if "logic" in stages and deadline.check():
+        logic = _select_filtered(budget, "logic", suppress, deadline, analyzer.logic.iter_issues(ctx))
+    if "complexity" in stages and deadline.check():
+        select = partial(_select_filtered, budget, "complexity", suppress, deadline)
+        complexity, estimate = analyzer.complexity.analyze(ctx, select)
+        if config.enabled("recursion", "complexity") and deadline.check():
+            recursion = recursion_facts(tree, deadline)
+    cache_len = []
+    if "optimization" in stages and config.enabled("cache_len", "optimization") and deadline.check():
+        cache_len = analyzer.optimization.cache_len_suggestions(ctx)
+    return UnitResult(list(static), list(logic), list(complexity), estimate, cache_len, names, recursion, budget.dropped,
+                      deadline.truncated)
+
+
+def _merge_units(analyzer: LanguageAnalyzers, ctx: AnalysisContext, run: List[str], units: Sequence[UnitResult],
+                 budget: IssueBudget, suppress: Suppressions, results: Dict[str, List[Issue]],
+                 deadline: Deadline) -> Optional[str]:
+    """Fill `results` from per-unit results plus the cross-unit checks; returns the complexity estimate."""
+    for unit in units:
+        budget.add_dropped(unit.dropped)
+    if any(u.truncated for u in units):
+        deadline.truncated = True
+    if "static" in run:
+        names = merge_names(u.names for u in units) if deadline.check() else None
+        unused = suppress.filter(analyzer.static.unused_variables(names, ctx)) if names else ()
+        results["static"] = budget.select("static", chain(unused, *(u.static for u in units)))
+    if "logic" in run:
+        results["logic"] = budget.select("logic", chain.from_iterable(u.logic for u in units))
+    if "complexity" not in run:
+        return None
+    recursion = merge_recursion(u.recursion for u in units) if deadline.check() else None
+    calls = list(analyzer.complexity.recursive_calls(recursion, ctx)) if recursion else []
+    results["complexity"] = budget.select("complexity", chain(*(u.complexity for u in units), suppress.filter(calls)))
+    if deadline.truncated:
+        return None
+    return ESTIMATES[-1] if calls else max((u.estimate for u in units), key=ESTIMATES.index)
+
+
+def _select_filtered(budget: IssueBudget, category: str, suppress: Suppressions, deadline: Deadline,
+                     issues: Iterable[Issue]) -> List[Issue]:
+    return budget.select(category, deadline.guard(suppress.filter(issues)))
+
+
+def _explain_full(gemini, kept: Dict[str, List[Issue]], estimated_complexity: Optional[str], report: Dict[str, Any],
+                  deadline: Deadline) -> None:
+    """ai=full extras: a complexity explanation and ai_summary on the most severe static/logic issues,
+    as many as fit before the deadline."""
+    if estimated_complexity is not None and deadline.time_for(MIN_AI_SECONDS):
+        reasons = "; ".join(i.message for i in kept.get("complexity", [])[:5]) or "No loops or recursion found."
+        report["complexity_summary"] = gemini.explain_complexity(estimated_complexity, reasons, timeout=deadline.remaining())
+    explained, _ = top_k((i for s in ("static", "logic") for i in kept.get(s, [])), MAX_AI_EXPLANATIONS)
+    for issue in explained:
+        if not deadline.time_for(MIN_AI_SECONDS):
+            break
+        issue.ai_summary = gemini.explain_issue(issue.type.replace("_", " "), f"{issue.message} {issue.snippet}",
+                                                f"Line {issue.line}", timeout=deadline.remaining())
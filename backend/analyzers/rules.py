@@ -0,0 +1,179 @@
+"""
+Rule configuration and inline suppressions.
+
+Project settings come from `.coderefine.toml` (top level) or the `[tool.coderefine]`
+table of `pyproject.toml`:
+
+    disable = ["formatting", "cache_len", "logic.nested_loop"]
+    max_line_length = 120
+    max_loop_depth = 3
+
+Disabled rules are skipped inside the analyzers, not filtered afterwards.
+In the analysed code, `# coderefine: ignore` (or `// ...` in C) silences a line,
+`ignore[rule, ...]` only the listed rules, and `ignore-file[rule, ...]` disables
+rules for the whole file.
+"""
+
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, Mapping, Optional, Set, Tuple, Union
+
+from .issues import Issue
+from .source import SourceText
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+log = logging.getLogger(__name__)
+
+# Rule ids are issue types; "category.type" narrows one that two categories share
+RULES: Dict[str, Tuple[str, ...]] = {
+    "static": ("syntax_error", "unused_variable", "bad_practice", "formatting"),
+    "logic": ("unreachable_code", "nested_loop", "redundant_computation"),
+    "complexity": ("loop", "nested_loop", "deep_loop", "builtin_loop", "recursion"),
+    "optimization": ("remove_unused", "style_fix", "flatten_loop", "remove_dead_code", "complexity", "cache_len",
+                     "loop_optimization"),
+}
+KNOWN_RULES: FrozenSet[str] = frozenset(
+    [r for rules in RULES.values() for r in rules] + [f"{c}.{r}" for c, rules in RULES.items() for r in rules]
+)
+CONFIG_FILE = ".coderefine.toml"
+
+
+class RuleConfig:
+    """Enabled rules and thresholds for one analysis."""
+
+    KEYS = ("disable", "enable", "max_line_length", "max_loop_depth")
+
+    def __init__(self, disabled: Iterable[str] = (), max_line_length: int = 100, max_loop_depth: int = 3):
+        self.disabled: FrozenSet[str] = frozenset(disabled)
+        self.max_line_length = max_line_length
+        self.max_loop_depth = max_loop_depth
+
+    def enabled(self, rule: str, category: Optional[str] = None) -> bool:
+        if rule in self.disabled:
+            return False
+        return category is None or f"{category}.{rule}" not in self.disabled
+
+    def any_enabled(self, category: str) -> bool:
+        return any(self.enabled(r, category) for r in RULES[category])
+
+    def merged(self, overrides: Optional[Mapping[str, Any]]) -> "RuleConfig":
+        """A copy with `overrides` (same keys as the config file) applied on top.
+        `enable` re-enables rules that this config disables. Raises ValueError on bad input."""
+        if not overrides:
+            return self
+        unknown = set(overrides) - set(self.KEYS)
+        if unknown:
+            raise ValueError(f"unknown rule settings: {', '.join(sorted(unknown))}")
+        disable = _rule_list(overrides.get("disable", ()), "disable")
+        enable = _rule_list(overrides.get("enable", ()), "enable")
+        return RuleConfig(
+            (self.disabled | disable) - enable,
+            _positive_int(overrides.get("max_line_length", self.max_line_length), "max_line_length"),
+            _positive_int(overrides.get("max_loop_depth", self.max_loop_depth), "max_loop_depth"),
+        )
+
+    def without(self, rules: Iterable[str]) -> "RuleConfig":
+        """A copy with `rules` also disabled."""
+        rules = frozenset(rules)
+        if rules <= self.disabled:
+            return self
+        return RuleConfig(self.disabled | rules, self.max_line_length, self.max_loop_depth)
+
+
+def _rule_list(value: Any, key: str) -> FrozenSet[str]:
+    if isinstance(value, str) or not isinstance(value, (list, tuple, set, frozenset)):
+        raise ValueError(f"'{key}' must be a list of rule names")
+    rules = frozenset(str(v).strip() for v in value)
+    unknown = rules - KNOWN_RULES
+    if unknown:
+        raise ValueError(f"unknown rules in '{key}': {', '.join(sorted(unknown))}")
+    return rules
+
+
+def _positive_int(value: Any, key: str) -> int:
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f"'{key}' must be a positive integer")
+    return value
+
+
+# --- Project config file ---
+
+def find_config(start: Optional[Path] = None) -> Optional[Path]:
+    """CODEREFINE_CONFIG if set, else the nearest .coderefine.toml or pyproject.toml
+    with a [tool.coderefine] table, walking up from `start` (default: cwd)."""
+    explicit = os.environ.get("CODEREFINE_CONFIG")
+    if explicit:
+        return Path(explicit)
+    here = (start or Path.cwd()).resolve()
+    for d in (here, *here.parents):
+        if (d / CONFIG_FILE).is_file():
+            return d / CONFIG_FILE
+        pyproject = d / "pyproject.toml"
+        if pyproject.is_file() and "[tool.coderefine" in pyproject.read_text(encoding="utf-8", errors="replace"):
+            return pyproject
+    return None
+
+
+def load_config(path: Optional[Path] = None) -> RuleConfig:
+    """RuleConfig from `path` (or find_config()); defaults when there is no file or no TOML parser."""
+    path = path or find_config()
+    if path is None:
+        return RuleConfig()
+    if tomllib is None:
+        log.warning("Ignoring %s: reading TOML needs Python 3.11+ or tomli", path)
+        return RuleConfig()
+    with open(path, "rb") as fh:
+        data = tomllib.load(fh)
+    if path.name == "pyproject.toml":
+        data = data.get("tool", {}).get("coderefine", {})
+    return RuleConfig().merged(data)
+
+
+# --- Inline suppressions ---
+
+_SUPPRESS_RE = re.compile(r"(?:#|//|/\*)\s*coderefine:\s*(ignore-file|ignore)\b(?:\[([^\]]*)\])?")
+
+
+class Suppressions:
+    """Inline `coderefine: ignore` comments found in one source file."""
+
+    def __init__(self, source: Union[str, SourceText]):
+        self.file_rules: Set[str] = set()
+        self._lines: Dict[int, Optional[Set[str]]] = {}  # line -> rules, None = every rule
+        if "coderefine:" not in source:
+            return
+        chunks = source.iter_chunks() if isinstance(source, SourceText) else [(1, source)]
+        for first, text in chunks:
+            line, pos = first, 0
+            for m in _SUPPRESS_RE.finditer(text):
+                line += text.count("\n", pos, m.start())
+                pos = m.start()
+                self._add(line, m.group(1), {r.strip() for r in m.group(2).split(",") if r.strip()} if m.group(2) else None)
+
+    def _add(self, line: int, kind: str, rules: Optional[Set[str]]) -> None:
+        if kind == "ignore-file":
+            self.file_rules |= (rules & KNOWN_RULES) if rules else {r for r in KNOWN_RULES if "." not in r}
+        elif rules is None or self._lines.get(line, set()) is None:
+            self._lines[line] = None
+        else:
+            self._lines.setdefault(line, set()).update(rules)
+
+    def allows(self, issue: Issue) -> bool:
+        if issue.line not in self._lines:
+            return True
+        rules = self._lines[issue.line]
+        return rules is not None and issue.type not in rules and f"{issue.category}.{issue.type}" not in rules
+
+    def filter(self, issues: Iterable[Issue]) -> Iterator[Issue]:
+        if not self._lines:
+            return iter(issues)
+        return (i for i in issues if self.allows(i))
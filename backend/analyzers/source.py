@@ -0,0 +1,133 @@
+"""
+SourceText: the analysed file as a str or as bytes (a memory-mapped upload), with a
+line-offset index built once. Single lines are sliced out on demand and iter_lines()
+decodes the file a chunk at a time, so line-based checks never hold a list of every
+line; the full str is only decoded when something needs it (the Python parser).
+"""
+
+import codecs
+import mmap
+import os
+from array import array
+from bisect import bisect_right
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+
+CHUNK_BYTES = 1 << 20
+
+
+class SourceText:
+    """One source file. Lines are numbered from 1 and split on "\\n" (a trailing "\\r" is dropped),
+    matching the line numbers the Python parser reports."""
+
+    __slots__ = ("_data", "_text", "_starts")
+
+    def __init__(self, data: Union[str, bytes, mmap.mmap]):
+        self._data = data
+        self._text: Optional[str] = data if isinstance(data, str) else None
+        self._starts = _line_starts(data)
+
+    @classmethod
+    def from_file(cls, fh: BinaryIO, mmap_min_bytes: int = CHUNK_BYTES) -> "SourceText":
+        """The file's contents; files of at least `mmap_min_bytes` are memory-mapped, not read.
+        Call close() when done with a mapped file."""
+        fh.seek(0, os.SEEK_END)
+        size = fh.tell()
+        fh.seek(0)
+        if size < max(1, mmap_min_bytes):
+            return cls(fh.read())
+        return cls(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __contains__(self, needle: str) -> bool:
+        if isinstance(self._data, str):
+            return needle in self._data
+        return self._data.find(needle.encode("utf-8")) != -1
+
+    def __reduce__(self):
+        # mmaps don't pickle: ship the contents (e.g. to an analysis worker process)
+        return (SourceText, (self._data if isinstance(self._data, str) else bytes(self._data),))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._data.encode("utf-8")) if isinstance(self._data, str) else len(self._data)
+
+    @property
+    def text(self) -> str:
+        """The whole file as a str, decoded on first use."""
+        if self._text is None:
+            self._text = self._decode(self._starts[0] if self._starts else 0, len(self._data))
+        return self._text
+
+    def buffer(self) -> Tuple[Union[bytes, mmap.mmap], int]:
+        """The file as UTF-8 bytes (the stored bytes or mapping when there are any, else an
+        encoded copy) and the offset of its first line."""
+        if isinstance(self._data, str):
+            return self._data.encode("utf-8"), 0
+        return self._data, self._starts[0] if self._starts else len(self._data)
+
+    def head(self, chars: int) -> str:
+        if self._text is not None:
+            return self._text[:chars]
+        start = self._starts[0] if self._starts else 0
+        return self._decode(start, min(len(self._data), start + chars * 4))[:chars]
+
+    def line(self, lineno: int) -> str:
+        """Text of a 1-based line without its line break, or "" when out of range."""
+        if not 1 <= lineno <= len(self._starts):
+            return ""
+        end = self._starts[lineno] if lineno < len(self._starts) else len(self._data)
+        return _strip_break(self._decode(self._starts[lineno - 1], end))
+
+    def iter_chunks(self, chunk_bytes: int = CHUNK_BYTES) -> Iterator[Tuple[int, str]]:
+        """(first line number, text) for runs of whole lines of about `chunk_bytes` each."""
+        starts, size = self._starts, len(self._data)
+        i = 0
+        while i < len(starts):
+            if starts[i] + chunk_bytes >= size:
+                j = len(starts)
+            else:
+                j = max(i + 1, bisect_right(starts, starts[i] + chunk_bytes) - 1)
+            end = starts[j] if j < len(starts) else size
+            yield i + 1, self._decode(starts[i], end)
+            i = j
+
+    def iter_lines(self) -> Iterator[Tuple[int, str]]:
+        """(line number, text) for every line, decoded a chunk at a time."""
+        for first, chunk in self.iter_chunks():
+            lines = chunk.split("\n")
+            if chunk.endswith("\n"):
+                lines.pop()
+            for n, line in enumerate(lines, first):
+                yield n, line[:-1] if line.endswith("\r") else line
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+    def _decode(self, start: int, end: int) -> str:
+        if isinstance(self._data, str):
+            return self._data[start:end]
+        return self._data[start:end].decode("utf-8", "replace")
+
+
+def _line_starts(data: Union[str, bytes, mmap.mmap]) -> array:
+    """Offset of each line's first character (bytes for bytes input); a UTF-8 BOM is skipped."""
+    newline = "\n" if isinstance(data, str) else b"\n"
+    start = 3 if not isinstance(data, str) and data[:3] == codecs.BOM_UTF8 else 0
+    starts = array("q")
+    size = len(data)
+    if size > start:
+        starts.append(start)
+    pos = data.find(newline, start)
+    while pos != -1 and pos + 1 < size:
+        starts.append(pos + 1)
+        pos = data.find(newline, pos + 1)
+    return starts
+
+
+def _strip_break(line: str) -> str:
+    if line.endswith("\n"):
+        line = line[:-1]
+    return line[:-1] if line.endswith("\r") else line
@@ -5,111 +5,141 @@ Uses AST for Python; rule-based + optional parser for C.
 
 import ast
 import re
-from typing import List, Dict, Any, Optional
+from collections import Counter
+from typing import Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from .context import AnalysisContext
+from .issues import Issue
+from .limits import Deadline, walk
 
 # C syntax check via parser is optional (pycparser often fails on #include / preprocessor)
 HAS_PYCPARSER = False
 
+_WORD = re.compile(r"\w+")
+_C_DECL = re.compile(r"\b(int|float|double|char|short|long|void)\s*(\*?\s*)(\w+)\s*[;=,]")
+
+
+class NameFacts(NamedTuple):
+    """What the unused-variable check needs from a module (or the merged facts of its parts)."""
+    assigned: Set[str]
+    used: Set[str]
+    stores: List[Tuple[int, str]]  # (line, name) of every assignment target, in walk order
+
 
 class StaticAnalyzer:
-    """Performs static analysis on Python and C code."""
+    """Performs static analysis on Python and C code. Stateless: one instance per language serves every request."""
 
     def __init__(self, language: str):
         self.language = language.lower()
-        self.issues: List[Dict[str, Any]] = []
 
-    def analyze(self, source: str) -> List[Dict[str, Any]]:
-        """Run static analysis. Returns list of issues with line, type, message."""
-        self.issues = []
+    def analyze(self, ctx: AnalysisContext) -> Tuple[Issue, ...]:
+        """Run static analysis. Returns issues with line, type, message."""
+        return tuple(self.iter_issues(ctx))
+
+    def iter_issues(self, ctx: AnalysisContext) -> Iterator[Issue]:
+        """Issues as they are found; feed to IssueBudget.select() to cap them."""
         if self.language == "python":
-            self._analyze_python(source)
-        else:
-            self._analyze_c(source)
-        return self.issues
-
-    def _add(self, line: int, issue_type: str, message: str, snippet: str = ""):
-        self.issues.append({
-            "line": line,
-            "type": issue_type,
-            "message": message,
-            "snippet": snippet or "",
-            "category": "static",
-        })
-
-    def _analyze_python(self, source: str) -> None:
-        """Python: AST-based syntax, unused vars, and style checks."""
-        lines = source.splitlines()
-        # Syntax
-        try:
-            tree = ast.parse(source)
-        except SyntaxError as e:
-            self._add(e.lineno or 1, "syntax_error", str(e.msg), lines[e.lineno - 1].strip() if e.lineno else "")
-            return
-        # Unused variables: collect assignments and deletions, then find uses
-        assigned = set()
-        used = set()
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Name):
-                if isinstance(getattr(node, "ctx", None), ast.Store):
-                    assigned.add(node.id)
-                elif isinstance(getattr(node, "ctx", None), ast.Load):
-                    used.add(node.id)
-            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                for a in node.args.args:
-                    assigned.add(a.arg)
-                for e in node.args.defaults:
-                    for n in ast.walk(e):
-                        if isinstance(n, ast.Name):
-                            used.add(n.id)
-        unused = assigned - used - {"_", "__builtins__"}
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Name) and isinstance(getattr(node, "ctx", None), ast.Store):
-                if node.id in unused:
-                    self._add(node.lineno, "unused_variable", f"Variable '{node.id}' is assigned but never used.", _line(lines, node.lineno))
-        # Bad practices: == None, len(x)==0, etc.
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Compare) and len(node.ops) == 1:
-                if isinstance(node.ops[0], ast.Eq):
-                    if _is_none(node.comparators[0]):
-                        self._add(node.lineno, "bad_practice", "Use 'is None' instead of '== None'.", _line(lines, node.lineno))
-                    if _is_const_zero(node.comparators[0]) and _is_len_call(node.left):
-                        self._add(node.lineno, "bad_practice", "Use 'if not seq:' instead of 'if len(seq)==0'.", _line(lines, node.lineno))
-        # Formatting: line length
-        for i, line in enumerate(lines, 1):
-            if len(line) > 100:
-                self._add(i, "formatting", "Line exceeds 100 characters.", line[:80] + "...")
-
-    def _analyze_c(self, source: str) -> None:
-        """C: syntax (via parser or heuristic), unused vars, formatting."""
-        lines = source.splitlines()
-        if HAS_PYCPARSER:
+            return self._analyze_python(ctx)
+        return self._analyze_c(ctx)
+
+    @staticmethod
+    def _issue(line: int, issue_type: str, message: str, snippet: str = "") -> Issue:
+        return Issue(line, issue_type, message, snippet or "", "static")
+
+    def _analyze_python(self, ctx: AnalysisContext) -> Iterator[Issue]:
+        """Python: style checks from the line metrics first (cheap, and kept if the deadline cuts the
+        rest short), then AST-based syntax, unused vars and bad practices."""
+        enabled = ctx.config.enabled
+        # Formatting: line length, indentation, trailing whitespace
+        if enabled("formatting", "static"):
+            yield from self._formatting(ctx)
+        if any(enabled(r, "static") for r in ("syntax_error", "unused_variable", "bad_practice")):
+            # Syntax
+            tree = ctx.tree
+            if tree is None:
+                e = ctx.syntax_error
+                if e is not None and enabled("syntax_error", "static"):  # None: no time left to parse
+                    yield self._issue(e.lineno or 1, "syntax_error", str(e.msg), ctx.line(e.lineno) if e.lineno else "")
+                return
+            if enabled("unused_variable", "static"):
+                facts = name_facts(tree, ctx.deadline)
+                if facts is not None:
+                    yield from self.unused_variables(facts, ctx)
+            # Bad practices: == None, len(x)==0, etc.
+            if enabled("bad_practice", "static"):
+                for node in ctx.walk(tree):
+                    if isinstance(node, ast.Compare) and len(node.ops) == 1:
+                        if isinstance(node.ops[0], ast.Eq):
+                            if _is_none(node.comparators[0]):
+                                yield self._issue(node.lineno, "bad_practice", "Use 'is None' instead of '== None'.", ctx.line(node.lineno))
+                            if _is_const_zero(node.comparators[0]) and _is_len_call(node.left):
+                                yield self._issue(node.lineno, "bad_practice", "Use 'if not seq:' instead of 'if len(seq)==0'.", ctx.line(node.lineno))
+
+    def unused_variables(self, facts: NameFacts, ctx: AnalysisContext) -> Iterator[Issue]:
+        unused = facts.assigned - facts.used - {"_", "__builtins__"}
+        for lineno, name in facts.stores:
+            if name in unused:
+                yield self._issue(lineno, "unused_variable", f"Variable '{name}' is assigned but never used.", ctx.line(lineno))
+
+    def _formatting(self, ctx: AnalysisContext) -> Iterator[Issue]:
+        """Formatting issues from the line metrics; only flagged lines are decoded."""
+        limit = ctx.config.max_line_length
+        message = f"Line exceeds {limit} characters."
+        for i, too_long, mixed, trailing in ctx.line_metrics.flagged(limit):
+            line = ctx.source_text.line(i)
+            if too_long:
+                yield self._issue(i, "formatting", message, line[:80] + "...")
+            if mixed:
+                yield self._issue(i, "formatting", "Indentation mixes tabs and spaces.", line.strip()[:80])
+            if trailing:
+                yield self._issue(i, "formatting", "Trailing whitespace.", line.strip()[:80])
+
+    def _analyze_c(self, ctx: AnalysisContext) -> Iterator[Issue]:
+        """C: syntax (via parser or heuristic), unused vars, formatting. Line checks stream over the source."""
+        enabled = ctx.config.enabled
+        if HAS_PYCPARSER and enabled("syntax_error", "static"):
             try:
                 parser = c_parser.CParser()
-                parser.parse(source)
+                parser.parse(ctx.source)
             except Exception as e:
-                self._add(1, "syntax_error", f"C parse error: {str(e)[:80]}", "")
-        # Unused variables: simple regex for declarations and usage
-        decl_pattern = re.compile(r"\b(int|float|double|char|short|long|void)\s*(\*?\s*)(\w+)\s*[;=,]")
-        for i, line in enumerate(lines, 1):
-            for m in decl_pattern.finditer(line):
+                yield self._issue(1, "syntax_error", f"C parse error: {str(e)[:80]}", "")
+        if enabled("unused_variable", "static"):
+            yield from self._unused_c(ctx)
+        # Formatting
+        if enabled("formatting", "static"):
+            yield from self._formatting(ctx)
+
+    def _unused_c(self, ctx: AnalysisContext) -> Iterator[Issue]:
+        # Unused variables: a declared name that appears nowhere outside its declaration line.
+        # One pass counts every identifier, a second finds declarations; no copies of the file.
+        words: Counter = Counter()
+        for _, chunk in ctx.source_text.iter_chunks():
+            words.update(_WORD.findall(chunk))
+        for i, line in ctx.iter_lines():
+            for m in _C_DECL.finditer(line):
                 var = m.group(3)
                 if var in ("return", "if", "for", "while", "switch"):
                     continue
-                # Count occurrences of var as identifier (not in declaration)
-                rest = source.replace(line, " ", 1)  # exclude declaration line once
-                use_count = len(re.findall(r"\b" + re.escape(var) + r"\b", rest))
+                use_count = words[var] - _WORD.findall(line).count(var)
                 if use_count <= 1:  # only declaration
-                    self._add(i, "unused_variable", f"Variable '{var}' may be unused.", line.strip())
-        # Formatting
-        for i, line in enumerate(lines, 1):
-            if len(line) > 100:
-                self._add(i, "formatting", "Line exceeds 100 characters.", line[:80] + "...")
-
-
-def _line(lines: List[str], lineno: int) -> str:
-    if 1 <= lineno <= len(lines):
-        return lines[lineno - 1].strip()
-    return ""
+                    yield self._issue(i, "unused_variable", f"Variable '{var}' may be unused.", line.strip())
+
+
+def name_facts(tree: ast.AST, deadline: Optional[Deadline] = None) -> Optional[NameFacts]:
+    """Assigned and loaded plain names in one walk; function parameters count as assigned.
+    None when `deadline` runs out first: partial facts would report used names as unused."""
+    facts = NameFacts(set(), set(), [])
+    for node in walk(tree, deadline):
+        if isinstance(node, ast.Name):
+            if isinstance(getattr(node, "ctx", None), ast.Store):
+                facts.assigned.add(node.id)
+                facts.stores.append((node.lineno, node.id))
+            elif isinstance(getattr(node, "ctx", None), ast.Load):
+                facts.used.add(node.id)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            for a in node.args.args:
+                facts.assigned.add(a.arg)
+    return None if deadline is not None and deadline.truncated else facts
 
 
 def _is_none(node: ast.AST) -> bool:
@@ -0,0 +1,75 @@
+"""
+Splitting a large Python module into units that can be analyzed independently (and in
+parallel). A unit is a run of whole top-level statements, cut before a top-level def or
+class. Per-unit checks run on one unit at a time; unused variables and recursion need the
+whole module, so units report facts for them instead and the merge phase checks those.
+"""
+
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .complexity_analyzer import RecursionFacts
+from .issues import Issue
+from .optimization_engine import Explain
+from .static_analyzer import NameFacts
+
+# Rules that need the whole module: units skip them and report facts instead
+CROSS_UNIT_RULES = ("unused_variable", "recursion")
+
+_UNIT_START = re.compile(r"(?:async\s+def|def|class)\b|@")
+
+
+class UnitResult(NamedTuple):
+    """Per-unit issues (suppressed lines removed, each category capped) and cross-unit facts."""
+    static: List[Issue]
+    logic: List[Issue]
+    complexity: List[Issue]
+    estimate: str
+    cache_len: List[Tuple[Issue, Explain]]
+    names: Optional[NameFacts]  # None when unused_variable is not run
+    recursion: Optional[RecursionFacts]  # None when recursion is not run
+    dropped: Dict[str, Counter]
+    truncated: bool = False  # the deadline cut the unit short
+
+
+def split_units(source: str, max_lines: int) -> List[Tuple[int, str]]:
+    """(first line, text) chunks of at least `max_lines` lines (except the last) covering the source.
+    Cuts only before a top-level def, class or decorator that does not follow a decorator. A cut
+    inside a string or bracket leaves the previous chunk unparsable, which analyze_unit() detects."""
+    lines = source.split("\n")
+    units: List[Tuple[int, str]] = []
+    start, prev = 0, ""
+    for i, line in enumerate(lines):
+        if i - start >= max_lines and _UNIT_START.match(line) and not prev.startswith("@"):
+            units.append((start + 1, "\n".join(lines[start:i]) + "\n"))
+            start = i
+        if line.strip() and not line.lstrip().startswith("#"):
+            prev = line
+    units.append((start + 1, "\n".join(lines[start:])))
+    return units
+
+
+def merge_names(facts: Iterable[Optional[NameFacts]]) -> Optional[NameFacts]:
+    merged = None
+    for f in facts:
+        if f is None:
+            continue
+        if merged is None:
+            merged = NameFacts(set(), set(), [])
+        merged.assigned.update(f.assigned)
+        merged.used.update(f.used)
+        merged.stores.extend(f.stores)
+    return merged
+
+
+def merge_recursion(facts: Iterable[Optional[RecursionFacts]]) -> Optional[RecursionFacts]:
+    merged = None
+    for f in facts:
+        if f is None:
+            continue
+        if merged is None:
+            merged = RecursionFacts(set(), [])
+        merged.recursive.update(f.recursive)
+        merged.calls.extend(f.calls)
+    return merged
@@ -5,32 +5,39 @@ NOT used for: code generation, full analysis, or long explanations.
 """
 
 import os
+import threading
 from typing import Optional
 
 # Lazy import to avoid failure if key not set
 _gemini_model = None
+_model_lock = threading.Lock()
+# Per call, and never more than the caller's remaining deadline
+TIMEOUT_SECONDS = float(os.environ.get("GEMINI_TIMEOUT_SECONDS", "8"))
 
 
 def _get_model():
-    """Lazy-load Gemini model."""
+    """Lazy-load Gemini model (once per process; safe to call from several threads)."""
     global _gemini_model
-    if _gemini_model is None:
-        try:
-            import google.generativeai as genai
-            api_key = os.environ.get("GEMINI_API_KEY", "")
-            if not api_key:
+    if _gemini_model is not None:
+        return _gemini_model
+    with _model_lock:
+        if _gemini_model is None:
+            try:
+                import google.generativeai as genai
+                api_key = os.environ.get("GEMINI_API_KEY", "")
+                if not api_key:
+                    return None
+                genai.configure(api_key=api_key)
+                _gemini_model = genai.GenerativeModel("gemini-1.5-flash")
+            except Exception:
                 return None
-            genai.configure(api_key=api_key)
-            _gemini_model = genai.GenerativeModel("gemini-1.5-flash")
-        except Exception:
-            return None
     return _gemini_model
 
 
-def get_concise_explanation(prompt: str, max_bullets: int = 5) -> Optional[str]:
+def get_concise_explanation(prompt: str, max_bullets: int = 5, timeout: Optional[float] = None) -> Optional[str]:
     """
-    Call Gemini for a short, bullet-point response only.
-    Returns None if API key missing or on error (caller can use fallback).
+    Call Gemini for a short, bullet-point response only, waiting at most `timeout`
+    (and TIMEOUT_SECONDS) seconds. Returns None if API key missing or on error (caller can use fallback).
     """
     model = _get_model()
     if not model:
@@ -42,6 +49,7 @@ def get_concise_explanation(prompt: str, max_bullets: int = 5) -> Optional[str]:
                 "max_output_tokens": 150,
                 "temperature": 0.3,
             },
+            request_options={"timeout": TIMEOUT_SECONDS if timeout is None else min(TIMEOUT_SECONDS, timeout)},
         )
         if response and response.text:
             text = response.text.strip()
@@ -54,24 +62,25 @@ def get_concise_explanation(prompt: str, max_bullets: int = 5) -> Optional[str]:
 
 
 class GeminiClient:
-    """Client for Gemini summarization only. All responses are short bullet lists."""
+    """Client for Gemini summarization only. All responses are short bullet lists.
+    Holds no per-call state, so one instance is shared by all analyzers and threads."""
 
     def __init__(self):
         from .prompt_templates import PromptTemplates
         self.templates = PromptTemplates()
 
-    def explain_issue(self, issue_type: str, context: str, line_ref: str = "") -> Optional[str]:
+    def explain_issue(self, issue_type: str, context: str, line_ref: str = "", timeout: Optional[float] = None) -> Optional[str]:
         prompt = self.templates.explain_issue(issue_type, context, line_ref)
-        return get_concise_explanation(prompt)
+        return get_concise_explanation(prompt, timeout=timeout)
 
-    def summarize_optimization(self, optimization_type: str, code_snippet: str) -> Optional[str]:
+    def summarize_optimization(self, optimization_type: str, code_snippet: str, timeout: Optional[float] = None) -> Optional[str]:
         prompt = self.templates.summarize_optimization(optimization_type, code_snippet)
-        return get_concise_explanation(prompt)
+        return get_concise_explanation(prompt, timeout=timeout)
 
-    def suggest_improvement(self, suggestion_type: str, context: str) -> Optional[str]:
+    def suggest_improvement(self, suggestion_type: str, context: str, timeout: Optional[float] = None) -> Optional[str]:
         prompt = self.templates.suggest_improvement(suggestion_type, context)
-        return get_concise_explanation(prompt)
+        return get_concise_explanation(prompt, timeout=timeout)
 
-    def explain_complexity(self, complexity: str, reason: str) -> Optional[str]:
+    def explain_complexity(self, complexity: str, reason: str, timeout: Optional[float] = None) -> Optional[str]:
         prompt = self.templates.explain_complexity(complexity, reason)
-        return get_concise_explanation(prompt)
+        return get_concise_explanation(prompt, timeout=timeout)
@@ -0,0 +1,211 @@
+"""
+Append-only JSONL history log, the fallback store when SQLite is unavailable.
+Each report is one line; an in-memory id → (offset, length) index turns a
+lookup into a single seek. Appends and compaction hold an exclusive lock on a
+sidecar lock file, so several uvicorn workers can share one log. Each worker
+picks up the others' appends by indexing whatever was added since its last
+look, and reloads the index when a compaction replaces the file.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import serialization
+from storage import DATA_DIR
+
+LOG_PATH = DATA_DIR / "history.jsonl"
+LEGACY_JSON = DATA_DIR / "history.json"
+
+MAX_ENTRIES = int(os.environ.get("HISTORY_LOG_MAX_ENTRIES", "1000"))
+COMPACT_EVERY = 200  # appends between compaction checks
+
+
+class HistoryLog:
+    def __init__(self, path: Path = LOG_PATH, max_entries: int = MAX_ENTRIES):
+        self.path = Path(path)
+        self.lock_path = self.path.with_suffix(self.path.suffix + ".lock")
+        self.max_entries = max_entries
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._indexed_to = 0
+        self._ino: Optional[int] = None
+        self._appends = 0
+        self._mutex = threading.Lock()
+
+    # --- locking ---
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[None]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, "a+b") as fh:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+                else:
+                    fh.seek(0)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+    # --- index ---
+
+    def _refresh(self) -> None:
+        """Index lines appended since the last call; start over if the file was replaced."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._index, self._indexed_to, self._ino = {}, 0, None
+            return
+        if st.st_ino != self._ino or st.st_size < self._indexed_to:
+            self._index, self._indexed_to, self._ino = {}, 0, st.st_ino
+        if st.st_size == self._indexed_to:
+            return
+        with open(self.path, "rb") as fh:
+            fh.seek(self._indexed_to)
+            offset = self._indexed_to
+            for line in fh:
+                if not line.endswith(b"\n"):
+                    break  # torn write from a crashed process; the next append starts a fresh line
+                try:
+                    rid = serialization.loads(line)["id"]
+                except (ValueError, KeyError, TypeError):
+                    rid = None
+                if rid is not None:
+                    self._index[rid] = (offset, len(line))
+                offset += len(line)
+            self._indexed_to = offset
+
+    def _read_at(self, fh, offset: int, length: int) -> Dict:
+        fh.seek(offset)
+        return serialization.loads(fh.read(length))
+
+    # --- public API ---
+
+    def append(self, entries: Sequence[Dict]) -> None:
+        """Append entries (dicts with an "id") as one locked write."""
+        if not entries:
+            return
+        with self._mutex, self._locked(exclusive=True):
+            self._append_locked(entries)
+
+    def _append_locked(self, entries: Sequence[Dict]) -> None:
+        data = b"".join(serialization.dumps(e) + b"\n" for e in entries)
+        with open(self.path, "a+b") as fh:
+            fh.seek(0, os.SEEK_END)
+            if fh.tell() > 0:
+                fh.seek(-1, os.SEEK_END)
+                if fh.read(1) != b"\n":
+                    data = b"\n" + data
+            fh.seek(0, os.SEEK_END)
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+        self._refresh()
+        self._appends += len(entries)
+        if self._appends >= COMPACT_EVERY:
+            self._appends = 0
+            self._compact_locked()
+
+    def get(self, report_id: str) -> Optional[Dict]:
+        with self._mutex, self._locked(exclusive=False):
+            self._refresh()
+            pos = self._index.get(report_id)
+            if pos is None:
+                return None
+            with open(self.path, "rb") as fh:
+                return self._read_at(fh, *pos)
+
+    def recent(self, limit: int) -> List[Dict]:
+        """Newest `limit` entries, newest first."""
+        with self._mutex, self._locked(exclusive=False):
+            self._refresh()
+            positions = sorted(self._index.values(), reverse=True)[:max(0, limit)]
+            if not positions:
+                return []
+            with open(self.path, "rb") as fh:
+                return [self._read_at(fh, *pos) for pos in positions]
+
+    def page(self, limit: int, before: Optional[Tuple[str, str]] = None) -> List[Dict]:
+        """Up to `limit` entries older than the (created_at, id) cursor `before`, newest first."""
+        with self._mutex, self._locked(exclusive=False):
+            self._refresh()
+            positions = sorted(self._index.values(), reverse=True)
+            out: List[Dict] = []
+            if not positions:
+                return out
+            with open(self.path, "rb") as fh:
+                for pos in positions:
+                    if len(out) >= limit:
+                        break
+                    entry = self._read_at(fh, *pos)
+                    if before is None or (entry.get("created_at", ""), entry["id"]) < before:
+                        out.append(entry)
+            return out
+
+    def iter_all(self) -> Iterator[Dict]:
+        """Every live entry, oldest first (streams the file; duplicates resolved by the index)."""
+        with self._mutex, self._locked(exclusive=False):
+            self._refresh()
+            positions = sorted(self._index.values())
+            if not positions:
+                return
+            # Opened under the lock: a later compaction replaces the path, not this file
+            fh = open(self.path, "rb")
+        with fh:
+            for pos in positions:
+                yield self._read_at(fh, *pos)
+
+    def compact(self) -> None:
+        with self._mutex, self._locked(exclusive=True):
+            self._compact_locked()
+
+    def _compact_locked(self) -> None:
+        """Rewrite the log with only the newest max_entries live ids (tmp file + rename)."""
+        self._refresh()
+        positions = sorted(self._index.values())
+        if len(positions) <= self.max_entries and self._indexed_to == sum(n for _, n in positions):
+            return
+        keep = positions[-self.max_entries:] if self.max_entries > 0 else positions
+        tmp = self.path.with_suffix(".tmp")
+        with open(self.path, "rb") as src, open(tmp, "wb") as dst:
+            for offset, length in keep:
+                src.seek(offset)
+                dst.write(src.read(length))
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp, self.path)
+        self._ino = None
+        self._refresh()
+
+    def import_legacy(self, legacy: Path = LEGACY_JSON) -> int:
+        """One-time move of the old whole-file history.json into the log."""
+        if not legacy.exists():
+            return 0
+        with self._mutex, self._locked(exclusive=True):
+            if not legacy.exists():  # another worker got there first
+                return 0
+            try:
+                data = json.loads(legacy.read_text(encoding="utf-8"))
+            except ValueError:
+                data = []
+            entries = [e for e in data if isinstance(e, dict) and e.get("id")]
+            if entries:
+                self._append_locked(entries)
+            legacy.rename(legacy.with_suffix(".json.imported"))
+            return len(entries)
+
+
+history_log = HistoryLog()
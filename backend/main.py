@@ -12,22 +12,39 @@ if _env_file.exists():
         load_dotenv(_env_file)
     except ImportError:
         pass
-import json
-import sqlite3
+import base64
+import hashlib
+import hmac
+import logging
 import uuid
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, File, Form, Header, HTTPException, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
-from analyzers.static_analyzer import StaticAnalyzer
-from analyzers.logic_analyzer import LogicAnalyzer
-from analyzers.complexity_analyzer import ComplexityAnalyzer
-from analyzers.optimization_engine import OptimizationEngine
+import admission
+import analysis_pool
+from analyzers.pipeline import uses_gemini
+from analyzers.rules import RuleConfig, load_config
+from analyzers.source import SourceText
+import history_export
+from history_log import history_log
+import maintenance
+import serialization
+import storage
+
+# Optional brotli response compression (pip install brotli-asgi); gzip otherwise
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
 
 # Optional Gemini (set GEMINI_API_KEY in env)
 try:
@@ -35,6 +52,8 @@ try:
 except ImportError:
     GeminiClient = None
 
+log = logging.getLogger(__name__)
+
 app = FastAPI(
     title="CodeRefine",
     description="AI-powered code review and optimization for C and Python",
@@ -47,157 +66,309 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
+# Compress JSON bodies over 1 KB (history pages, reports); brotli falls back to gzip for older clients
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=1024, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+MAX_PAGE_SIZE = 100
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(32 * 1024 * 1024)))
+UPLOAD_LANGUAGES = {".py": "python", ".c": "c", ".h": "c"}
+REPORT_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
 # --- Paths ---
 BACKEND_DIR = Path(__file__).resolve().parent
 PROJECT_DIR = BACKEND_DIR.parent
 FRONTEND_DIR = PROJECT_DIR / "frontend"
-DATA_DIR = PROJECT_DIR / "database"
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-DB_PATH = DATA_DIR / "history.db"
-HISTORY_JSON = DATA_DIR / "history.json"
-
-
-def get_db():
-    """Create or connect to SQLite DB for history."""
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS history (
-            id TEXT PRIMARY KEY,
-            language TEXT NOT NULL,
-            code_preview TEXT,
-            created_at TEXT NOT NULL,
-            report TEXT
-        )
-    """)
-    conn.commit()
-    return conn
+DATA_DIR = storage.DATA_DIR
+DB_PATH = storage.DB_PATH
+
+
+def _append_history_log(rows) -> None:
+    """Fallback store used when the SQLite write fails."""
+    history_log.append([
+        {"id": rid, "language": lang, "code_preview": preview, "created_at": created_at, "report": report}
+        for rid, lang, preview, created_at, report in rows
+    ])
+
+
+storage.writer.fallback = _append_history_log
+history_log.import_legacy()
+
+# Rule settings from .coderefine.toml / [tool.coderefine] (CODEREFINE_CONFIG or nearest to the cwd)
+try:
+    PROJECT_RULES = load_config()
+except (OSError, ValueError) as e:
+    log.warning("Ignoring rule config: %s", e)
+    PROJECT_RULES = RuleConfig()
+
+
+@app.on_event("startup")
+def _start_analysis_workers():
+    # Spawn the pool now so the first large upload doesn't pay for worker start-up
+    analysis_pool.pool.warm()
+
+
+@app.on_event("shutdown")
+def _flush_history():
+    storage.writer.shutdown()
+    storage.pool.close()
+    analysis_pool.pool.shutdown()
+
+
+@app.exception_handler(admission.Rejected)
+async def _rejected(request: Request, exc: admission.Rejected):
+    return JSONResponse({"detail": str(exc)}, status_code=exc.status_code,
+                        headers={"Retry-After": str(exc.retry_after)})
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse that skips jsonable_encoder and encodes with serialization.dumps (orjson when available)."""
+
+    def render(self, content) -> bytes:
+        return serialization.dumps(content)
 
 
 class AnalyzeRequest(BaseModel):
     code: str
     language: str  # "python" | "c"
+    analyzers: Optional[List[str]] = None  # subset of static, logic, complexity, optimization; default all
+    ai: str = "summary"  # none | summary | full
+    rules: Optional[Dict[str, Any]] = None  # same keys as .coderefine.toml, applied over the project config
+    stats: bool = False  # line stats even when the formatting check doesn't run
 
 
 class AnalyzeResponse(BaseModel):
-    static_issues: list
-    logic_issues: list
-    complexity_issues: list
-    estimated_complexity: str
-    optimizations: list
+    """Only the requested analyzers' keys are present."""
+    static_issues: Optional[list] = None
+    logic_issues: Optional[list] = None
+    complexity_issues: Optional[list] = None
+    estimated_complexity: Optional[str] = None
+    complexity_summary: Optional[str] = None  # ai=full
+    optimizations: Optional[list] = None
+    dropped_issues: Dict[str, Dict[str, int]] = {}  # category -> issue type -> count left out by the caps
+    stats: Optional[Dict[str, Any]] = None  # per-file line metrics: lines, blank_lines, max_line_length, max_indent, ...
+    truncated: bool = False  # the time budget ran out; the report has what was finished
     report_id: Optional[str] = None
 
 
-@app.post("/api/analyze", response_model=AnalyzeResponse)
-def analyze(request: AnalyzeRequest):
-    """Run full analysis: static, logic, complexity, optimization. Gemini adds short summaries only."""
-    lang = request.language.strip().lower()
+@app.post("/api/analyze", response_model=AnalyzeResponse, response_class=FastJSONResponse)
+async def analyze(request: AnalyzeRequest):
+    """Run the selected analyzers (default: static, logic, complexity, optimization) and whatever they depend on.
+    ai=none skips Gemini, summary (default) adds short optimization summaries, full also explains complexity and top issues.
+    Inputs over ANALYSIS_INLINE_MAX_BYTES run in a worker process. Analyses that run out of time return what they
+    finished with truncated=true. When too many analyses are in progress the request gets 429 or 503 with Retry-After."""
+    code = request.code or ""
+    async with _admission_lane(request.language, request.ai, len(code)).slot():
+        return await run_in_threadpool(_analyze, code, request.language, request.analyzers, request.ai, request.rules,
+                                       code[:201], request.stats)
+
+
+@app.post("/api/analyze/upload", response_model=AnalyzeResponse, response_class=FastJSONResponse)
+async def analyze_upload(
+    file: UploadFile = File(...),
+    language: Optional[str] = Form(None),
+    analyzers: Optional[str] = Form(None),
+    ai: str = Form("summary"),
+    stats: bool = Form(False),
+):
+    """Analyze an uploaded source file (multipart). Large files are memory-mapped from the upload's spool
+    file instead of being read into a string; line-based checks stream over them.
+    language defaults from the file extension; analyzers is comma-separated."""
+    lang = language or UPLOAD_LANGUAGES.get(Path(file.filename or "").suffix.lower(), "")
+    fh = file.file
+    fh.seek(0, os.SEEK_END)
+    size = fh.tell()
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"file is larger than {MAX_UPLOAD_BYTES} bytes")
+    selected = [a for a in analyzers.split(",") if a.strip()] if analyzers else None
+    async with _admission_lane(lang, ai, size).slot():
+        return await run_in_threadpool(_analyze_file, fh, lang, selected, ai, stats)
+
+
+def _admission_lane(language: str, ai: str, size: int) -> admission.Lane:
+    """Inline-sized requests that won't call Gemini take the fast lane (size may be in characters)."""
+    cheap = size <= analysis_pool.pool.inline_max_bytes and not uses_gemini(language.strip().lower(), ai.strip().lower())
+    return admission.gate.lane(cheap)
+
+
+def _analyze_file(fh, language: str, analyzers: Optional[List[str]], ai: str, stats: bool) -> FastJSONResponse:
+    source = SourceText.from_file(fh)
+    try:
+        return _analyze(source, language, analyzers, ai, None, source.head(201), stats)
+    finally:
+        source.close()
+
+
+def _analyze(code, language: str, analyzers: Optional[List[str]], ai: str, rules: Optional[Dict[str, Any]],
+             head: str, stats: bool = False) -> FastJSONResponse:
+    """Shared by both analyze endpoints; `code` is a str or SourceText, `head` its first 201 characters."""
+    lang = language.strip().lower()
     if lang not in ("python", "c"):
         raise HTTPException(status_code=400, detail="language must be 'python' or 'c'")
-    code = request.code or ""
 
-    static_analyzer = StaticAnalyzer(lang)
-    logic_analyzer = LogicAnalyzer(lang)
-    complexity_analyzer = ComplexityAnalyzer(lang)
-    opt_engine = OptimizationEngine(lang, use_gemini=bool(os.environ.get("GEMINI_API_KEY")))
-
-    static_issues = static_analyzer.analyze(code)
-    logic_issues = logic_analyzer.analyze(code)
-    complexity_issues, estimated_complexity = complexity_analyzer.analyze(code)
-    optimizations = opt_engine.analyze(code, static_issues, logic_issues, complexity_issues)
-
-    report = {
-        "static_issues": static_issues,
-        "logic_issues": logic_issues,
-        "complexity_issues": complexity_issues,
-        "estimated_complexity": estimated_complexity,
-        "optimizations": optimizations,
-    }
+    try:
+        config = PROJECT_RULES.merged(rules)
+        report = analysis_pool.pool.run(code, lang, analyzers, ai.strip().lower(), config=config, stats=stats)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (analysis_pool.AnalysisTimeout, analysis_pool.AnalysisOutOfMemory) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except analysis_pool.AnalysisUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
     report_id = str(uuid.uuid4())
+    preview = (head[:200] + "...") if len(head) > 200 else head
+    # Persisted by the background writer (batched commits); readable by id immediately
+    storage.writer.submit((report_id, lang, preview, datetime.utcnow().isoformat(), report))
+
+    # Issue objects go straight to the encoder; AnalyzeResponse only documents the shape
+    return FastJSONResponse({**report, "report_id": report_id})
+
+
+def _encode_cursor(created_at: str, report_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at}|{report_id}".encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
     try:
-        conn = get_db()
-        preview = (code[:200] + "...") if len(code) > 200 else code
-        conn.cursor().execute(
-            "INSERT INTO history (id, language, code_preview, created_at, report) VALUES (?, ?, ?, ?, ?)",
-            (report_id, lang, preview, datetime.utcnow().isoformat(), json.dumps(report)),
-        )
-        conn.commit()
-        conn.close()
-    except Exception:
-        # Fallback to JSON file if SQLite fails
-        try:
-            data = []
-            if HISTORY_JSON.exists():
-                data = json.loads(HISTORY_JSON.read_text(encoding="utf-8"))
-            data.append({
-                "id": report_id,
-                "language": lang,
-                "code_preview": (code[:200] + "...") if len(code) > 200 else code,
-                "created_at": datetime.utcnow().isoformat(),
-                "report": report,
-            })
-            HISTORY_JSON.write_text(json.dumps(data[-100:], indent=2), encoding="utf-8")
-        except Exception:
-            report_id = None
-
-    return AnalyzeResponse(
-        static_issues=static_issues,
-        logic_issues=logic_issues,
-        complexity_issues=complexity_issues,
-        estimated_complexity=estimated_complexity,
-        optimizations=optimizations,
-        report_id=report_id,
-    )
+        created_at, report_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split("|", 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created_at, report_id
 
 
 @app.get("/api/history")
-def history(limit: int = 20):
-    """Return recent analysis history (from SQLite or JSON)."""
+def history(response: Response, limit: int = 20, cursor: Optional[str] = None):
+    """Return one page of analysis history, newest first (from SQLite or the fallback log).
+    limit is capped at MAX_PAGE_SIZE; pass the X-Next-Cursor response header back as `cursor` for the next page."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    before = _decode_cursor(cursor) if cursor else None
     try:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT id, language, code_preview, created_at FROM history ORDER BY created_at DESC LIMIT ?",
-            (limit,),
-        )
-        rows = cur.fetchall()
-        conn.close()
-        return [dict(r) for r in rows]
+        storage.writer.flush()
+        with storage.connection() as conn:
+            if before:
+                rows = conn.execute(
+                    """SELECT id, language, code_preview, created_at FROM history
+                       WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?""",
+                    (*before, limit + 1),
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT id, language, code_preview, created_at FROM history ORDER BY created_at DESC, id DESC LIMIT ?",
+                    (limit + 1,),
+                ).fetchall()
+        page = [dict(r) for r in rows]
     except Exception:
-        if HISTORY_JSON.exists():
-            data = json.loads(HISTORY_JSON.read_text(encoding="utf-8"))
-            return [{"id": r["id"], "language": r["language"], "code_preview": r.get("code_preview", ""), "created_at": r["created_at"]} for r in data[-limit:]]
-        return []
+        page = [
+            {"id": r["id"], "language": r["language"], "code_preview": r.get("code_preview", ""), "created_at": r["created_at"]}
+            for r in history_log.page(limit + 1, before)
+        ]
+    if len(page) > limit:
+        page = page[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(page[-1]["created_at"], page[-1]["id"])
+    return page
 
 
-@app.get("/api/history/{report_id}")
-def get_report(report_id: str):
-    """Fetch one report by id."""
+@app.get("/api/history/export")
+def export_history(
+    format: str = "ndjson",
+    gzip: bool = False,
+    language: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+):
+    """Stream every matching history row as NDJSON or CSV (optionally gzip'd). since/until: ISO timestamps."""
+    fmt = format.strip().lower()
+    if fmt not in history_export.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    rows = None
+    storage.writer.flush()
+    if not DB_PATH.exists():
+        rows = (
+            (r["id"], r["language"], r["created_at"], r.get("code_preview", ""), serialization.dumps_str(r.get("report", {})))
+            for r in history_log.iter_all()
+            if (not language or r["language"] == language)
+            and (not since or r["created_at"] >= since)
+            and (not until or r["created_at"] < until)
+        )
+    stream = history_export.export_stream(
+        DB_PATH, fmt, compress=gzip, rows=rows, language=language, since=since, until=until,
+    )
+    filename = f"coderefine_history.{fmt}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        stream,
+        media_type="application/gzip" if gzip else history_export.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def _load_report_json(report_id: str) -> Optional[str]:
+    """Report as JSON text: queued write, SQLite, fallback log, then archive."""
+    pending = storage.writer.get_pending(report_id)
+    if pending:
+        return serialization.dumps_str(pending[4])
     try:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute("SELECT report FROM history WHERE id = ?", (report_id,))
-        row = cur.fetchone()
-        conn.close()
+        with storage.connection() as conn:
+            row = conn.execute("SELECT report FROM history WHERE id = ?", (report_id,)).fetchone()
         if row:
-            return json.loads(row["report"])
+            return row["report"]
     except Exception:
         pass
-    if HISTORY_JSON.exists():
-        data = json.loads(HISTORY_JSON.read_text(encoding="utf-8"))
-        for r in data:
-            if r.get("id") == report_id:
-                return r.get("report", {})
-    raise HTTPException(status_code=404, detail="Report not found")
+    for found in (history_log.get(report_id), maintenance.read_archived(report_id)):
+        if found:
+            return serialization.dumps_str(found.get("report", {}))
+    return None
+
+
+@app.get("/api/history/{report_id}")
+def get_report(report_id: str, if_none_match: Optional[str] = Header(default=None)):
+    """Fetch one report by id. Reports never change once written, so the response carries
+    a strong ETag and is cacheable forever; a matching If-None-Match gets 304."""
+    body = _load_report_json(report_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    etag = '"' + hashlib.blake2b(body.encode("utf-8"), digest_size=16).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": REPORT_CACHE_CONTROL}
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.post("/api/maintenance")
+def run_maintenance(
+    target: str = "api",
+    dry_run: bool = False,
+    x_maintenance_token: Optional[str] = Header(default=None),
+):
+    """Archive expired history and vacuum. target: api | streamlit | all.
+    Disabled (404) unless MAINTENANCE_TOKEN is set; callers send it as X-Maintenance-Token."""
+    token = os.environ.get("MAINTENANCE_TOKEN")
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest((x_maintenance_token or "").encode("utf-8"), token.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Invalid maintenance token")
+    if target not in ("api", "streamlit", "all"):
+        raise HTTPException(status_code=400, detail="target must be 'api', 'streamlit' or 'all'")
+    result = {}
+    if target in ("api", "all"):
+        storage.writer.flush()
+        result["api"] = maintenance.run_maintenance(dry_run=dry_run)
+    if target in ("streamlit", "all"):
+        try:
+            result["streamlit"] = maintenance.run_streamlit_maintenance(dry_run=dry_run)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Streamlit maintenance failed: {e}")
+    return result
 
 
 @app.get("/health")
 def health():
-    """API health check."""
-    return {"app": "CodeRefine", "docs": "/docs", "health": "ok"}
+    """API health check, with the admission lanes' in-flight and queued requests and rejection counts."""
+    return {"app": "CodeRefine", "docs": "/docs", "health": "ok", "admission": admission.gate.stats()}
 
 
 # Serve frontend at root: "/" → index.html, "/style.css", "/script.js" from frontend/
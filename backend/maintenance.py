@@ -0,0 +1,196 @@
+"""
+Retention job for the API's history.db: archive old reports to gzip'd JSONL
+segments, delete them, then reclaim space with incremental vacuum. The
+archive_index table maps each archived id to its segment for read_archived().
+
+Run on a schedule from the backend folder:
+    python maintenance.py                       # HISTORY_RETENTION_DAYS / HISTORY_MAX_ROWS from env
+    python maintenance.py --retention-days 90 --max-rows 10000
+or trigger it through POST /api/maintenance.
+"""
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from storage import DATA_DIR, DB_PATH, migrate
+
+ARCHIVE_DIR = DATA_DIR / "archive"
+STREAMLIT_DIR = DATA_DIR.parent / "streamlit_app"
+
+# 0 disables a limit
+RETENTION_DAYS = int(os.environ.get("HISTORY_RETENTION_DAYS", "365"))
+MAX_ROWS = int(os.environ.get("HISTORY_MAX_ROWS", "0"))
+VACUUM_PAGES = int(os.environ.get("HISTORY_VACUUM_PAGES", "2000"))
+BATCH_SIZE = 500
+
+
+def _candidates(conn: sqlite3.Connection, retention_days: int, max_rows: int, limit: int) -> List[sqlite3.Row]:
+    """Oldest-first rows past the age limit or beyond the newest `max_rows`."""
+    parts, params = [], []
+    if retention_days > 0:
+        parts.append("SELECT id FROM history WHERE created_at < ?")
+        params.append((datetime.utcnow() - timedelta(days=retention_days)).isoformat())
+    if max_rows > 0:
+        parts.append("SELECT id FROM (SELECT id FROM history ORDER BY created_at DESC LIMIT -1 OFFSET ?)")
+        params.append(max_rows)
+    if not parts:
+        return []
+    sql = f"""SELECT id, language, code_preview, created_at, report FROM history
+              WHERE id IN ({' UNION '.join(parts)}) ORDER BY created_at LIMIT ?"""
+    return conn.execute(sql, params + [limit]).fetchall()
+
+
+def _write_segment(archive_dir: Path, rows: List[Dict]) -> Path:
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    stamp = lambda s: s[:19].replace(":", "").replace("-", "")
+    path = archive_dir / f"api-history-{stamp(rows[0]['created_at'])}-{stamp(rows[-1]['created_at'])}-{rows[-1]['id'][:8]}.jsonl.gz"
+    tmp = path.with_suffix(".tmp")
+    with gzip.open(tmp, "wt", encoding="utf-8") as fh:
+        for row in rows:
+            fh.write(json.dumps(row, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+    return path
+
+
+def archive_history(
+    db_path: Path = DB_PATH,
+    retention_days: int = RETENTION_DAYS,
+    max_rows: int = MAX_ROWS,
+    archive_dir: Path = ARCHIVE_DIR,
+    dry_run: bool = False,
+) -> Dict[str, int]:
+    """Write each batch to a segment before deleting it, so rows are never lost."""
+    archived = segments = 0
+    if not Path(db_path).exists():
+        return {"archived": 0, "segments": 0}
+    migrate(Path(db_path))
+    conn = sqlite3.connect(str(db_path), timeout=5)
+    conn.row_factory = sqlite3.Row
+    try:
+        if dry_run:
+            return {"archived": len(_candidates(conn, retention_days, max_rows, -1)), "segments": 0}
+        index_segments(conn, archive_dir)
+        while True:
+            rows = _candidates(conn, retention_days, max_rows, BATCH_SIZE)
+            if not rows:
+                break
+            records = []
+            for r in rows:
+                rec = dict(r)
+                try:
+                    rec["report"] = json.loads(rec["report"]) if rec["report"] else {}
+                except ValueError:
+                    pass
+                records.append(rec)
+            seg = _write_segment(archive_dir, records)
+            with conn:
+                conn.executemany("DELETE FROM history WHERE id = ?", [(r["id"],) for r in rows])
+                conn.executemany("INSERT OR REPLACE INTO archive_index (id, segment) VALUES (?, ?)",
+                                 [(r["id"], seg.name) for r in rows])
+            archived += len(rows)
+            segments += 1
+    finally:
+        conn.close()
+    return {"archived": archived, "segments": segments}
+
+
+def index_segments(conn: sqlite3.Connection, archive_dir: Path = ARCHIVE_DIR) -> int:
+    """Add segments missing from archive_index (written before it existed, or by a run that
+    crashed before its delete committed). Returns segments indexed."""
+    if not archive_dir.exists():
+        return 0
+    known = {r[0] for r in conn.execute("SELECT DISTINCT segment FROM archive_index")}
+    added = 0
+    for seg in sorted(archive_dir.glob("api-history-*.jsonl.gz")):  # oldest first: newer copies win
+        if seg.name in known:
+            continue
+        with gzip.open(seg, "rt", encoding="utf-8") as fh:
+            ids = [(json.loads(line).get("id"), seg.name) for line in fh if line.strip()]
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO archive_index (id, segment) VALUES (?, ?)",
+                             [i for i in ids if i[0]])
+        added += 1
+    return added
+
+
+def read_archived(report_id: str, archive_dir: Path = ARCHIVE_DIR, db_path: Path = DB_PATH) -> Optional[Dict]:
+    """Look a report up in the archive; only the segment archive_index names is read."""
+    if not Path(db_path).exists() or not archive_dir.exists():
+        return None
+    migrate(Path(db_path))
+    conn = sqlite3.connect(str(db_path), timeout=5)
+    try:
+        row = conn.execute("SELECT segment FROM archive_index WHERE id = ?", (report_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None or not (archive_dir / row[0]).exists():
+        return None
+    with gzip.open(archive_dir / row[0], "rt", encoding="utf-8") as fh:
+        for line in fh:
+            if report_id in line:
+                found = json.loads(line)
+                if found.get("id") == report_id:
+                    return found
+    return None
+
+
+def incremental_vacuum(db_path: Path = DB_PATH, pages: int = VACUUM_PAGES) -> Dict[str, int]:
+    """Release up to `pages` free pages; the first run converts the file to auto_vacuum=INCREMENTAL."""
+    if not Path(db_path).exists():
+        return {"pages_freed": 0}
+    conn = sqlite3.connect(str(db_path), timeout=5, isolation_level=None)
+    try:
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        else:
+            conn.execute(f"PRAGMA incremental_vacuum({int(pages)})")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+    return {"pages_freed": max(0, before - after)}
+
+
+def run_maintenance(
+    retention_days: int = RETENTION_DAYS,
+    max_rows: int = MAX_ROWS,
+    vacuum_pages: int = VACUUM_PAGES,
+    dry_run: bool = False,
+) -> Dict[str, int]:
+    summary = archive_history(retention_days=retention_days, max_rows=max_rows, dry_run=dry_run)
+    if not dry_run:
+        summary.update(incremental_vacuum(pages=vacuum_pages))
+    return summary
+
+
+def run_streamlit_maintenance(dry_run: bool = False, timeout: int = 600) -> Dict:
+    """Run the Streamlit app's job (utils.maintenance) in its own process and return its summary."""
+    cmd = [sys.executable, "-m", "utils.maintenance"] + (["--dry-run"] if dry_run else [])
+    proc = subprocess.run(cmd, cwd=str(STREAMLIT_DIR), capture_output=True, text=True, timeout=timeout)
+    if proc.returncode != 0:
+        err = (proc.stderr or proc.stdout).strip()
+        raise RuntimeError(err.splitlines()[-1] if err else "Streamlit maintenance failed")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="CodeRefine API history maintenance")
+    ap.add_argument("--retention-days", type=int, default=RETENTION_DAYS)
+    ap.add_argument("--max-rows", type=int, default=MAX_ROWS)
+    ap.add_argument("--vacuum-pages", type=int, default=VACUUM_PAGES)
+    ap.add_argument("--dry-run", action="store_true", help="only count rows that would be archived")
+    args = ap.parse_args(argv)
+    print(json.dumps(run_maintenance(args.retention_days, args.max_rows, args.vacuum_pages, args.dry_run)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+SQLite access for the API's history.db: a small connection pool (WAL,
+busy timeout), versioned migrations applied once per process, and a
+background writer that batches history inserts off the request path.
+"""
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import serialization
+
+log = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parent
+DATA_DIR = BACKEND_DIR.parent / "database"
+DATA_DIR.mkdir(parents=True, exist_ok=True)
+DB_PATH = DATA_DIR / "history.db"
+
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "4"))
+BUSY_TIMEOUT_MS = 5000
+BATCH_SIZE = 64
+BATCH_WAIT_S = 0.05
+RETRIES = 3
+
+# (id, language, code_preview, created_at, report dict)
+HistoryRow = Tuple[str, str, str, str, Dict]
+
+INSERT_SQL = "INSERT OR REPLACE INTO history (id, language, code_preview, created_at, report) VALUES (?, ?, ?, ?, ?)"
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(str(path), timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+# --- Migrations (PRAGMA user_version) ---
+
+def _m001_history(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS history (
+            id TEXT PRIMARY KEY,
+            language TEXT NOT NULL,
+            code_preview TEXT,
+            created_at TEXT NOT NULL,
+            report TEXT
+        )
+    """)
+
+
+def _m002_created_index(conn: sqlite3.Connection) -> None:
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_created ON history(created_at DESC)")
+
+
+def _m003_keyset_index(conn: sqlite3.Connection) -> None:
+    """(created_at, id) so cursor pages are a single index range scan with a stable tiebreak."""
+    conn.execute("DROP INDEX IF EXISTS idx_history_created")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_created_id ON history(created_at DESC, id DESC)")
+
+
+def _m004_archive_index(conn: sqlite3.Connection) -> None:
+    """Which archive segment holds each archived report, so a lookup opens one segment."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archive_index (
+            id TEXT PRIMARY KEY,
+            segment TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_archive_segment ON archive_index(segment)")
+
+
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _m001_history,
+    _m002_created_index,
+    _m003_keyset_index,
+    _m004_archive_index,
+]
+
+_migrate_lock = threading.Lock()
+_migrated: set = set()
+
+
+def migrate(path: Path = DB_PATH) -> None:
+    """Apply pending migrations, each in its own BEGIN IMMEDIATE transaction. Once per process."""
+    with _migrate_lock:
+        if path in _migrated:
+            return
+        conn = _connect(path)
+        conn.isolation_level = None
+        try:
+            for version, step in enumerate(MIGRATIONS, 1):
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                    continue
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if conn.execute("PRAGMA user_version").fetchone()[0] < version:
+                        step(conn)
+                        conn.execute(f"PRAGMA user_version = {version}")
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+        finally:
+            conn.close()
+        _migrated.add(path)
+
+
+# --- Connection pool ---
+
+class ConnectionPool:
+    """Fixed-size pool; connections are created lazily and reused across requests."""
+
+    def __init__(self, path: Path = DB_PATH, size: int = POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        migrate(self.path)
+        conn = self._acquire()
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return _connect(self.path)
+        return self._idle.get()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+pool = ConnectionPool()
+connection = pool.connection
+
+
+# --- Background writer ---
+
+_STOP = object()
+
+
+class HistoryWriter:
+    """Single thread that group-commits queued history rows.
+    Rows stay visible through get_pending() until committed, so a report can be
+    fetched by id straight after /api/analyze returns. Rows that cannot be
+    written are handed to `fallback` (the JSONL history log)."""
+
+    def __init__(self, fallback: Optional[Callable[[Sequence[HistoryRow]], None]] = None):
+        self.fallback = fallback
+        self._queue: "queue.Queue" = queue.Queue()
+        self._pending: Dict[str, HistoryRow] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, row: HistoryRow) -> None:
+        with self._lock:
+            self._pending[row[0]] = row
+            self._start()
+        self._queue.put(row)
+
+    def get_pending(self, report_id: str) -> Optional[HistoryRow]:
+        with self._lock:
+            return self._pending.get(report_id)
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                return
+            self._start()  # a dead writer would leave join() waiting forever
+        self._queue.join()
+
+    def _start(self) -> None:
+        """Start the writer thread if there is none or it died. Call with _lock held."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            batch, stop = [item], False
+            deadline = time.monotonic() + BATCH_WAIT_S
+            while len(batch) < BATCH_SIZE:
+                try:
+                    nxt = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if nxt is _STOP:
+                    stop = True
+                    break
+                batch.append(nxt)
+            try:
+                self._write(batch)
+            except Exception:
+                log.exception("History batch write failed")
+            finally:
+                with self._lock:
+                    for row in batch:
+                        self._pending.pop(row[0], None)
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, batch: Sequence[HistoryRow]) -> None:
+        params, batch = _serialized(batch)
+        if not params:
+            return
+        for attempt in range(RETRIES):
+            try:
+                with connection() as conn, conn:
+                    conn.executemany(INSERT_SQL, params)
+                return
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or attempt == RETRIES - 1:
+                    log.warning("History batch write failed: %s", e)
+                    break
+                time.sleep(0.1 * (attempt + 1))
+            except sqlite3.Error as e:
+                log.warning("History batch write failed: %s", e)
+                break
+        if self.fallback is not None:
+            try:
+                self.fallback(batch)
+            except Exception:
+                log.exception("Dropping %d history rows", len(batch))
+
+
+def _serialized(batch: Sequence[HistoryRow]) -> Tuple[List[tuple], List[HistoryRow]]:
+    """INSERT_SQL parameters and the rows they came from; rows whose report won't encode are logged and dropped."""
+    params, rows = [], []
+    for row in batch:
+        rid, lang, preview, created, report = row
+        try:
+            params.append((rid, lang, preview, created, serialization.dumps_str(report)))
+        except Exception:
+            log.exception("Dropping history row %s: report could not be encoded", rid)
+            continue
+        rows.append(row)
+    return params, rows
+
+
+writer = HistoryWriter()
+atexit.register(writer.shutdown)
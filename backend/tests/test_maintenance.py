@@ -0,0 +1,55 @@
+import gzip
+import json
+import sqlite3
+
+import maintenance
+import storage
+
+
+def _history_db(path, ids):
+    storage.migrate(path)
+    conn = sqlite3.connect(str(path))
+    with conn:
+        conn.executemany(
+            "INSERT INTO history (id, language, code_preview, created_at, report) VALUES (?, 'python', '', ?, ?)",
+            [(i, f"2020-01-01T00:00:{n:02d}", json.dumps({"n": n})) for n, i in enumerate(ids)],
+        )
+    conn.close()
+
+
+def _opened(monkeypatch):
+    """Record the name of every segment maintenance opens."""
+    opened = []
+    real_open = gzip.open
+
+    def spy(path, *args, **kwargs):
+        opened.append(path.name)
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(maintenance.gzip, "open", spy)
+    return opened
+
+
+def test_read_archived_opens_only_the_segment_holding_the_id(tmp_path, monkeypatch):
+    db_path, archive = tmp_path / "history.db", tmp_path / "archive"
+    monkeypatch.setattr(maintenance, "BATCH_SIZE", 2)
+    _history_db(db_path, ["a1", "b2", "c3", "d4"])
+    assert maintenance.archive_history(db_path, retention_days=1, archive_dir=archive) == {"archived": 4, "segments": 2}
+
+    opened = _opened(monkeypatch)
+    assert maintenance.read_archived("c3", archive, db_path)["report"] == {"n": 2}
+    assert len(opened) == 1
+    assert maintenance.read_archived("missing", archive, db_path) is None
+    assert len(opened) == 1
+
+
+def test_segments_written_before_the_index_are_indexed(tmp_path, monkeypatch):
+    db_path, archive = tmp_path / "history.db", tmp_path / "archive"
+    _history_db(db_path, [])
+    seg = maintenance._write_segment(archive, [{"id": "old", "created_at": "2019-01-01T00:00:00", "report": {}}])
+    assert maintenance.read_archived("old", archive, db_path) is None
+
+    maintenance.archive_history(db_path, retention_days=1, archive_dir=archive)
+    opened = _opened(monkeypatch)
+    assert maintenance.read_archived("old", archive, db_path)["id"] == "old"
+    assert opened == [seg.name]
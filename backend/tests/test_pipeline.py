@@ -0,0 +1,40 @@
+import time
+
+from analyzers.complexity_analyzer import loop_chains
+from analyzers.context import AnalysisContext
+from analyzers.limits import Deadline
+from analyzers.pipeline import run_analysis
+from analyzers.static_analyzer import name_facts
+
+DEEP = "x = " + "-" * 20000 + "1\n"
+LARGE = "".join(f"def f{i}(a):\n    x{i} = a  \n    for j in range(a):\n        for k in range(j):\n            y = j\n"
+                f"    return f{i}(a - 1)\n" for i in range(3000))
+
+
+def test_parser_stack_overflow_is_a_syntax_issue():
+    assert AnalysisContext(DEEP, "python").syntax_error.msg == "too deeply nested to analyze"
+    report = run_analysis(DEEP, "python", ["static"], ai="none")
+    assert ("syntax_error", "too deeply nested to analyze") in [(i.type, i.message) for i in report["static_issues"]]
+
+
+def test_short_deadline_returns_the_cheap_results_in_time():
+    start = time.monotonic()
+    report = run_analysis(LARGE, "python", ai="none", deadline=Deadline(0.05, 0))
+    assert time.monotonic() - start < 0.5
+    assert report["truncated"]
+    assert report["static_issues"] and {i.type for i in report["static_issues"]} == {"formatting"}
+
+
+def test_walks_stop_at_the_deadline():
+    tree = AnalysisContext(LARGE, "python").tree
+    expired = Deadline(0.001, 0)
+    time.sleep(0.01)
+    assert name_facts(tree, expired) is None
+    assert loop_chains(tree, expired) is None
+    assert expired.truncated
+
+
+def test_stats_only_come_with_formatting_or_on_request():
+    assert "stats" in run_analysis(LARGE, "python", ["static"], ai="none")
+    assert "stats" not in run_analysis(LARGE, "python", ["logic"], ai="none")
+    assert run_analysis(LARGE, "python", ["logic"], ai="none", stats=True)["stats"]["lines"] == 18000
@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+import storage
+
+
+def _flush_returns(writer: storage.HistoryWriter, timeout: float = 5.0) -> bool:
+    done = threading.Thread(target=writer.flush, daemon=True)
+    done.start()
+    done.join(timeout)
+    return not done.is_alive()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    pool = storage.ConnectionPool(tmp_path / "history.db")
+    monkeypatch.setattr(storage, "connection", pool.connection)
+    yield pool
+    pool.close()
+
+
+def _count(pool) -> int:
+    with pool.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+
+def test_unserializable_report_does_not_stop_the_writer(db):
+    writer = storage.HistoryWriter()
+    writer.submit(("bad", "python", "", "2024-01-01T00:00:00", {"x": object()}))
+    writer.submit(("good", "python", "", "2024-01-01T00:00:01", {"x": 1}))
+    assert _flush_returns(writer)
+    assert writer.get_pending("bad") is None
+    writer.submit(("later", "python", "", "2024-01-01T00:00:02", {"x": 2}))
+    assert _flush_returns(writer)
+    assert _count(db) == 2
+    writer.shutdown()
+
+
+def test_write_errors_do_not_stop_the_writer(db, monkeypatch):
+    writer = storage.HistoryWriter()
+    monkeypatch.setattr(writer, "_write", lambda batch: 1 / 0)
+    writer.submit(("a", "python", "", "2024-01-01T00:00:00", {}))
+    assert _flush_returns(writer)
+    monkeypatch.delattr(writer, "_write")
+    writer.submit(("b", "python", "", "2024-01-01T00:00:01", {}))
+    assert _flush_returns(writer)
+    assert _count(db) == 1
+    writer.shutdown()
+
+
+def test_flush_restarts_a_dead_writer(db):
+    writer = storage.HistoryWriter()
+    writer._thread = threading.Thread(target=lambda: None)  # a writer thread that has died
+    writer._thread.start()
+    writer._thread.join()
+    writer._queue.put(("a", "python", "", "2024-01-01T00:00:00", {}))
+    assert _flush_returns(writer)
+    assert _count(db) == 1
+    writer.shutdown()
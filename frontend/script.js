@@ -38,13 +38,15 @@
     });
   });
 
-  function renderIssues(list, items, category) {
+  function renderIssues(list, items, category, dropped) {
     list.innerHTML = "";
-    if (!items || items.length === 0) {
+    const hidden = dropped || {};
+    const hiddenTotal = Object.keys(hidden).reduce(function (n, k) { return n + hidden[k]; }, 0);
+    if ((!items || items.length === 0) && hiddenTotal === 0) {
       list.innerHTML = "<li class='empty'>No issues found.</li>";
       return;
     }
-    items.forEach(function (item) {
+    (items || []).forEach(function (item) {
       const li = document.createElement("li");
       li.className = category;
       let html = "<span class='line'>Line " + (item.line || "?") + "</span>";
@@ -55,6 +57,13 @@
       li.innerHTML = html;
       list.appendChild(li);
     });
+    if (hiddenTotal > 0) {
+      const li = document.createElement("li");
+      li.className = "empty";
+      li.textContent = hiddenTotal + " more not shown (" +
+        Object.keys(hidden).map(function (k) { return k + ": " + hidden[k]; }).join(", ") + ")";
+      list.appendChild(li);
+    }
   }
 
   function escapeHtml(s) {
@@ -81,10 +90,11 @@
       .then(function (data) {
         resultsSection.hidden = false;
         complexityBar.innerHTML = "Estimated time complexity: <strong>" + escapeHtml(data.estimated_complexity || "—") + "</strong>";
-        renderIssues(listStatic, data.static_issues, "static");
-        renderIssues(listLogic, data.logic_issues, "logic");
-        renderIssues(listComplexity, data.complexity_issues, "complexity");
-        renderIssues(listOptimizations, data.optimizations, "optimization");
+        const dropped = data.dropped_issues || {};
+        renderIssues(listStatic, data.static_issues, "static", dropped.static);
+        renderIssues(listLogic, data.logic_issues, "logic", dropped.logic);
+        renderIssues(listComplexity, data.complexity_issues, "complexity", dropped.complexity);
+        renderIssues(listOptimizations, data.optimizations, "optimization", dropped.optimization);
       })
       .catch(function (err) {
         complexityBar.textContent = "Error: " + err.message + ". Is the backend running?";
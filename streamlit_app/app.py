@@ -130,13 +130,13 @@ def main():
 
     # Stats row
     try:
-        from utils.db import get_type_counts, get_history
+        from utils.db import get_user_stats
         user_id = st.session_state.get("user_id")
         if user_id:
-            counts = get_type_counts(user_id)
-            total = sum(counts.values())
-            scored = [h["score"] for h in get_history(user_id, limit=200) if h.get("score") is not None]
-            avg_score = sum(scored) // len(scored) if scored else 0
+            stats = get_user_stats(user_id)
+            counts = stats["counts"]
+            total = stats["total"]
+            avg_score = stats["avg_score"]
 
             c1, c2, c3, c4 = st.columns(4)
             with c1:
@@ -24,5 +24,18 @@ DB_PATH = DATABASE_DIR / "coderefine.db"
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY", "")
 GROQ_MODEL = os.environ.get("GROQ_MODEL", "llama-3.1-8b-instant")
 
+# History retention (utils/maintenance.py); 0 disables a limit
+HISTORY_RETENTION_DAYS = int(os.environ.get("HISTORY_RETENTION_DAYS", "365"))
+HISTORY_MAX_PER_USER = int(os.environ.get("HISTORY_MAX_PER_USER", "0"))
+ARCHIVE_DIR = DATABASE_DIR / "archive"
+VACUUM_PAGES = int(os.environ.get("HISTORY_VACUUM_PAGES", "2000"))
+
+# History exports are served from disk by Streamlit's static file handler (.streamlit/config.toml)
+EXPORT_DIR = BASE_DIR / "static" / "exports"
+EXPORT_TTL_SECONDS = int(os.environ.get("HISTORY_EXPORT_TTL_SECONDS", "3600"))
+
+# Static analysis: most severe issues kept per run (modules/analyzer.py)
+MAX_STATIC_ISSUES = int(os.environ.get("MAX_STATIC_ISSUES", "200"))
+
 # Session
 SESSION_COOKIE_NAME = "coderefine_session"
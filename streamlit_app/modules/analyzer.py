@@ -4,16 +4,19 @@ Estimates overall code complexity (not just loop complexity).
 """
 import ast
 import re
-from typing import List, Dict, Any, Tuple
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import MAX_STATIC_ISSUES
+from modules.issues import Issue, top_k
 
 
 def detect_language(source: str) -> str:
     """Auto-detect whether code is C or Python. Returns 'c' or 'python'."""
-    lines = source.strip().splitlines()
     c_score = 0
     py_score = 0
 
-    for line in lines:
+    for _, line in _iter_lines(source):
         stripped = line.strip()
         # Strong C indicators
         if re.match(r'^#include\s*[<"]', stripped):
@@ -52,28 +55,57 @@ def detect_language(source: str) -> str:
     return "python" if py_score > c_score else "c"
 
 
-def analyze_static(language: str, source: str) -> List[Dict[str, Any]]:
-    """Static issues: syntax, unused vars, bad practices."""
+def analyze_static(language: str, source: str, limit: int = MAX_STATIC_ISSUES,
+                   dropped: Optional[Dict[str, int]] = None) -> List[Issue]:
+    """Static issues: syntax, unused vars, bad practices.
+    Keeps the `limit` most severe; pass a dict as `dropped` to get per-type counts of the rest."""
     lang = language.lower()
-    issues = []
-    if lang == "python":
-        return _static_python(source, issues)
-    return _static_c(source, issues)
+    found = _static_python(source) if lang == "python" else _static_c(source)
+    issues, left_out = top_k(found, limit)
+    if dropped is not None:
+        dropped.update(left_out)
+    return issues
+
+
+def _iter_lines(source: str) -> Iterator[Tuple[int, str]]:
+    """(line number, line) pairs, sliced one at a time instead of splitting the whole source into a list."""
+    start, n, size = 0, 1, len(source)
+    while start < size:
+        end = source.find("\n", start)
+        if end == -1:
+            end = size
+        line = source[start:end]
+        yield n, line[:-1] if line.endswith("\r") else line
+        start, n = end + 1, n + 1
+
 
+class _LineIndex:
+    """Start offset of every line, so snippets are sliced out of the source only when needed."""
 
-def _line(lines: List[str], lineno: int) -> str:
-    if 1 <= lineno <= len(lines):
-        return lines[lineno - 1].strip()
-    return ""
+    __slots__ = ("source", "starts")
 
+    def __init__(self, source: str):
+        self.source = source
+        self.starts = array("q", [0])
+        pos = source.find("\n")
+        while pos != -1:
+            self.starts.append(pos + 1)
+            pos = source.find("\n", pos + 1)
 
-def _static_python(source: str, issues: List) -> List:
-    lines = source.splitlines()
+    def line(self, lineno: int) -> str:
+        """Stripped text of a 1-based line, or "" when out of range."""
+        if not 1 <= lineno <= len(self.starts):
+            return ""
+        end = self.starts[lineno] - 1 if lineno < len(self.starts) else len(self.source)
+        return self.source[self.starts[lineno - 1]:end].strip()
+
+
+def _static_python(source: str) -> Iterator[Issue]:
     try:
         tree = ast.parse(source)
     except SyntaxError as e:
-        issues.append({"line": e.lineno or 1, "type": "syntax_error", "message": str(e.msg), "category": "static"})
-        return issues
+        yield Issue(e.lineno or 1, "syntax_error", str(e.msg))
+        return
     assigned, used = set(), set()
     for node in ast.walk(tree):
         if isinstance(node, ast.Name):
@@ -86,22 +118,23 @@ def _static_python(source: str, issues: List) -> List:
             for a in node.args.args:
                 assigned.add(a.arg)
     unused = assigned - used - {"_"}
+    lines = _LineIndex(source)
     for node in ast.walk(tree):
         if isinstance(node, ast.Name) and type(getattr(node, "ctx", None)) == ast.Store and node.id in unused:
-            issues.append({"line": node.lineno, "type": "unused_variable", "message": f"Unused: {node.id}", "category": "static", "snippet": _line(lines, node.lineno)})
-    for i, line in enumerate(lines, 1):
+            yield Issue(node.lineno, "unused_variable", f"Unused: {node.id}", lines.line(node.lineno))
+    for i, line in _iter_lines(source):
         if len(line) > 100:
-            issues.append({"line": i, "type": "formatting", "message": "Line > 100 chars", "category": "static"})
-    return issues
+            yield Issue(i, "formatting", "Line > 100 chars")
 
 
-def _static_c(source: str, issues: List) -> List:
-    lines = source.splitlines()
+def _static_c(source: str) -> Iterator[Issue]:
     brace_depth = 0
     paren_depth = 0
     in_block_comment = False
+    last_line = 0
 
-    for i, raw_line in enumerate(lines, 1):
+    for i, raw_line in _iter_lines(source):
+        last_line = i
         line = raw_line.strip()
 
         # Track block comments
@@ -136,32 +169,32 @@ def _static_c(source: str, issues: List) -> List:
 
         # Line length
         if len(raw_line) > 100:
-            issues.append({"line": i, "type": "formatting", "message": "Line > 100 chars", "category": "static"})
+            yield Issue(i, "formatting", "Line > 100 chars")
 
         # Track braces and parens
         brace_depth += code_part.count("{") - code_part.count("}")
         paren_depth += code_part.count("(") - code_part.count(")")
 
         # --- Missing semicolon detection ---
-        _check_c_semicolon(code_part, i, raw_line, issues)
+        missing = _check_c_semicolon(code_part, i, raw_line)
+        if missing is not None:
+            yield missing
 
         # --- Assignment in condition (= vs ==) ---
         cond_match = re.search(r'\b(if|while)\s*\((.+)\)', code_part)
         if cond_match:
             cond_body = cond_match.group(2)
             if re.search(r'(?<![=!<>])=(?!=)', cond_body):
-                issues.append({"line": i, "type": "warning", "message": f"Possible assignment in condition (use == for comparison?)", "category": "static", "snippet": raw_line.strip()})
+                yield Issue(i, "warning", "Possible assignment in condition (use == for comparison?)", raw_line.strip())
 
     # Unbalanced braces
     if brace_depth != 0:
-        issues.append({"line": len(lines), "type": "syntax_error", "message": f"Unbalanced braces (depth {brace_depth} at end of file)", "category": "static"})
+        yield Issue(last_line, "syntax_error", f"Unbalanced braces (depth {brace_depth} at end of file)")
     if paren_depth != 0:
-        issues.append({"line": len(lines), "type": "syntax_error", "message": f"Unbalanced parentheses (depth {paren_depth} at end of file)", "category": "static"})
-
-    return issues
+        yield Issue(last_line, "syntax_error", f"Unbalanced parentheses (depth {paren_depth} at end of file)")
 
 
-def _check_c_semicolon(code: str, lineno: int, raw_line: str, issues: List):
+def _check_c_semicolon(code: str, lineno: int, raw_line: str) -> Optional[Issue]:
     """Check if a C statement line is missing its trailing semicolon."""
     # Lines that never need a semicolon at the end
     if not code:
@@ -211,13 +244,8 @@ def _check_c_semicolon(code: str, lineno: int, raw_line: str, issues: List):
         or re.match(r'^.*\)\s*$', code)                        # ends with ) but not control flow
     )
     if is_statement:
-        issues.append({
-            "line": lineno,
-            "type": "syntax_error",
-            "message": "Missing semicolon at end of statement",
-            "category": "static",
-            "snippet": raw_line.strip(),
-        })
+        return Issue(lineno, "syntax_error", "Missing semicolon at end of statement", raw_line.strip())
+    return None
 
 
 def analyze_complexity(language: str, source: str) -> Tuple[str, str, List[Dict], List[Dict]]:
@@ -239,7 +267,7 @@ def _complexity_python(source: str) -> Tuple[str, str, List[Dict], List[Dict]]:
     except SyntaxError:
         return "O(1)", "O(1)", [], []
 
-    lines = source.splitlines()
+    lines = _LineIndex(source)
     loop_depth = 0
     max_loop_depth = 0
     has_recursion = False
@@ -263,24 +291,24 @@ def _complexity_python(source: str) -> Tuple[str, str, List[Dict], List[Dict]]:
             depth = depth_of(node, 1)
             max_loop_depth = max(max_loop_depth, depth)
             if depth == 1:
-                time_reasons.append({"line": node.lineno, "reason": "Single loop", "contribution": "O(n)", "snippet": _line(lines, node.lineno)})
+                time_reasons.append({"line": node.lineno, "reason": "Single loop", "contribution": "O(n)", "snippet": lines.line(node.lineno)})
             elif depth == 2:
-                time_reasons.append({"line": node.lineno, "reason": "Nested loop", "contribution": "O(n²)", "snippet": _line(lines, node.lineno)})
+                time_reasons.append({"line": node.lineno, "reason": "Nested loop", "contribution": "O(n²)", "snippet": lines.line(node.lineno)})
             else:
-                time_reasons.append({"line": node.lineno, "reason": "Deep nesting", "contribution": "O(n³)+", "snippet": _line(lines, node.lineno)})
+                time_reasons.append({"line": node.lineno, "reason": "Deep nesting", "contribution": "O(n³)+", "snippet": lines.line(node.lineno)})
         if isinstance(node, ast.Call):
             f = node.func
             if isinstance(f, ast.Name):
                 if f.id == "sorted":
                     has_sort = True
-                    time_reasons.append({"line": node.lineno, "reason": "sorted()", "contribution": "O(n log n)", "snippet": _line(lines, node.lineno)})
+                    time_reasons.append({"line": node.lineno, "reason": "sorted()", "contribution": "O(n log n)", "snippet": lines.line(node.lineno)})
                 if f.id and _calls_self(tree, f.id):
                     has_recursion = True
                     recursion_funcs.add(f.id)
-                    time_reasons.append({"line": node.lineno, "reason": "Recursion", "contribution": "Depends on depth", "snippet": _line(lines, node.lineno)})
+                    time_reasons.append({"line": node.lineno, "reason": "Recursion", "contribution": "Depends on depth", "snippet": lines.line(node.lineno)})
         if isinstance(node, (ast.ListComp, ast.DictComp, ast.SetComp)):
             has_nested_data = True
-            space_reasons.append({"line": node.lineno, "reason": "Comprehension", "contribution": "O(n)", "snippet": _line(lines, node.lineno)})
+            space_reasons.append({"line": node.lineno, "reason": "Comprehension", "contribution": "O(n)", "snippet": lines.line(node.lineno)})
 
     # Overall time complexity
     if max_loop_depth >= 3 or has_recursion:
@@ -316,11 +344,10 @@ def _calls_self(tree: ast.AST, name: str) -> bool:
 
 
 def _complexity_c(source: str) -> Tuple[str, str, List[Dict], List[Dict]]:
-    lines = source.splitlines()
     depth = 0
     max_depth = 0
     time_reasons = []
-    for i, line in enumerate(lines, 1):
+    for i, line in _iter_lines(source):
         if re.match(r"\s*(for|while)\s*\(", line):
             depth += 1
             max_depth = max(max_depth, depth)
@@ -0,0 +1,204 @@
+"""
+Bulk history export: one PDF per history row, rendered in a process pool and
+written straight into a zip file so memory stays bounded by the pool size.
+Also streams rows out as NDJSON or CSV (optionally gzip'd) for data exports.
+Finished files live under config.EXPORT_DIR as ExportFile and are downloaded
+through Streamlit's static file handler, which streams them from disk.
+"""
+import csv
+import gzip
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import secrets
+import shutil
+import time
+import weakref
+import zipfile
+from pathlib import Path
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, BinaryIO, Callable, Dict, Optional, Tuple
+
+import config
+from utils.db import count_history, iter_history
+
+# Max PDFs rendered or waiting to be written per worker
+_PENDING_PER_WORKER = 2
+_PROCESS_START = time.time()
+
+
+class ExportFile:
+    """One export file in its own unguessable directory under config.EXPORT_DIR, downloadable at `url`.
+    The directory is removed by remove(), when the object is garbage-collected (its session
+    ended) or at interpreter exit; sweep_exports() catches what a killed process left behind."""
+
+    def __init__(self, ext: str, mime: str, export_dir: Path = config.EXPORT_DIR):
+        self.dir = export_dir / secrets.token_urlsafe(18)
+        self.dir.mkdir(parents=True)
+        self.name = f"coderefine_history{ext}"
+        self.path = self.dir / self.name
+        self.mime = mime
+        self._finalizer = weakref.finalize(self, shutil.rmtree, str(self.dir), True)
+
+    @property
+    def url(self) -> str:
+        """Relative URL of the file on Streamlit's static route (server.enableStaticServing)."""
+        return f"app/static/{self.dir.parent.name}/{self.dir.name}/{self.name}"
+
+    def remove(self) -> None:
+        self._finalizer()
+
+
+def sweep_exports(export_dir: Path = config.EXPORT_DIR) -> int:
+    """Remove exports left by an earlier server process (no session can reach them) or older
+    than config.EXPORT_TTL_SECONDS. Returns how many were removed."""
+    cutoff = max(_PROCESS_START, time.time() - config.EXPORT_TTL_SECONDS)
+    removed = 0
+    if export_dir.exists():
+        for d in export_dir.iterdir():
+            if d.is_dir() and d.stat().st_mtime < cutoff:
+                shutil.rmtree(d, ignore_errors=True)
+                removed += 1
+    return removed
+
+
+def pdf_export_available() -> bool:
+    return importlib.util.find_spec("reportlab") is not None
+
+
+def _pdf_filename(row: Dict) -> str:
+    day = (row.get("created_at") or "")[:10] or "undated"
+    return f"{row['id']:06d}_{row['type']}_{day}.pdf"
+
+
+def _pdf_kwargs(row: Dict) -> Dict[str, Any]:
+    """Map a saved history row (any type) onto generate_pdf() arguments."""
+    report = row.get("report_json") or {}
+    score = row.get("score")
+    if score is None:
+        score = report.get("score")
+    explanation = "\n\n".join(
+        report[k] for k in ("explanation", "ai_explanation", "alternative", "summary") if report.get(k)
+    )
+    bugs = "\n\n".join(report[k] for k in ("bugs", "ai_bugs") if report.get(k))
+    return {
+        "code": row.get("code_input") or "",
+        "language": row.get("language_from") or row.get("language_to") or "—",
+        "static_issues": report.get("static_issues") or [],
+        "time_complexity": report.get("time_complexity") or report.get("original_complexity") or "—",
+        "space_complexity": report.get("space_complexity") or "—",
+        "time_reasons": report.get("time_reasons") or [],
+        "space_reasons": report.get("space_reasons") or [],
+        "quality_score": score,
+        "score_reasons": report.get("reasons") or [],
+        "ai_explanation": explanation or None,
+        "ai_bugs": bugs or None,
+        "title": row.get("title") or None,
+        "code_output": row.get("code_output") or None,
+    }
+
+
+def _render_row(row: Dict) -> Tuple[str, Optional[bytes]]:
+    """Worker entry point: (zip member name, PDF bytes or None)."""
+    from modules.report_pdf import generate_pdf
+
+    buf = generate_pdf(**_pdf_kwargs(row))
+    return _pdf_filename(row), (buf.getvalue() if buf else None)
+
+
+def export_history_pdfs(
+    out: BinaryIO,
+    user_id: int,
+    type_filter: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[int, int]:
+    """
+    Render every matching history row to PDF and write them into a zip on `out`.
+    Rows are read from a cursor and submitted with a bounded number in flight,
+    so only ~max_workers * 2 rows/PDFs are ever held in memory.
+    Returns (pdfs written, rows that failed to render).
+    """
+    total = count_history(user_id, type_filter, date_from, date_to)
+    workers = max_workers or min(4, os.cpu_count() or 1)
+    max_pending = workers * _PENDING_PER_WORKER
+    done = failed = 0
+
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as zf, ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        pending = set()
+
+        def drain(return_when):
+            nonlocal pending, done, failed
+            finished, pending = wait(pending, return_when=return_when)
+            for fut in finished:
+                try:
+                    name, data = fut.result()
+                except Exception:
+                    name, data = None, None
+                if data:
+                    zf.writestr(name, data)
+                else:
+                    failed += 1
+                done += 1
+                if on_progress:
+                    on_progress(done, total)
+
+        for row in iter_history(user_id, type_filter, date_from, date_to):
+            pending.add(pool.submit(_render_row, row))
+            if len(pending) >= max_pending:
+                drain(FIRST_COMPLETED)
+        while pending:
+            drain(FIRST_COMPLETED)
+
+    return done - failed, failed
+
+
+DATA_COLUMNS = ("id", "created_at", "type", "title", "language_from", "language_to",
+                "score", "code_input", "code_output", "report_json")
+
+
+def export_history_rows(
+    out: BinaryIO,
+    user_id: int,
+    fmt: str = "ndjson",
+    type_filter: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    compress: bool = False,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """
+    Write every matching history row to `out` as NDJSON or CSV, gzip'd if `compress`.
+    Rows are streamed from iter_history(), so memory does not grow with the row count.
+    Returns rows written.
+    """
+    total = count_history(user_id, type_filter, date_from, date_to)
+    raw = gzip.GzipFile(fileobj=out, mode="wb") if compress else out
+    text = io.TextIOWrapper(raw, encoding="utf-8", newline="", write_through=False)
+    writer = csv.writer(text) if fmt == "csv" else None
+    if writer:
+        writer.writerow(DATA_COLUMNS)
+    done = 0
+    try:
+        for row in iter_history(user_id, type_filter, date_from, date_to):
+            if writer:
+                writer.writerow([json.dumps(row.get(c)) if c == "report_json" else row.get(c) for c in DATA_COLUMNS])
+            else:
+                text.write(json.dumps({c: row.get(c) for c in DATA_COLUMNS}, ensure_ascii=False) + "\n")
+            done += 1
+            if on_progress and done % 500 == 0:
+                on_progress(done, total)
+    finally:
+        text.flush()
+        text.detach()
+        if compress:
+            raw.close()
+    if on_progress:
+        on_progress(done, total)
+    return done
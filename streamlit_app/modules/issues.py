@@ -0,0 +1,83 @@
+"""
+Issue record produced by analyze_static: a slotted object instead of a dict per finding.
+Keeps dict-style read access (issue["line"], issue.get("snippet")) for existing callers;
+to_dict() is the JSON shape stored in history reports.
+"""
+
+import heapq
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+class Issue:
+    """One finding. `complexity` and `ai_summary` mirror the API's Issue and are optional."""
+
+    __slots__ = ("line", "type", "message", "snippet", "category", "complexity", "ai_summary")
+
+    def __init__(
+        self,
+        line: int,
+        type: str,
+        message: str,
+        snippet: str = "",
+        category: str = "static",
+        complexity: Optional[str] = None,
+        ai_summary: Optional[str] = None,
+    ):
+        self.line = line
+        self.type = type
+        self.message = message
+        self.snippet = snippet
+        self.category = category
+        self.complexity = complexity
+        self.ai_summary = ai_summary
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON shape; optional fields are included only when set."""
+        d = {"line": self.line, "type": self.type, "message": self.message, "snippet": self.snippet, "category": self.category}
+        if self.complexity is not None:
+            d["complexity"] = self.complexity
+        if self.ai_summary is not None:
+            d["ai_summary"] = self.ai_summary
+        return d
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Issue):
+            return NotImplemented
+        return all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    def __hash__(self) -> int:
+        return hash((self.line, self.type, self.message, self.category))
+
+    def __repr__(self) -> str:
+        return f"Issue({self.category}:{self.type} @ line {self.line}: {self.message!r})"
+
+
+# Higher is more severe; unknown types rank 1
+SEVERITY: Dict[str, int] = {"syntax_error": 5, "warning": 3, "unused_variable": 2, "bad_practice": 2, "formatting": 0}
+
+
+def top_k(issues: Iterable[Issue], k: int) -> Tuple[List[Issue], Counter]:
+    """The k most severe issues (ties go to the earlier one), in their original order,
+    plus a per-type count of the ones left out. Uses a bounded heap: O(k) memory."""
+    heap: List[Tuple[int, int, Issue]] = []  # (severity, -seq, issue); root is the weakest kept
+    dropped: Counter = Counter()
+    for seq, issue in enumerate(issues):
+        entry = (SEVERITY.get(issue.type, 1), -seq, issue)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif k > 0 and entry[:2] > heap[0][:2]:
+            dropped[heapq.heapreplace(heap, entry)[2].type] += 1
+        else:
+            dropped[issue.type] += 1
+    heap.sort(key=lambda e: -e[1])
+    return [e[2] for e in heap], dropped
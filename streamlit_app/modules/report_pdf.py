@@ -2,6 +2,7 @@
 Generate downloadable PDF report for a code review.
 """
 from io import BytesIO
+from xml.sax.saxutils import escape
 from typing import List, Dict, Any, Optional
 
 
@@ -13,12 +14,15 @@ def generate_pdf(
     space_complexity: str,
     time_reasons: List[Dict],
     space_reasons: List[Dict],
-    quality_score: int,
+    quality_score: Optional[int],
     score_reasons: List[str],
     ai_explanation: Optional[str] = None,
     ai_bugs: Optional[str] = None,
+    title: Optional[str] = None,
+    code_output: Optional[str] = None,
 ) -> Optional[BytesIO]:
-    """Returns PDF as BytesIO or None if reportlab not available."""
+    """Returns PDF as BytesIO or None if reportlab not available.
+    title / code_output are used by history export (saved entry name, converted/optimized code)."""
     try:
         from reportlab.lib.pagesizes import letter
         from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -35,9 +39,12 @@ def generate_pdf(
 
     title_style = ParagraphStyle(name="Title", parent=styles["Heading1"], fontSize=18)
     story.append(Paragraph("CodeRefine – Code Review Report", title_style))
+    if title:
+        story.append(Paragraph(escape(title), styles["Heading3"]))
     story.append(Spacer(1, 0.25 * inch))
     story.append(Paragraph(f"<b>Language:</b> {language.upper()}", styles["Normal"]))
-    story.append(Paragraph(f"<b>Quality Score:</b> {quality_score}/100", styles["Normal"]))
+    score_txt = f"{quality_score}/100" if quality_score is not None else "—"
+    story.append(Paragraph(f"<b>Quality Score:</b> {score_txt}", styles["Normal"]))
     story.append(Paragraph(f"<b>Time Complexity:</b> {time_complexity}", styles["Normal"]))
     story.append(Paragraph(f"<b>Space Complexity:</b> {space_complexity}", styles["Normal"]))
     story.append(Spacer(1, 0.2 * inch))
@@ -52,6 +59,11 @@ def generate_pdf(
     story.append(Preformatted(code[:3000] + ("\n... [truncated]" if len(code) > 3000 else ""), code_style))
     story.append(Spacer(1, 0.2 * inch))
 
+    if code_output:
+        story.append(Paragraph("Output code", styles["Heading2"]))
+        story.append(Preformatted(code_output[:3000] + ("\n... [truncated]" if len(code_output) > 3000 else ""), code_style))
+        story.append(Spacer(1, 0.2 * inch))
+
     story.append(Paragraph("Static issues", styles["Heading2"]))
     if static_issues:
         data = [["Line", "Type", "Message"]] + [[str(i.get("line", "")), i.get("type", ""), (i.get("message", ""))[:60]] for i in static_issues[:30]]
@@ -2,6 +2,7 @@
 Code Review — modular feature selection via sidebar checkboxes.
 Each feature runs independently, saves its own history entry.
 """
+import hashlib
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -20,6 +21,17 @@ from modules.ui_components import (
 )
 from utils.db import save_history
 
+
+def _save_with_static_issues(run: list, user_id, type_: str, report_json: dict, **kwargs) -> int:
+    """save_history() for an entry that carries the run's static_issues. Only the run's first such
+    entry counts them in analytics; later ones name it in `static_issues_entry`."""
+    if run[1] is not None:
+        report_json["static_issues_entry"] = run[1]
+    hid = save_history(user_id, type_, report_json=report_json, **kwargs)
+    if run[1] is None:
+        run[1] = hid
+    return hid
+
 if not is_authenticated():
     st.warning("Please sign in from the main page.")
     st.stop()
@@ -117,7 +129,8 @@ if code.strip() and selected:
     st.markdown("---")
 
     # Always run static analysis (needed by quality & bugfix)
-    static_issues = analyze_static(lang, code)
+    static_dropped = {}
+    static_issues = analyze_static(lang, code, dropped=static_dropped)
 
     # Row of buttons
     btn_cols = st.columns(len(selected))
@@ -129,6 +142,11 @@ if code.strip() and selected:
 
     st.markdown("<br>", unsafe_allow_html=True)
     user_id = st.session_state.get("user_id")
+    # One run = the features clicked for the same input: [input digest, entry that counted static_issues]
+    digest = hashlib.blake2b(f"{lang}\0{code}".encode("utf-8"), digest_size=16).hexdigest()
+    run = st.session_state.get("review_run")
+    if not run or run[0] != digest:
+        run = st.session_state["review_run"] = [digest, None]
 
     # ─── COMPLEXITY ───
     if triggers.get("complexity"):
@@ -154,9 +172,10 @@ if code.strip() and selected:
             has_syntax = any(i.get("type") == "syntax_error" for i in static_issues)
             score, score_reasons = compute_quality_score(static_issues, time_c2, space_c2, has_syntax)
 
-        save_history(user_id, "quality", language_from=lang, code_input=code, score=score,
-                     report_json={"score": score, "reasons": score_reasons,
-                                  "issues_count": len(static_issues)})
+        _save_with_static_issues(run, user_id, "quality", language_from=lang, code_input=code, score=score,
+                                 report_json={"score": score, "reasons": score_reasons,
+                                              "issues_count": len(static_issues) + sum(static_dropped.values()),
+                                              "static_issues": static_issues, "dropped_issues": static_dropped})
 
         st.markdown('<div class="section-header">💯 Quality Score</div>', unsafe_allow_html=True)
         q1, q2, q3 = st.columns([1, 1.2, 1.2])
@@ -169,6 +188,9 @@ if code.strip() and selected:
         with q3:
             st.markdown("##### Code with Errors")
             st.markdown(render_highlighted_code(code, static_issues, lang), unsafe_allow_html=True)
+            if static_dropped:
+                st.caption(f"{sum(static_dropped.values())} lower-severity issues not shown: "
+                           + ", ".join(f"{t} {n}" for t, n in static_dropped.items()))
 
     # ─── OPTIMIZED SOLUTION ───
     if triggers.get("optimize"):
@@ -212,8 +234,8 @@ if code.strip() and selected:
             bugs, bug_err = detect_bugs_and_suggest_fixes(code, lang, static_issues)
 
         if bugs:
-            save_history(user_id, "bugfix", language_from=lang, code_input=code,
-                         report_json={"bugs": bugs, "static_issues": static_issues})
+            _save_with_static_issues(run, user_id, "bugfix", language_from=lang, code_input=code,
+                                     report_json={"bugs": bugs, "static_issues": static_issues})
         st.markdown('<div class="section-header">🐛 Bug Detection & Fixes</div>', unsafe_allow_html=True)
 
         # Show highlighted code first
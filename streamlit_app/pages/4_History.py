@@ -1,6 +1,7 @@
 """
 History — ChatGPT-style interface with filter, rename, edit, delete.
 """
+import html
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -8,7 +9,13 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 import streamlit as st
 from auth.auth import is_authenticated
 from modules.ui_components import inject_global_css
-from utils.db import get_history, get_one, rename_history, delete_history, get_type_counts
+from modules.history_export import (
+    ExportFile, export_history_pdfs, export_history_rows, pdf_export_available, sweep_exports,
+)
+from utils.db import (
+    SNIPPET_END, SNIPPET_START, list_history, search_history, get_one, rename_history, delete_history,
+    get_type_counts,
+)
 
 if not is_authenticated():
     st.warning("Please sign in from the main page.")
@@ -18,6 +25,14 @@ st.set_page_config(page_title="History | CodeRefine", page_icon="📜", layout="
 inject_global_css()
 
 user_id = st.session_state["user_id"]
+sweep_exports()
+
+# label → (file extension, mime type)
+EXPORT_FORMATS = {
+    "PDF (ZIP)": (".zip", "application/zip"),
+    "NDJSON": (".ndjson", "application/x-ndjson"),
+    "CSV": (".csv", "text/csv"),
+}
 
 TYPE_META = {
     "complexity":  {"icon": "⏱", "color": "#6C5CE7", "label": "Complexity"},
@@ -37,8 +52,85 @@ def type_pill(type_: str) -> str:
     return f'<span class="type-pill" style="background:{m["color"]}20; color:{m["color"]};">{m["icon"]} {m["label"]}</span>'
 
 
+PAGE_SIZE = 25
+MAX_CACHED_PAGES = 8
+
+# st.fragment reruns only the list when paging; older Streamlit falls back to full reruns
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda fn: fn)
+
+
+def _list_state(filter_val, total: int) -> dict:
+    """Per-session page cache for the list. Reset when the filter or row count changes."""
+    key = (filter_val, total)
+    state = st.session_state.get("hist_list")
+    if not state or state["key"] != key:
+        state = {"key": key, "stack": [None], "pages": {}}
+        st.session_state["hist_list"] = state
+    return state
+
+
+def _current_page(state: dict):
+    """(rows, next_cursor) for the page on top of the cursor stack; one query per page, ever."""
+    cursor = state["stack"][-1]
+    if cursor not in state["pages"]:
+        if len(state["pages"]) >= MAX_CACHED_PAGES:
+            state["pages"].pop(next(iter(state["pages"])))
+        state["pages"][cursor] = list_history(user_id, PAGE_SIZE, state["key"][0], cursor)
+    return state["pages"][cursor]
+
+
+def render_entry_card(r: dict, body_html: str) -> None:
+    """One list bubble + Open button. body_html must already be escaped."""
+    m = TYPE_META.get(r["type"], {"icon": "📄", "color": "#636E72", "label": r["type"]})
+    title = r.get("title") or f'{m["label"]}'
+    title_short = title[:70] + "..." if len(title) > 70 else title
+    ts = (r.get("created_at") or "")[:16]
+    score_badge = f' &middot; Score: <strong>{r["score"]}</strong>' if r.get("score") is not None else ""
+
+    st.markdown(f"""
+<div class="chat-msg">
+    <div class="avatar" style="background:{m['color']};">{m['icon']}</div>
+    <div class="bubble">
+        <div class="bubble-header">
+            <span class="bubble-title">{html.escape(title_short)}</span>
+            <span class="bubble-time">{ts}{score_badge}</span>
+        </div>
+        <div class="bubble-body">
+            <div>{type_pill(r['type'])}</div>
+            <div style="margin-top:8px; color:#636E72; font-size:0.8rem; font-family:'JetBrains Mono',monospace;">{body_html}</div>
+        </div>
+    </div>
+</div>
+""", unsafe_allow_html=True)
+
+    # Expand button
+    if st.button(f"Open →  {title_short[:30]}", key=f"open_{r['id']}", use_container_width=True):
+        st.session_state["hist_selected"] = r["id"]
+        st.rerun()
+
+
+def _highlight(snippet: str) -> str:
+    return (html.escape(snippet or "").replace("\n", " ")
+            .replace(SNIPPET_START, '<mark style="background:#FDCB6E80; padding:0 2px;">')
+            .replace(SNIPPET_END, "</mark>"))
+
+
+def _patch_cached(state: dict, entry_id: int, title=None, deleted: bool = False) -> None:
+    """Apply a rename/delete to cached pages instead of refetching them."""
+    for rows, _ in state["pages"].values():
+        for r in rows:
+            if r["id"] == entry_id:
+                if deleted:
+                    rows.remove(r)
+                    filter_val, total = state["key"]
+                    state["key"] = (filter_val, total - 1)
+                elif title is not None:
+                    r["title"] = title
+                return
+
+
 # ═══════════════════════════════════
-#    SIDEBAR: Conversation List
+#    SIDEBAR: Filter, navigation, export
 # ═══════════════════════════════════
 with st.sidebar:
     st.markdown("""
@@ -52,20 +144,78 @@ with st.sidebar:
     all_types = ["All"] + sorted(type_counts.keys())
     filter_type = st.selectbox("Filter by type", all_types, key="hist_type_filter", label_visibility="collapsed")
     filter_val = None if filter_type == "All" else filter_type
+    total = type_counts.get(filter_val, 0) if filter_val else sum(type_counts.values())
+    state = _list_state(filter_val, total)
 
-    rows = get_history(user_id, limit=100, type_filter=filter_val)
-
-    if not rows:
+    if not total:
         st.caption("No history yet.")
     else:
-        st.caption(f"{len(rows)} entries")
-        for r in rows:
-            m = TYPE_META.get(r["type"], {"icon": "📄", "color": "#636E72", "label": r["type"]})
-            title = r.get("title") or f'{m["label"]} — {(r.get("created_at") or "")[:10]}'
-            title_short = title[:45] + "..." if len(title) > 45 else title
-            ts = (r.get("created_at") or "")[:16]
-            if st.button(f'{m["icon"]} {title_short}', key=f"nav_{r['id']}", use_container_width=True):
-                st.session_state["hist_selected"] = r["id"]
+        st.caption(f"{total} entries")
+        # Quick navigation while an entry is open (current page only, served from cache)
+        if st.session_state.get("hist_selected"):
+            rows, _ = _current_page(state)
+            for r in rows:
+                m = TYPE_META.get(r["type"], {"icon": "📄", "color": "#636E72", "label": r["type"]})
+                title = r.get("title") or f'{m["label"]} — {(r.get("created_at") or "")[:10]}'
+                title_short = title[:45] + "..." if len(title) > 45 else title
+                if st.button(f'{m["icon"]} {title_short}', key=f"nav_{r['id']}", use_container_width=True):
+                    st.session_state["hist_selected"] = r["id"]
+
+    # Bulk export
+    st.markdown("---")
+    with st.expander("📦 Export"):
+        exp_type = st.selectbox("Type", all_types, key="hist_export_type")
+        exp_range = st.date_input("Date range", value=(), key="hist_export_range")
+        exp_fmt = st.selectbox("Format", list(EXPORT_FORMATS), key="hist_export_fmt")
+        exp_gzip = exp_fmt != "PDF (ZIP)" and st.checkbox("Gzip", key="hist_export_gzip")
+        if st.button("Build export", key="hist_export_btn", use_container_width=True):
+            if exp_fmt == "PDF (ZIP)" and not pdf_export_available():
+                st.error("PDF export needs reportlab (pip install reportlab).")
+            else:
+                old = st.session_state.pop("hist_export", None)
+                if old:
+                    old.remove()
+                date_from = exp_range[0] if len(exp_range) > 0 else None
+                date_to = exp_range[1] if len(exp_range) > 1 else date_from
+                type_filter = None if exp_type == "All" else exp_type
+                ext, mime = EXPORT_FORMATS[exp_fmt]
+                if exp_gzip:
+                    ext, mime = ext + ".gz", "application/gzip"
+                verb = "Rendering PDFs" if exp_fmt == "PDF (ZIP)" else "Exporting"
+                bar = st.progress(0.0, text=f"{verb}...")
+
+                def _progress(done, n):
+                    bar.progress(min(1.0, done / n) if n else 1.0, text=f"{verb}... {done}/{n}")
+
+                export = ExportFile(ext, mime)
+                with open(export.path, "wb") as out:
+                    if exp_fmt == "PDF (ZIP)":
+                        written, failed = export_history_pdfs(
+                            out, user_id, type_filter=type_filter,
+                            date_from=date_from, date_to=date_to, on_progress=_progress,
+                        )
+                    else:
+                        written, failed = export_history_rows(
+                            out, user_id, fmt=ext.split(".")[1], type_filter=type_filter,
+                            date_from=date_from, date_to=date_to, compress=exp_gzip, on_progress=_progress,
+                        ), 0
+                bar.empty()
+                if written:
+                    st.session_state["hist_export"] = export
+                    st.caption(f"{written} entries ready" + (f", {failed} failed" if failed else ""))
+                else:
+                    export.remove()
+                    st.caption("No entries match this filter.")
+        export = st.session_state.get("hist_export")
+        if export and export.path.exists():
+            # A link, not st.download_button: the static handler streams the file from disk
+            # instead of the script loading it into server memory on every rerun
+            st.markdown(
+                f'<a href="{html.escape(export.url)}" download="{html.escape(export.name)}" type="{export.mime}" target="_self" '
+                'style="display:block; text-align:center; padding:8px; border-radius:8px; background:#6C5CE7; '
+                'color:white; text-decoration:none; font-weight:600;">⬇️ Download</a>',
+                unsafe_allow_html=True,
+            )
 
 
 # ═══════════════════════════════════
@@ -83,10 +233,9 @@ st.markdown("""
 st.markdown("---")
 
 # Type filter pills at top
-counts = get_type_counts(user_id)
-if counts:
+if type_counts:
     pills_html = ""
-    for t, cnt in sorted(counts.items()):
+    for t, cnt in sorted(type_counts.items()):
         m = TYPE_META.get(t, {"icon": "📄", "color": "#636E72", "label": t})
         pills_html += f'<span style="display:inline-block; margin:4px; padding:4px 14px; border-radius:20px; background:{m["color"]}15; color:{m["color"]}; font-size:0.78rem; font-weight:600;">{m["icon"]} {m["label"]} <strong>{cnt}</strong></span>'
     st.markdown(f'<div style="margin-bottom:16px;">{pills_html}</div>', unsafe_allow_html=True)
@@ -122,7 +271,7 @@ if selected_id:
             <span class="bubble-time">{ts} &middot; {type_pill(entry["type"])}</span>
         </div>
         <div class="bubble-body">
-            <pre style="background:#1E1E2E; color:#CDD6F4; padding:12px; border-radius:8px; font-size:12px; overflow-x:auto; font-family:'JetBrains Mono',monospace;">{__import__('html').escape((entry.get('code_input') or '')[:2000])}</pre>
+            <pre style="background:#1E1E2E; color:#CDD6F4; padding:12px; border-radius:8px; font-size:12px; overflow-x:auto; font-family:'JetBrains Mono',monospace;">{html.escape((entry.get('code_input') or '')[:2000])}</pre>
         </div>
     </div>
 </div>
@@ -187,6 +336,7 @@ if selected_id:
         if new_title != title:
             if st.button("💾 Save Name", key=f"save_name_{entry['id']}"):
                 rename_history(user_id, entry["id"], new_title)
+                _patch_cached(state, entry["id"], title=new_title.strip())
                 st.success("Renamed!")
                 st.rerun()
 
@@ -200,7 +350,8 @@ if selected_id:
             dc1, dc2 = st.columns(2)
             with dc1:
                 if st.button("Yes, delete", key=f"yes_del_{entry['id']}", type="primary"):
-                    delete_history(user_id, entry["id"])
+                    if delete_history(user_id, entry["id"]):
+                        _patch_cached(state, entry["id"], deleted=True)
                     st.session_state.pop("hist_selected", None)
                     st.session_state.pop(f"confirm_del_{entry['id']}", None)
                     st.success("Deleted!")
@@ -214,9 +365,7 @@ else:
     # ═══════════════════════════════════
     #    FULL LIST VIEW (no selection)
     # ═══════════════════════════════════
-    rows_main = get_history(user_id, limit=100, type_filter=filter_val if filter_type != "All" else None)
-
-    if not rows_main:
+    if not total:
         st.markdown("""
 <div style="text-align:center; padding:60px 20px; color:#636E72;">
     <div style="font-size:3rem; margin-bottom:12px;">📭</div>
@@ -226,36 +375,41 @@ else:
 """, unsafe_allow_html=True)
         st.stop()
 
-    # Render as chat messages
-    st.markdown('<div class="chat-container">', unsafe_allow_html=True)
-
-    for r in rows_main:
-        m = TYPE_META.get(r["type"], {"icon": "📄", "color": "#636E72", "label": r["type"]})
-        title = r.get("title") or f'{m["label"]}'
-        title_short = title[:70] + "..." if len(title) > 70 else title
-        ts = (r.get("created_at") or "")[:16]
-        score_badge = f' &middot; Score: <strong>{r["score"]}</strong>' if r.get("score") is not None else ""
-        code_preview = __import__('html').escape((r.get("code_input") or "")[:120]).replace("\n", " ")
-
-        st.markdown(f"""
-<div class="chat-msg">
-    <div class="avatar" style="background:{m['color']};">{m['icon']}</div>
-    <div class="bubble">
-        <div class="bubble-header">
-            <span class="bubble-title">{__import__('html').escape(title_short)}</span>
-            <span class="bubble-time">{ts}{score_badge}</span>
-        </div>
-        <div class="bubble-body">
-            <div>{type_pill(r['type'])}</div>
-            <div style="margin-top:8px; color:#636E72; font-size:0.8rem; font-family:'JetBrains Mono',monospace;">{code_preview}{'...' if len(r.get('code_input','')) > 120 else ''}</div>
-        </div>
-    </div>
-</div>
-""", unsafe_allow_html=True)
-
-        # Expand button
-        if st.button(f"Open →  {title_short[:30]}", key=f"open_{r['id']}", use_container_width=True):
-            st.session_state["hist_selected"] = r["id"]
-            st.rerun()
+    query = st.text_input("🔎 Search history", key="hist_search",
+                          placeholder="Search titles, code and reports...", label_visibility="collapsed")
+    if query.strip():
+        hits = search_history(user_id, query, limit=50, type_filter=filter_val)
+        st.caption(f"{len(hits)} match{'es' if len(hits) != 1 else ''}" + (" (top 50)" if len(hits) == 50 else ""))
+        st.markdown('<div class="chat-container">', unsafe_allow_html=True)
+        for r in hits:
+            render_entry_card(r, _highlight(r.get("snippet")))
+        st.markdown('</div>', unsafe_allow_html=True)
+        st.stop()
 
-    st.markdown('</div>', unsafe_allow_html=True)
+    @_fragment
+    def render_list():
+        rows_main, next_cursor = _current_page(state)
+        page_no = len(state["stack"])
+
+        # Render as chat messages
+        st.markdown('<div class="chat-container">', unsafe_allow_html=True)
+
+        for r in rows_main:
+            render_entry_card(r, html.escape(r.get("preview") or ""))
+
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        # Pager: only the cursor stack changes; pages already seen come from the cache
+        nav_l, nav_m, nav_r = st.columns([1, 2, 1])
+        with nav_l:
+            st.button("← Newer", key="hist_newer", disabled=page_no == 1,
+                      on_click=lambda: state["stack"].pop(), use_container_width=True)
+        with nav_m:
+            first = (page_no - 1) * PAGE_SIZE + 1
+            st.markdown(f"<div style='text-align:center; color:#636E72; font-size:0.85rem; padding-top:8px;'>"
+                        f"{first}–{first + len(rows_main) - 1} of {state['key'][1]}</div>", unsafe_allow_html=True)
+        with nav_r:
+            st.button("Older →", key="hist_older", disabled=next_cursor is None,
+                      on_click=lambda: state["stack"].append(next_cursor), use_container_width=True)
+
+    render_list()
@@ -0,0 +1,146 @@
+"""
+Analytics — which issue types dominate, score trends by language, issue categories.
+All numbers come from indexed aggregate queries (utils/analytics.py).
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import plotly.graph_objects as go
+import streamlit as st
+from auth.auth import is_authenticated
+from modules.ui_components import inject_global_css, render_metric_card
+from utils.analytics import aggregate_issues, issue_totals, score_trend, snapshot_available, write_snapshot
+
+if not is_authenticated():
+    st.warning("Please sign in from the main page.")
+    st.stop()
+
+st.set_page_config(page_title="Analytics | CodeRefine", page_icon="📊", layout="wide")
+inject_global_css()
+
+user_id = st.session_state["user_id"]
+
+CHART_LAYOUT = dict(
+    plot_bgcolor="white",
+    paper_bgcolor="white",
+    font=dict(family="Inter", color="#2D3436"),
+    xaxis=dict(gridcolor="#F0F0F0", zerolinecolor="#F0F0F0"),
+    yaxis=dict(gridcolor="#F0F0F0", zerolinecolor="#F0F0F0"),
+    margin=dict(l=40, r=20, t=50, b=40),
+    height=360,
+)
+LANG_COLORS = {"python": "#6C5CE7", "c": "#00B894"}
+
+# ═══════════════════════════════════
+#    SIDEBAR: Filters
+# ═══════════════════════════════════
+with st.sidebar:
+    st.markdown("### 📊 Filters")
+    date_range = st.date_input("Date range", value=(), key="an_range")
+    lang_opt = st.selectbox("Language", ["All", "python", "c"], key="an_lang")
+    period = st.selectbox("Trend period", ["month", "day", "year"], key="an_period")
+
+    st.markdown("---")
+    with st.expander("🗄 Columnar snapshot"):
+        st.caption("Every issue row as one file, for pandas / DuckDB / Spark.")
+        snap_fmt = st.selectbox("Format", ["parquet", "arrow"], key="an_snap_fmt")
+        if st.button("Build snapshot", key="an_snap_btn", use_container_width=True):
+            if not snapshot_available():
+                st.error("Snapshots need pyarrow (pip install pyarrow).")
+            else:
+                old = st.session_state.pop("an_snapshot", None)
+                if old:
+                    Path(old).unlink(missing_ok=True)
+                fd, snap_path = tempfile.mkstemp(suffix=f".{snap_fmt}")
+                os.close(fd)
+                n = write_snapshot(Path(snap_path), user_id, snap_fmt)
+                st.session_state["an_snapshot"] = snap_path
+                st.caption(f"{n} issue rows written")
+        snap = st.session_state.get("an_snapshot")
+        if snap and Path(snap).exists():
+            with open(snap, "rb") as fh:
+                st.download_button("⬇️ Download", data=fh, file_name=f"coderefine_issues{Path(snap).suffix}",
+                                   mime="application/octet-stream", use_container_width=True)
+
+date_from = str(date_range[0]) if len(date_range) > 0 else None
+date_to = str(date_range[1]) if len(date_range) > 1 else date_from
+language = None if lang_opt == "All" else lang_opt
+
+# ═══════════════════════════════════
+#    MAIN
+# ═══════════════════════════════════
+st.markdown("""
+<div style="display:flex; align-items:center; gap:12px; margin-bottom:8px;">
+    <span style="font-size:2rem;">📊</span>
+    <div>
+        <div style="font-size:1.6rem; font-weight:800; color:#2D3436;">Analytics</div>
+        <div style="font-size:0.85rem; color:#636E72;">Issue types, categories and score trends across your history</div>
+    </div>
+</div>
+""", unsafe_allow_html=True)
+st.markdown("---")
+
+totals = issue_totals(user_id, language, date_from, date_to)
+trend = [r for r in score_trend(user_id, period, date_from, date_to) if not language or r["language"] == language]
+runs = sum(r["runs"] for r in trend)
+avg = round(sum(r["avg_score"] * r["runs"] for r in trend) / runs, 1) if runs else None
+
+m1, m2, m3, m4 = st.columns(4)
+with m1:
+    st.markdown(render_metric_card(str(totals["issues"]), "Issues found", "across saved reports"), unsafe_allow_html=True)
+with m2:
+    st.markdown(render_metric_card(str(totals["issue_types"]), "Issue types", "distinct", color="#E17055"), unsafe_allow_html=True)
+with m3:
+    st.markdown(render_metric_card(str(totals["categories"]), "Categories", "static, logic, ...", color="#0984E3"), unsafe_allow_html=True)
+with m4:
+    st.markdown(render_metric_card("—" if avg is None else str(avg), "Avg quality score", f"{runs} scored runs",
+                                   color="#00B894"), unsafe_allow_html=True)
+
+if not totals["issues"] and not trend:
+    st.info("No analytics yet — run a Code Review with Quality Score or Bug Fix enabled.")
+    st.stop()
+
+c1, c2 = st.columns(2)
+with c1:
+    top = aggregate_issues(user_id, ("issue_type",), language=language, date_from=date_from, date_to=date_to, limit=15)
+    fig = go.Figure(go.Bar(
+        x=[r["issues"] for r in reversed(top)], y=[r["issue_type"] for r in reversed(top)],
+        orientation="h", marker_color="#6C5CE7",
+    ))
+    fig.update_layout(title="Top issue types", **CHART_LAYOUT)
+    st.plotly_chart(fig, use_container_width=True)
+with c2:
+    by_cat = aggregate_issues(user_id, ("category", "language"), language=language, date_from=date_from, date_to=date_to)
+    fig = go.Figure()
+    for lang in sorted({r["language"] for r in by_cat}):
+        rows = [r for r in by_cat if r["language"] == lang]
+        fig.add_trace(go.Bar(x=[r["category"] for r in rows], y=[r["issues"] for r in rows], name=lang,
+                             marker_color=LANG_COLORS.get(lang, "#636E72")))
+    fig.update_layout(title="Issues by category", barmode="stack", **CHART_LAYOUT)
+    st.plotly_chart(fig, use_container_width=True)
+
+if trend:
+    fig = go.Figure()
+    for lang in sorted({r["language"] for r in trend}):
+        rows = [r for r in trend if r["language"] == lang]
+        fig.add_trace(go.Scatter(
+            x=[r["period"] for r in rows], y=[r["avg_score"] for r in rows], mode="lines+markers", name=lang,
+            line=dict(color=LANG_COLORS.get(lang, "#636E72"), width=2),
+            customdata=[r["runs"] for r in rows],
+            hovertemplate="%{x}<br>avg %{y}<br>%{customdata} runs<extra>" + lang + "</extra>",
+        ))
+    fig.update_layout(title=f"Quality score by language ({period})", **CHART_LAYOUT)
+    fig.update_yaxes(range=[0, 100])
+    st.plotly_chart(fig, use_container_width=True)
+
+over_time = aggregate_issues(user_id, (period if period != "year" else "month",), language=language,
+                             date_from=date_from, date_to=date_to, limit=400)
+if over_time:
+    key = period if period != "year" else "month"
+    over_time.sort(key=lambda r: r[key])
+    fig = go.Figure(go.Bar(x=[r[key] for r in over_time], y=[r["issues"] for r in over_time], marker_color="#E17055"))
+    fig.update_layout(title="Issues over time", **CHART_LAYOUT)
+    st.plotly_chart(fig, use_container_width=True)
@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+
+# App modules import `utils.*` / `modules.*` as top-level packages (run from streamlit_app/)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest  # noqa: E402
+
+from utils import storage  # noqa: E402
+from utils.history_writer import writer  # noqa: E402
+
+
+@pytest.fixture
+def history_db(tmp_path, monkeypatch):
+    """A fresh migrated database; the history writer's id counter starts over for it."""
+    monkeypatch.setattr(storage, "DB_PATH", tmp_path / "coderefine.db")
+    monkeypatch.setattr(writer, "_next_id", None)
+    yield storage.get_conn()
+    writer.flush()
@@ -0,0 +1,46 @@
+from utils import db, storage
+
+ISSUES = [
+    {"line": 1, "type": "unused_variable", "message": "x", "category": "static"},
+    {"line": 2, "type": "formatting", "message": "y", "category": "static"},
+]
+
+
+def _rollup(conn):
+    rows = conn.execute("SELECT entry_type, issue_type, SUM(cnt) FROM issue_rollup GROUP BY entry_type, issue_type")
+    return {(r[0], r[1]): r[2] for r in rows}
+
+
+def test_code_review_run_counts_static_issues_once(history_db):
+    quality = db.save_history(1, "quality", language_from="python", code_input="x = 1", score=80,
+                              report_json={"score": 80, "static_issues": ISSUES})
+    bugfix = db.save_history(1, "bugfix", language_from="python", code_input="x = 1",
+                             report_json={"bugs": "none", "static_issues": ISSUES, "static_issues_entry": quality})
+    db.flush_history()
+    assert _rollup(history_db) == {("quality", "unused_variable"): 1, ("quality", "formatting"): 1}
+
+    db.update_history_report(1, bugfix, {"bugs": "still none", "static_issues": ISSUES, "static_issues_entry": quality})
+    assert _rollup(history_db) == {("quality", "unused_variable"): 1, ("quality", "formatting"): 1}
+
+
+def test_bugfix_only_run_counts_its_static_issues(history_db):
+    db.save_history(1, "bugfix", language_from="python", code_input="x = 1",
+                    report_json={"bugs": "none", "static_issues": ISSUES})
+    db.flush_history()
+    assert _rollup(history_db) == {("bugfix", "unused_variable"): 1, ("bugfix", "formatting"): 1}
+
+
+def test_migration_keeps_bugfix_issues_unless_the_run_counted_them(history_db):
+    # Before quality reports carried static_issues, the bugfix entry was the only record
+    db.save_history(1, "quality", language_from="python", code_input="old", report_json={"score": 90})
+    db.save_history(1, "bugfix", language_from="python", code_input="old",
+                    report_json={"bugs": "b", "static_issues": ISSUES})
+    # Saved in between: both entries of the run counted them
+    db.save_history(1, "quality", language_from="python", code_input="new", report_json={"static_issues": ISSUES})
+    db.save_history(1, "bugfix", language_from="python", code_input="new",
+                    report_json={"bugs": "b", "static_issues": ISSUES})
+    db.flush_history()
+    with history_db:
+        storage._m009_bugfix_issue_context(history_db)
+    assert _rollup(history_db) == {("quality", "unused_variable"): 1, ("quality", "formatting"): 1,
+                                   ("bugfix", "unused_variable"): 1, ("bugfix", "formatting"): 1}
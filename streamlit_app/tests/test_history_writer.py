@@ -0,0 +1,22 @@
+import pytest
+
+from utils import db, storage
+from utils.history_writer import WriterLocked, writer
+
+fcntl = pytest.importorskip("fcntl")
+
+
+def test_saved_rows_are_readable_right_away(history_db):
+    hid = db.save_history(1, "review", "fresh", code_input="x = 1")
+    assert db.get_one(1, hid)["title"] == "fresh"
+    assert [r["id"] for r in db.get_history(1)] == [hid]
+
+
+def test_second_writer_process_is_refused(history_db, monkeypatch, tmp_path):
+    db.save_history(1, "review", "first", code_input="x = 1")
+    other = tmp_path / "other.db"
+    with open(f"{other}.writer.lock", "a+b") as fh:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)  # what a second server would hold
+        monkeypatch.setattr(storage, "DB_PATH", other)
+        with pytest.raises(WriterLocked):
+            writer.allocate_id()
@@ -0,0 +1,12 @@
+from utils import db, maintenance
+
+
+def test_archived_rows_leave_the_search_index(history_db, tmp_path):
+    for i in range(3):
+        db.save_history(1, "review", f"entry {i}", code_input=f"def walrus_{i}(): pass", report_json={"summary": "zebra"})
+    db.flush_history()
+    assert len(history_db.execute("SELECT rowid FROM history_fts WHERE history_fts MATCH 'zebra'").fetchall()) == 3
+
+    assert maintenance.archive_history(retention_days=0, max_per_user=1, archive_dir=tmp_path / "archive")["archived"] == 2
+    assert len(history_db.execute("SELECT rowid FROM history_fts WHERE history_fts MATCH 'zebra'").fetchall()) == 1
+    history_db.execute("INSERT INTO history_fts (history_fts) VALUES ('integrity-check')")
@@ -0,0 +1,30 @@
+from utils import db, storage
+from utils.db import SNIPPET_END, SNIPPET_START
+
+
+def test_hits_in_code_and_report_get_a_marked_excerpt(history_db):
+    db.save_history(1, "review", "plain title", code_input="x = 1\n" * 40 + "def walrus(): pass",
+                    report_json={"issues": [{"message": "zebra crossing ahead"}]})
+    [code_hit] = db.search_history(1, "walrus")
+    assert f"{SNIPPET_START}walrus{SNIPPET_END}" in code_hit["snippet"]
+    [report_hit] = db.search_history(1, "zebra")
+    assert report_hit["snippet"] == f"{SNIPPET_START}zebra{SNIPPET_END} crossing ahead"
+
+
+def test_search_index_is_built_once_fts5_is_available(tmp_path, monkeypatch):
+    path = tmp_path / "coderefine.db"
+    monkeypatch.setattr(storage, "_fts_available", lambda conn: False)
+    storage.migrate(path)
+    conn = storage._connect(path)
+    with conn:
+        conn.execute("INSERT INTO users (id, email, password_hash) VALUES (1, 'a@b.c', 'x')")
+        conn.execute("INSERT INTO history (user_id, type, title) VALUES (1, 'review', 'walrus notes')")
+    assert not storage.has_fts(conn)
+
+    monkeypatch.undo()
+    storage._migrated.discard(path)
+    storage.migrate(path)
+    assert storage.has_fts(conn)
+    assert [r[0] for r in conn.execute("SELECT rowid FROM history_fts WHERE history_fts MATCH 'walrus'")] == [1]
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(storage.MIGRATIONS)
+    conn.close()
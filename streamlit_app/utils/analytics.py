@@ -0,0 +1,187 @@
+"""
+Analytics over saved history.
+Issues found in each report are flattened into the `history_issues` table when
+the row is written; triggers keep `issue_rollup` (counts per user, day,
+language, entry type and issue type) in step, and group-by queries read the
+rollup instead of decoding report blobs. Optional Parquet / Arrow IPC
+snapshots of history_issues need `pyarrow`.
+"""
+import importlib.util
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from utils.storage import get_conn
+
+# Report keys that hold lists of issue dicts ({"type", "category", "line", ...})
+ISSUE_KEYS = ("static_issues", "logic_issues", "complexity_issues", "optimizations")
+# A report whose static_issues repeat another entry's (a second Code Review feature on the same input)
+# names that entry here; its static_issues are kept for display but only counted once, on that entry
+STATIC_OWNER_KEY = "static_issues_entry"
+
+IssueRow = Tuple[str, str, Optional[int]]  # (category, issue_type, line)
+
+# Group-by name → SQL expression (whitelist; names are never interpolated from input)
+DIMENSIONS = {
+    "category": "category",
+    "issue_type": "issue_type",
+    "language": "language",
+    "entry_type": "entry_type",
+    "day": "day",
+    "month": "substr(day, 1, 7)",
+}
+PERIODS = {"day": 10, "month": 7, "year": 4}
+
+SNAPSHOT_BATCH = 65536
+SNAPSHOT_COLUMNS = ("history_id", "user_id", "entry_type", "language", "category", "issue_type", "line", "created_at")
+
+
+def flatten_issues(report: Optional[Dict[str, Any]]) -> List[IssueRow]:
+    """Issue rows for one report; keys without issue lists are ignored, and so are
+    static_issues counted on another entry (STATIC_OWNER_KEY)."""
+    out: List[IssueRow] = []
+    if not isinstance(report, dict):
+        return out
+    for key in ISSUE_KEYS:
+        if key == "static_issues" and report.get(STATIC_OWNER_KEY) is not None:
+            continue
+        items = report.get(key)
+        if not isinstance(items, list):
+            continue
+        default_category = key.replace("_issues", "").rstrip("s")
+        for it in items:
+            if hasattr(it, "get") and it.get("type"):  # dicts or modules.issues.Issue
+                line = it.get("line")
+                out.append((str(it.get("category") or default_category), str(it["type"]),
+                            line if isinstance(line, int) else None))
+    return out
+
+
+def insert_issue_rows(conn: sqlite3.Connection, rows: Iterable[Tuple[int, Sequence[IssueRow]]]) -> None:
+    """Insert flattened issues for (history_id, issues) pairs; entry metadata is copied from history."""
+    conn.executemany(
+        """INSERT INTO history_issues (history_id, user_id, entry_type, language, created_at, category, issue_type, line)
+           SELECT h.id, h.user_id, h.type, h.language_from, h.created_at, ?, ?, ? FROM history h WHERE h.id = ?""",
+        [(cat, typ, line, hid) for hid, issues in rows for cat, typ, line in issues],
+    )
+
+
+def _where(
+    user_id: Optional[int],
+    category: Optional[str] = None,
+    language: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> Tuple[str, List]:
+    clauses, params = [], []
+    for col, val in (("user_id", user_id), ("category", category), ("language", language)):
+        if val is not None:
+            clauses.append(f"{col} = ?")
+            params.append(val)
+    if date_from:
+        clauses.append("day >= ?")
+        params.append(str(date_from))
+    if date_to:
+        clauses.append("day <= ?")
+        params.append(str(date_to))
+    return (" AND ".join(clauses) or "1"), params
+
+
+def aggregate_issues(
+    user_id: Optional[int],
+    group_by: Sequence[str] = ("issue_type",),
+    category: Optional[str] = None,
+    language: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    limit: int = 50,
+) -> List[Dict]:
+    """Issue counts grouped by any of DIMENSIONS, largest first. user_id=None aggregates all users."""
+    unknown = [g for g in group_by if g not in DIMENSIONS]
+    if unknown or not group_by:
+        raise ValueError(f"group_by must be a non-empty subset of {sorted(DIMENSIONS)}; got {list(group_by)}")
+    where, params = _where(user_id, category, language, date_from, date_to)
+    cols = ", ".join(f"{DIMENSIONS[g]} AS {g}" for g in group_by)
+    sql = f"""SELECT {cols}, SUM(cnt) AS issues FROM issue_rollup WHERE {where}
+              GROUP BY {", ".join(str(i) for i in range(1, len(group_by) + 1))} ORDER BY issues DESC LIMIT ?"""
+    return [dict(r) for r in get_conn().execute(sql, params + [limit]).fetchall()]
+
+
+def score_trend(
+    user_id: Optional[int],
+    period: str = "month",
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> List[Dict]:
+    """Average quality score per language per period, oldest period first."""
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {sorted(PERIODS)}")
+    clauses, params = ["score IS NOT NULL"], []
+    if user_id is not None:
+        clauses.append("user_id = ?")
+        params.append(user_id)
+    if date_from:
+        clauses.append("created_at >= ?")
+        params.append(str(date_from))
+    if date_to:
+        clauses.append("created_at < date(?, '+1 day')")
+        params.append(str(date_to))
+    sql = f"""SELECT COALESCE(language_from, 'unknown') AS language, substr(created_at, 1, {PERIODS[period]}) AS period,
+                     ROUND(AVG(score), 1) AS avg_score, COUNT(*) AS runs
+              FROM history WHERE {" AND ".join(clauses)}
+              GROUP BY 1, 2 ORDER BY 2, 1"""
+    return [dict(r) for r in get_conn().execute(sql, params).fetchall()]
+
+
+def issue_totals(
+    user_id: Optional[int],
+    language: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> Dict[str, int]:
+    where, params = _where(user_id, language=language, date_from=date_from, date_to=date_to)
+    row = get_conn().execute(
+        f"SELECT COALESCE(SUM(cnt), 0), COUNT(DISTINCT issue_type), COUNT(DISTINCT category) FROM issue_rollup WHERE {where}",
+        params,
+    ).fetchone()
+    return {"issues": row[0], "issue_types": row[1], "categories": row[2]}
+
+
+def snapshot_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def write_snapshot(path: Path, user_id: Optional[int] = None, fmt: str = "parquet") -> int:
+    """Dump history_issues to a Parquet or Arrow IPC file in record batches. Returns rows written."""
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Columnar snapshots need pyarrow (pip install pyarrow).")
+    if fmt not in ("parquet", "arrow"):
+        raise ValueError("fmt must be 'parquet' or 'arrow'")
+
+    schema = pa.schema([
+        ("history_id", pa.int64()), ("user_id", pa.int64()), ("entry_type", pa.string()),
+        ("language", pa.string()), ("category", pa.string()), ("issue_type", pa.string()),
+        ("line", pa.int32()), ("created_at", pa.string()),
+    ])
+    where, params = ("user_id = ?", [user_id]) if user_id is not None else ("1", [])
+    cur = get_conn().execute(f"SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM history_issues WHERE {where}", params)
+    writer = pq.ParquetWriter(str(path), schema) if fmt == "parquet" else ipc.new_file(str(path), schema)
+    written = 0
+    try:
+        while True:
+            rows = cur.fetchmany(SNAPSHOT_BATCH)
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            batch = pa.record_batch([pa.array(c, type=f.type) for c, f in zip(columns, schema)], schema=schema)
+            writer.write_table(pa.Table.from_batches([batch]))
+            written += len(rows)
+    finally:
+        writer.close()
+        cur.close()
+    return written
+
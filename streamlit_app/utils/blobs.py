@@ -0,0 +1,73 @@
+"""
+Content-addressed, compressed storage for history code and reports.
+A blob's key is the BLAKE2b digest of its UTF-8 text, so the six entries a
+Code Review run saves for the same input share one stored copy.
+Uses zstd when `zstandard` is installed, zlib otherwise; the codec is stored per blob.
+"""
+import hashlib
+import sqlite3
+import zlib
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    import zstandard as _zstd
+except ImportError:
+    _zstd = None
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+
+Blob = Tuple[str, str, int, bytes]  # (hash, codec, raw size, data)
+
+
+def encode(text: str) -> Blob:
+    raw = text.encode("utf-8")
+    if _zstd is not None:
+        codec, data = "zstd", _zstd.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    else:
+        codec, data = "zlib", zlib.compress(raw, ZLIB_LEVEL)
+    return hashlib.blake2b(raw, digest_size=16).hexdigest(), codec, len(raw), data
+
+
+def decode(codec: Optional[str], data: Optional[bytes]) -> Optional[str]:
+    if data is None:
+        return None
+    if codec == "zlib":
+        raw = zlib.decompress(data)
+    elif codec == "zstd":
+        if _zstd is None:
+            raise RuntimeError("History blob is zstd-compressed; install zstandard to read it.")
+        raw = _zstd.ZstdDecompressor().decompress(data)
+    else:
+        raw = data
+    return raw.decode("utf-8")
+
+
+def put_blobs(conn: sqlite3.Connection, texts: Iterable[Optional[str]]) -> Dict[str, str]:
+    """Store each non-empty text once (existing hashes are left alone). Returns {text: hash}.
+    History triggers maintain blobs.refcount; call inside the transaction that inserts the refs."""
+    refs: Dict[str, str] = {}
+    rows = []
+    for text in texts:
+        if text and text not in refs:
+            blob = encode(text)
+            refs[text] = blob[0]
+            rows.append(blob)
+    if rows:
+        conn.executemany(
+            "INSERT INTO blobs (hash, codec, size, data) VALUES (?, ?, ?, ?) ON CONFLICT (hash) DO NOTHING",
+            rows,
+        )
+    return refs
+
+
+def sweep(conn: sqlite3.Connection) -> int:
+    """Recount references from history and delete unreferenced blobs. Returns blobs removed."""
+    with conn:
+        conn.execute("""
+            UPDATE blobs SET refcount = (
+                (SELECT COUNT(*) FROM history WHERE input_ref = blobs.hash)
+              + (SELECT COUNT(*) FROM history WHERE output_ref = blobs.hash)
+              + (SELECT COUNT(*) FROM history WHERE report_ref = blobs.hash))
+        """)
+        return conn.execute("DELETE FROM blobs WHERE refcount <= 0").rowcount
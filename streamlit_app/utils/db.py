@@ -3,62 +3,24 @@ History CRUD: save, list, update, rename, delete user records.
 Types: complexity, optimized, explanation, bugfix, quality, review, conversion, comparison
 """
 import json
-import sqlite3
-from pathlib import Path
-from typing import List, Dict, Any, Optional
-
-_here = Path(__file__).resolve().parent.parent
-DB_PATH = _here / "database" / "coderefine.db"
-
-
-def get_conn():
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    return conn
-
-
-def ensure_schema(conn):
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            name TEXT,
-            created_at TEXT NOT NULL DEFAULT (datetime('now'))
-        )
-    """)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            type TEXT NOT NULL,
-            title TEXT DEFAULT '',
-            language_from TEXT,
-            language_to TEXT,
-            code_input TEXT,
-            code_output TEXT,
-            report_json TEXT,
-            score INTEGER,
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    """)
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_history_user ON history(user_id)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_history_created ON history(created_at DESC)")
-    _migrate_title_column(conn)
-    conn.commit()
+import re
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
+from utils.analytics import flatten_issues, insert_issue_rows
+from utils.history_writer import writer
+from utils.blobs import decode, put_blobs
+from utils.storage import FTS_INSERT_SQL, PREVIEW_CHARS, fts_deletes, fts_unindex, get_conn, has_fts
 
-def _migrate_title_column(conn):
-    """Add title column if missing (upgrade from older schema)."""
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT title FROM history LIMIT 1")
-    except sqlite3.OperationalError:
-        cur.execute("ALTER TABLE history ADD COLUMN title TEXT DEFAULT ''")
-        conn.commit()
+def _to_json(obj: Any) -> Any:
+    """json.dumps hook for Issue records in report_json."""
+    to_dict = getattr(obj, "to_dict", None)
+    if to_dict is None:
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    return to_dict()
+
+
+# Columns the History list needs; code/report bodies are only loaded by get_one()
+LIST_COLUMNS = "id, type, title, language_from, language_to, score, created_at, preview"
 
 
 def save_history(
@@ -72,23 +34,28 @@ def save_history(
     report_json: Optional[dict] = None,
     score: Optional[int] = None,
 ) -> int:
-    conn = get_conn()
-    ensure_schema(conn)
+    """Queue a history row for the background writer and return its (pre-allocated) id.
+    The row is committed within ~50 ms; the readers here wait for queued rows first, so it shows up
+    in them right away. Call flush_history() before querying the database some other way."""
     if not title:
         title = _auto_title(type_, code_input, language_from)
-    cur = conn.cursor()
-    cur.execute(
-        """INSERT INTO history (user_id, type, title, language_from, language_to, code_input, code_output, report_json, score)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-        (user_id, type_, title, language_from, language_to, code_input[:50000], code_output[:50000],
-         json.dumps(report_json) if report_json else None, score),
-    )
-    conn.commit()
-    hid = cur.lastrowid
-    conn.close()
+    hid = writer.allocate_id()
+    writer.submit((hid, user_id, type_, title, language_from, language_to, code_input[:50000], code_output[:50000],
+                   json.dumps(report_json, default=_to_json) if report_json else None, score, _preview(code_input),
+                   flatten_issues(report_json)))
     return hid
 
 
+def flush_history() -> None:
+    """Wait until all queued save_history() rows are committed."""
+    writer.flush()
+
+
+def _preview(code: str) -> str:
+    flat = (code or "").replace("\n", " ")
+    return flat[:PREVIEW_CHARS] + ("..." if len(flat) > PREVIEW_CHARS else "")
+
+
 def _auto_title(type_: str, code: str, lang: Optional[str]) -> str:
     first_line = (code or "").strip().splitlines()[0][:60] if code else ""
     labels = {
@@ -107,105 +74,344 @@ def _auto_title(type_: str, code: str, lang: Optional[str]) -> str:
     return f"{prefix}{lang_tag}{snippet}"
 
 
-def get_history(user_id: int, limit: int = 100, type_filter: Optional[str] = None) -> List[Dict]:
-    conn = get_conn()
-    ensure_schema(conn)
-    cur = conn.cursor()
+def list_history(
+    user_id: int,
+    limit: int = 50,
+    type_filter: Optional[str] = None,
+    before: Optional[Tuple[str, int]] = None,
+) -> Tuple[List[Dict], Optional[Tuple[str, int]]]:
+    """
+    One page of the History list, newest first: (rows, cursor for the next page or None).
+    Rows carry LIST_COLUMNS only. Keyset pagination on (created_at, id) walks
+    idx_history_user[_type]_recent, so page N costs the same as page 1.
+    """
+    writer.flush()
+    where = ["user_id = ?"]
+    params: List[Any] = [user_id]
     if type_filter:
-        cur.execute(
-            "SELECT id, type, title, language_from, language_to, code_input, code_output, report_json, score, created_at FROM history WHERE user_id = ? AND type = ? ORDER BY created_at DESC LIMIT ?",
-            (user_id, type_filter, limit),
-        )
-    else:
-        cur.execute(
-            "SELECT id, type, title, language_from, language_to, code_input, code_output, report_json, score, created_at FROM history WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
-            (user_id, limit),
-        )
-    rows = cur.fetchall()
-    conn.close()
+        where.append("type = ?")
+        params.append(type_filter)
+    if before:
+        where.append("(created_at, id) < (?, ?)")
+        params.extend(before)
+    params.append(limit + 1)
+    rows = get_conn().execute(
+        f"SELECT {LIST_COLUMNS} FROM history WHERE {' AND '.join(where)} ORDER BY created_at DESC, id DESC LIMIT ?",
+        params,
+    ).fetchall()
+    page = [dict(r) for r in rows[:limit]]
+    cursor = (page[-1]["created_at"], page[-1]["id"]) if len(rows) > limit else None
+    return page, cursor
+
+
+# Marks around matched terms in search snippets; escape the snippet, then swap these for <mark>
+SNIPPET_START, SNIPPET_END = "\x02", "\x03"
+SNIPPET_CHARS = 160  # excerpt length when the match is in code or report text
+
+
+def _fts_query(text: str) -> str:
+    """User text -> FTS5 query: every term quoted (no operator injection), AND-ed, last term prefix-matched."""
+    terms = ['"' + t.replace('"', '""') + '"' for t in text.split()]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _terms(query: str) -> Optional[re.Pattern]:
+    """Regex for the query's terms, the last one as a prefix (like _fts_query); None for an empty query."""
+    terms = [re.escape(t.strip('"')) for t in query.split() if t.strip('"')]
+    if not terms:
+        return None
+    return re.compile(r"\b(?:" + "|".join([t + r"\b" for t in terms[:-1]] + [terms[-1]]) + r")\w*", re.IGNORECASE)
+
+
+def _mark(text: str, query: str) -> str:
+    """`text` with the query's terms wrapped in SNIPPET_START/END."""
+    pattern = _terms(query)
+    if pattern is None or not text:
+        return text or ""
+    return pattern.sub(lambda m: SNIPPET_START + m.group(0) + SNIPPET_END, text)
+
+
+def _excerpt(text: str, query: str) -> str:
+    """About SNIPPET_CHARS of `text` (whitespace collapsed) around its first match, marked; "" without a match."""
+    pattern = _terms(query)
+    m = pattern.search(text) if pattern is not None and text else None
+    if m is None:
+        return ""
+    start = max(0, m.start() - SNIPPET_CHARS // 4)
+    end = start + SNIPPET_CHARS
+    window = " ".join(text[start:end].split())
+    return ("..." if start else "") + _mark(window, query) + ("..." if end < len(text) else "")
+
+
+def _text_leaves(report: Optional[str]) -> str:
+    """The string values of a report's JSON, space-separated (what history_fts indexes as report_text)."""
+    try:
+        stack, out = [json.loads(report)], []
+    except (TypeError, ValueError):
+        return ""
+    while stack:
+        v = stack.pop()
+        if isinstance(v, str):
+            out.append(v)
+        elif isinstance(v, dict):
+            stack.extend(reversed(list(v.values())))
+        elif isinstance(v, list):
+            stack.extend(reversed(v))
+    return " ".join(out)
+
+
+def search_history(user_id: int, query: str, limit: int = 50, type_filter: Optional[str] = None) -> List[Dict]:
+    """
+    Ranked full-text search over title, code and report text.
+    Returns LIST_COLUMNS plus `snippet` (matches wrapped in SNIPPET_START/END).
+    Ranking happens inside SQLite and only `limit` rows come back; the index is contentless,
+    so the snippet is the preview or title with the matched terms marked, or, when the match is
+    further into the code or in the report, an excerpt of the row's decoded text around it.
+    """
+    if not query.strip():
+        return []
+    writer.flush()
+    conn = get_conn()
+    if not has_fts(conn):
+        like = f"%{query.strip()}%"
+        where = "user_id = ? AND (title LIKE ? OR preview LIKE ?)" + (" AND type = ?" if type_filter else "")
+        params = [user_id, like, like] + ([type_filter] if type_filter else []) + [limit]
+        rows = conn.execute(
+            f"SELECT {LIST_COLUMNS}, preview AS snippet FROM history WHERE {where} ORDER BY created_at DESC, id DESC LIMIT ?",
+            params,
+        ).fetchall()
+        return [dict(r) for r in rows]
+    cols = ", ".join(f"h.{c.strip()}" for c in LIST_COLUMNS.split(","))
+    rows = conn.execute(
+        f"""SELECT {cols}
+            FROM history_fts JOIN history h ON h.id = history_fts.rowid
+            WHERE history_fts MATCH ? AND h.user_id = ? {"AND h.type = ?" if type_filter else ""}
+            ORDER BY bm25(history_fts, 10.0, 1.0, 1.0, 2.0)
+            LIMIT ?""",
+        [_fts_query(query), user_id] + ([type_filter] if type_filter else []) + [limit],
+    ).fetchall()
     out = []
     for r in rows:
         d = dict(r)
-        if d.get("report_json"):
-            try:
-                d["report_json"] = json.loads(d["report_json"])
-            except Exception:
-                d["report_json"] = None
+        preview = _mark(d["preview"], query)
+        title = _mark(d["title"], query)
+        d["snippet"] = preview if SNIPPET_START in preview else title if SNIPPET_START in title else None
         out.append(d)
+    # Only rows whose hit is outside the title and preview decode their bodies
+    unmarked = {d["id"]: d for d in out if d["snippet"] is None}
+    for e in fts_entries(conn, list(unmarked)):
+        texts = (e["code_input"], e["code_output"], _text_leaves(e["report"]))
+        unmarked[e["id"]]["snippet"] = next(filter(None, (_excerpt(t, query) for t in texts)), "")
+    for d in unmarked.values():
+        d["snippet"] = d["snippet"] or _mark(d["preview"], query)
     return out
 
 
-def get_one(user_id: int, history_id: int) -> Optional[Dict]:
-    conn = get_conn()
-    ensure_schema(conn)
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, type, title, language_from, language_to, code_input, code_output, report_json, score, created_at FROM history WHERE user_id = ? AND id = ?",
-        (user_id, history_id),
-    )
-    row = cur.fetchone()
-    conn.close()
-    if not row:
-        return None
-    d = dict(row)
-    if d.get("report_json"):
+# Full rows: list columns + code/report bodies resolved from their blobs
+_FULL_SELECT = """
+    SELECT h.id, h.user_id, h.type, h.title, h.language_from, h.language_to, h.score, h.created_at,
+           h.code_input, h.code_output, h.report_json,
+           bi.codec AS input_codec, bi.data AS input_data,
+           bo.codec AS output_codec, bo.data AS output_data,
+           br.codec AS report_codec, br.data AS report_data
+    FROM history h
+    LEFT JOIN blobs bi ON bi.hash = h.input_ref
+    LEFT JOIN blobs bo ON bo.hash = h.output_ref
+    LEFT JOIN blobs br ON br.hash = h.report_ref
+"""
+
+
+def _full_row(r) -> Dict:
+    """Decode a _FULL_SELECT row; inline columns are only set on rows written before blobs existed."""
+    d = {k: r[k] for k in ("id", "user_id", "type", "title", "language_from", "language_to", "score", "created_at")}
+    d["code_input"] = decode(r["input_codec"], r["input_data"]) or r["code_input"]
+    d["code_output"] = decode(r["output_codec"], r["output_data"]) or r["code_output"]
+    report = decode(r["report_codec"], r["report_data"]) or r["report_json"]
+    d["report_json"] = None
+    if report:
         try:
-            d["report_json"] = json.loads(d["report_json"])
+            d["report_json"] = json.loads(report)
         except Exception:
-            d["report_json"] = None
+            pass
     return d
 
 
+def _fts_values(r) -> Dict:
+    return {
+        "id": r["id"],
+        "title": r["title"],
+        "code_input": decode(r["input_codec"], r["input_data"]) or r["code_input"],
+        "code_output": decode(r["output_codec"], r["output_data"]) or r["code_output"],
+        "report": decode(r["report_codec"], r["report_data"]) or r["report_json"],
+    }
+
+
+def _fts_entry(conn, user_id: int, history_id: int) -> Optional[Dict]:
+    """The values history_fts indexed for one of the user's rows (FTS_INSERT_SQL parameters),
+    or None when there is no such row or no index."""
+    if not has_fts(conn):
+        return None
+    r = conn.execute(f"{_FULL_SELECT} WHERE h.user_id = ? AND h.id = ?", (user_id, history_id)).fetchone()
+    return _fts_values(r) if r else None
+
+
+def fts_entries(conn, ids: List[int]) -> List[Dict]:
+    """The indexed values of the given rows regardless of owner, for fts_unindex() before a bulk delete
+    and for search excerpts."""
+    if not ids or not has_fts(conn):
+        return []
+    marks = ", ".join("?" * len(ids))
+    return [_fts_values(r) for r in conn.execute(f"{_FULL_SELECT} WHERE h.id IN ({marks})", list(ids))]
+
+
+def get_history(user_id: int, limit: int = 100, type_filter: Optional[str] = None) -> List[Dict]:
+    writer.flush()
+    where, params = _history_filter(user_id, type_filter, None, None)
+    rows = get_conn().execute(
+        f"{_FULL_SELECT} WHERE {where} ORDER BY h.created_at DESC, h.id DESC LIMIT ?",
+        params + [limit],
+    ).fetchall()
+    return [_full_row(r) for r in rows]
+
+
+def _history_filter(user_id: int, type_filter: Optional[str], date_from: Optional[str], date_to: Optional[str]):
+    """WHERE clause + params for user/type/date-range filters (dates are inclusive YYYY-MM-DD)."""
+    where = ["h.user_id = ?"]
+    params: List[Any] = [user_id]
+    if type_filter:
+        where.append("h.type = ?")
+        params.append(type_filter)
+    if date_from:
+        where.append("h.created_at >= ?")
+        params.append(str(date_from))
+    if date_to:
+        where.append("h.created_at < date(?, '+1 day')")
+        params.append(str(date_to))
+    return " AND ".join(where), params
+
+
+def count_history(
+    user_id: int,
+    type_filter: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> int:
+    writer.flush()
+    where, params = _history_filter(user_id, type_filter, date_from, date_to)
+    return get_conn().execute(f"SELECT COUNT(*) FROM history h WHERE {where}", params).fetchone()[0]
+
+
+def iter_history(
+    user_id: int,
+    type_filter: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    batch_size: int = 50,
+) -> Iterator[Dict]:
+    """Yield full history rows (oldest first) in batches; never loads the whole result set."""
+    writer.flush()
+    where, params = _history_filter(user_id, type_filter, date_from, date_to)
+    cur = get_conn().cursor()
+    cur.execute(f"{_FULL_SELECT} WHERE {where} ORDER BY h.created_at, h.id", params)
+    try:
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for r in rows:
+                yield _full_row(r)
+    finally:
+        cur.close()
+
+
+def get_one(user_id: int, history_id: int) -> Optional[Dict]:
+    writer.flush()
+    row = get_conn().execute(f"{_FULL_SELECT} WHERE h.user_id = ? AND h.id = ?", (user_id, history_id)).fetchone()
+    return _full_row(row) if row else None
+
+
+def get_rows_by_id(ids: List[int]) -> List[Dict]:
+    """Full rows for the given ids regardless of owner (maintenance/archival use)."""
+    if not ids:
+        return []
+    marks = ", ".join("?" * len(ids))
+    rows = get_conn().execute(f"{_FULL_SELECT} WHERE h.id IN ({marks}) ORDER BY h.id", list(ids)).fetchall()
+    return [_full_row(r) for r in rows]
+
+
 def rename_history(user_id: int, history_id: int, new_title: str) -> bool:
+    writer.flush()
     conn = get_conn()
-    ensure_schema(conn)
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE history SET title = ? WHERE id = ? AND user_id = ?",
-        (new_title.strip(), history_id, user_id),
-    )
-    conn.commit()
-    ok = cur.rowcount > 0
-    conn.close()
-    return ok
+    with conn:
+        entry = _fts_entry(conn, user_id, history_id)
+        cur = conn.execute(
+            "UPDATE history SET title = ? WHERE id = ? AND user_id = ?",
+            (new_title.strip(), history_id, user_id),
+        )
+        if cur.rowcount and entry:
+            fts_unindex(conn, [entry])
+            conn.execute(FTS_INSERT_SQL, {**entry, "title": new_title.strip()})
+    return cur.rowcount > 0
 
 
 def update_history_report(user_id: int, history_id: int, report_json: dict, score: Optional[int] = None) -> bool:
+    writer.flush()
+    report = json.dumps(report_json, default=_to_json)
     conn = get_conn()
-    ensure_schema(conn)
-    cur = conn.cursor()
-    if score is not None:
-        cur.execute(
-            "UPDATE history SET report_json = ?, score = ? WHERE id = ? AND user_id = ?",
-            (json.dumps(report_json), score, history_id, user_id),
-        )
-    else:
-        cur.execute(
-            "UPDATE history SET report_json = ? WHERE id = ? AND user_id = ?",
-            (json.dumps(report_json), history_id, user_id),
-        )
-    conn.commit()
-    ok = cur.rowcount > 0
-    conn.close()
-    return ok
+    with conn:
+        entry = _fts_entry(conn, user_id, history_id)
+        ref = put_blobs(conn, [report])[report]
+        if score is not None:
+            cur = conn.execute(
+                "UPDATE history SET report_ref = ?, report_json = NULL, score = ? WHERE id = ? AND user_id = ?",
+                (ref, score, history_id, user_id),
+            )
+        else:
+            cur = conn.execute(
+                "UPDATE history SET report_ref = ?, report_json = NULL WHERE id = ? AND user_id = ?",
+                (ref, history_id, user_id),
+            )
+        if cur.rowcount:
+            conn.execute("DELETE FROM history_issues WHERE history_id = ?", (history_id,))
+            insert_issue_rows(conn, [(history_id, flatten_issues(report_json))])
+        if cur.rowcount and entry:
+            fts_unindex(conn, [entry])
+            conn.execute(FTS_INSERT_SQL, {**entry, "report": report})
+    return cur.rowcount > 0
 
 
 def delete_history(user_id: int, history_id: int) -> bool:
+    writer.flush()
     conn = get_conn()
-    ensure_schema(conn)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM history WHERE id = ? AND user_id = ?", (history_id, user_id))
-    conn.commit()
-    ok = cur.rowcount > 0
-    conn.close()
-    return ok
+    with conn:
+        # With contentless_delete a trigger drops the index entry; otherwise FTS5 needs the indexed values
+        entry = None if fts_deletes(conn) else _fts_entry(conn, user_id, history_id)
+        cur = conn.execute("DELETE FROM history WHERE id = ? AND user_id = ?", (history_id, user_id))
+        if cur.rowcount and entry:
+            fts_unindex(conn, [entry])
+    return cur.rowcount > 0
 
 
 def get_type_counts(user_id: int) -> Dict[str, int]:
-    conn = get_conn()
-    ensure_schema(conn)
-    cur = conn.cursor()
-    cur.execute("SELECT type, COUNT(*) as cnt FROM history WHERE user_id = ? GROUP BY type", (user_id,))
-    rows = cur.fetchall()
-    conn.close()
+    writer.flush()
+    rows = get_conn().execute("SELECT type, cnt FROM user_stats WHERE user_id = ?", (user_id,)).fetchall()
     return {r["type"]: r["cnt"] for r in rows}
+
+
+def get_user_stats(user_id: int) -> Dict[str, Any]:
+    """Dashboard rollup from user_stats (primary-key range, <= one row per type):
+    {"total", "counts", "avg_score", "scored", "last_activity"}."""
+    writer.flush()
+    rows = get_conn().execute(
+        "SELECT type, cnt, score_sum, score_cnt, last_activity FROM user_stats WHERE user_id = ?", (user_id,)
+    ).fetchall()
+    scored = sum(r["score_cnt"] for r in rows)
+    return {
+        "total": sum(r["cnt"] for r in rows),
+        "counts": {r["type"]: r["cnt"] for r in rows},
+        "avg_score": sum(r["score_sum"] for r in rows) // scored if scored else 0,
+        "scored": scored,
+        "last_activity": max((r["last_activity"] for r in rows if r["last_activity"]), default=None),
+    }
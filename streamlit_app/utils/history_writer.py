@@ -0,0 +1,190 @@
+"""
+Write-behind queue for history inserts.
+save_history() allocates the row id up front and returns immediately; a single
+background thread drains the queue and group-commits rows in batches, so UI
+threads never wait on the SQLite write lock.
+Ids are allocated in-process, so only one process may write a database's history:
+the first allocation takes an exclusive lock on a sidecar lock file and holds it
+until exit, and a second server on the same database gets WriterLocked instead
+of reusing ids.
+"""
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import IO, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from utils import storage
+from utils.analytics import insert_issue_rows
+from utils.blobs import put_blobs
+from utils.storage import FTS_INSERT_SQL, get_conn, has_fts
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = 64
+BATCH_WAIT_S = 0.05      # how long to keep collecting after the first queued row
+RETRIES = 3
+
+# Queued row layout; the three bodies are swapped for blob refs at write time,
+# and `issues` (flattened report issues) goes to history_issues
+ROW_FIELDS = ("id", "user_id", "type", "title", "language_from", "language_to",
+              "code_input", "code_output", "report_json", "score", "preview", "issues")
+
+INSERT_SQL = """INSERT INTO history (id, user_id, type, title, language_from, language_to, input_ref, output_ref, report_ref, score, preview)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+_STOP = object()
+
+
+class WriterLocked(RuntimeError):
+    """Another process already writes history to this database."""
+
+
+class HistoryWriter:
+    """Single writer thread with group commit. Rows are tuples laid out as ROW_FIELDS."""
+
+    def __init__(self, batch_size: int = BATCH_SIZE, batch_wait: float = BATCH_WAIT_S):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._next_id: Optional[int] = None
+        self._lock_path: Optional[Path] = None
+        self._lock_file: Optional[IO[bytes]] = None
+
+    def allocate_id(self) -> int:
+        """Next history id. Raises WriterLocked if another process holds the database's writer lock."""
+        with self._lock:
+            if self._next_id is None or self._lock_path != _lock_path(storage.DB_PATH):
+                self._claim(_lock_path(storage.DB_PATH))
+                row = get_conn().execute(
+                    "SELECT MAX(m) FROM (SELECT MAX(id) AS m FROM history "
+                    "UNION ALL SELECT seq FROM sqlite_sequence WHERE name = 'history')"
+                ).fetchone()
+                self._next_id = (row[0] or 0) + 1
+            hid = self._next_id
+            self._next_id += 1
+            return hid
+
+    def _claim(self, path: Path) -> None:
+        """Hold an exclusive lock on `path` for as long as this process writes that database."""
+        if path == self._lock_path:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fh = open(path, "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            fh.close()
+            raise WriterLocked(f"another process holds {path}; run one Streamlit server per database") from None
+        if self._lock_file is not None:
+            self._lock_file.close()  # closing releases the previous database's lock
+        self._lock_path, self._lock_file = path, fh
+
+    def submit(self, row: Tuple) -> None:
+        self._ensure_started()
+        self._queue.put(row)
+
+    def flush(self) -> None:
+        """Block until every row queued so far is committed (or has failed)."""
+        if self._thread is not None:
+            self._ensure_started()  # a dead writer would leave join() waiting forever
+            self._queue.join()
+
+    def shutdown(self) -> None:
+        """Flush and stop the writer thread (registered with atexit)."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _ensure_started(self) -> None:
+        """Start the writer thread if there is none or it died."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    nxt = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if nxt is _STOP:
+                    stop = True
+                    break
+                batch.append(nxt)
+            try:
+                self._write(batch)
+            except Exception:
+                log.exception("History batch write failed; dropping %d rows", len(batch))
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, batch: Sequence[Tuple]) -> None:
+        conn = get_conn()
+        for attempt in range(RETRIES):
+            try:
+                with conn:
+                    self._insert(conn, batch)
+                return
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or attempt == RETRIES - 1:
+                    break
+                time.sleep(0.1 * (attempt + 1))
+            except Exception:  # sqlite3.Error, or a report that won't encode
+                break
+        # Batch failed: fall back to row-by-row so one bad row doesn't drop the rest
+        for row in batch:
+            try:
+                with conn:
+                    self._insert(conn, [row])
+            except Exception:
+                log.exception("Dropping history row %s", row[0])
+
+    def _insert(self, conn: sqlite3.Connection, rows: Sequence[Tuple]) -> None:
+        refs = put_blobs(conn, (t for r in rows for t in r[6:9]))
+        conn.executemany(INSERT_SQL, [r[:6] + tuple(refs.get(t) for t in r[6:9]) + r[9:11] for r in rows])
+        insert_issue_rows(conn, ((r[0], r[11]) for r in rows if r[11]))
+        if has_fts(conn):
+            conn.executemany(FTS_INSERT_SQL, [
+                {"id": r[0], "title": r[3], "code_input": r[6], "code_output": r[7], "report": r[8]}
+                for r in rows
+            ])
+
+
+def _lock_path(db_path: Path) -> Path:
+    return db_path.parent / f"{db_path.name}.writer.lock"
+
+
+writer = HistoryWriter()
+atexit.register(writer.shutdown)
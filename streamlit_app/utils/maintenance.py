@@ -0,0 +1,167 @@
+"""
+History retention job: archive old rows to gzip'd JSONL segments, sweep orphaned
+blobs, and give free pages back with incremental vacuum.
+
+Schedule it (cron / Task Scheduler), from the streamlit_app folder:
+    python -m utils.maintenance                     # settings from config / env
+    python -m utils.maintenance --retention-days 180 --max-per-user 5000
+    python -m utils.maintenance show <history_id>   # read an archived entry back
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import config
+from utils import blobs
+from utils.db import flush_history, fts_entries, get_rows_by_id
+from utils.storage import connect_autocommit, fts_deletes, fts_unindex, get_conn
+
+BATCH_SIZE = 500
+_SEGMENT_RE = re.compile(r"^history-(\d+)-(\d+)\.jsonl\.gz$")
+
+
+def _candidate_ids(retention_days: int, max_per_user: int, limit: int) -> List[int]:
+    """Oldest-first ids past the age limit or beyond each user's newest `max_per_user` rows."""
+    parts, params = [], []
+    if retention_days > 0:
+        parts.append("SELECT id FROM history WHERE created_at < datetime('now', ?)")
+        params.append(f"-{retention_days} days")
+    if max_per_user > 0:
+        parts.append("""SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at DESC, id DESC) AS rn
+            FROM history) WHERE rn > ?""")
+        params.append(max_per_user)
+    if not parts:
+        return []
+    rows = get_conn().execute(f"{' UNION '.join(parts)} ORDER BY id LIMIT ?", params + [limit]).fetchall()
+    return [r[0] for r in rows]
+
+
+def _write_segment(archive_dir: Path, rows: List[Dict]) -> Path:
+    """Write rows to history-<first>-<last>.jsonl.gz atomically (tmp file + rename)."""
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    path = archive_dir / f"history-{rows[0]['id']:09d}-{rows[-1]['id']:09d}.jsonl.gz"
+    tmp = path.with_suffix(".tmp")
+    with gzip.open(tmp, "wt", encoding="utf-8") as fh:
+        for row in rows:
+            fh.write(json.dumps(row, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+    return path
+
+
+def archive_history(
+    retention_days: int = config.HISTORY_RETENTION_DAYS,
+    max_per_user: int = config.HISTORY_MAX_PER_USER,
+    archive_dir: Path = config.ARCHIVE_DIR,
+    dry_run: bool = False,
+) -> Dict[str, int]:
+    """Move expired rows into archive segments, BATCH_SIZE rows per segment.
+    A segment is fully written before its rows are deleted, so a crash can only
+    leave a row both archived and live (readers take the last copy), never lost."""
+    flush_history()
+    if dry_run:
+        return {"archived": len(_candidate_ids(retention_days, max_per_user, -1)), "segments": 0}
+    archived = segments = 0
+    conn = get_conn()
+    while True:
+        ids = _candidate_ids(retention_days, max_per_user, BATCH_SIZE)
+        if not ids:
+            break
+        rows = get_rows_by_id(ids)
+        _write_segment(archive_dir, rows)
+        with conn:
+            if not fts_deletes(conn):  # without contentless_delete no trigger clears the search index
+                fts_unindex(conn, fts_entries(conn, ids))
+            conn.executemany("DELETE FROM history WHERE id = ?", [(i,) for i in ids])
+        archived += len(ids)
+        segments += 1
+    return {"archived": archived, "segments": segments}
+
+
+def _segments(archive_dir: Path, history_id: Optional[int] = None) -> List[Path]:
+    out = []
+    if archive_dir.exists():
+        for p in sorted(archive_dir.iterdir()):
+            m = _SEGMENT_RE.match(p.name)
+            if m and (history_id is None or int(m.group(1)) <= history_id <= int(m.group(2))):
+                out.append(p)
+    return out
+
+
+def iter_archived(user_id: Optional[int] = None, archive_dir: Path = config.ARCHIVE_DIR) -> Iterator[Dict]:
+    """Stream archived rows (oldest segment first), optionally for one user."""
+    for seg in _segments(archive_dir):
+        with gzip.open(seg, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                row = json.loads(line)
+                if user_id is None or row.get("user_id") == user_id:
+                    yield row
+
+
+def get_archived(history_id: int, user_id: Optional[int] = None, archive_dir: Path = config.ARCHIVE_DIR) -> Optional[Dict]:
+    """Read one archived entry back; only segments whose id range covers it are opened."""
+    found = None
+    for seg in _segments(archive_dir, history_id):
+        with gzip.open(seg, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                row = json.loads(line)
+                if row.get("id") == history_id and (user_id is None or row.get("user_id") == user_id):
+                    found = row
+    return found
+
+
+def incremental_vacuum(pages: int = config.VACUUM_PAGES) -> Dict[str, int]:
+    """Release up to `pages` free pages. The first run switches the file to
+    auto_vacuum=INCREMENTAL, which needs one full VACUUM."""
+    conn = connect_autocommit()
+    try:
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        else:
+            conn.execute(f"PRAGMA incremental_vacuum({int(pages)})")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+    return {"pages_freed": max(0, before - after)}
+
+
+def run_maintenance(
+    retention_days: int = config.HISTORY_RETENTION_DAYS,
+    max_per_user: int = config.HISTORY_MAX_PER_USER,
+    vacuum_pages: int = config.VACUUM_PAGES,
+    dry_run: bool = False,
+) -> Dict[str, int]:
+    summary = archive_history(retention_days, max_per_user, dry_run=dry_run)
+    if not dry_run:
+        summary["blobs_swept"] = blobs.sweep(get_conn())
+        summary.update(incremental_vacuum(vacuum_pages))
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m utils.maintenance", description="CodeRefine history maintenance")
+    ap.add_argument("--retention-days", type=int, default=config.HISTORY_RETENTION_DAYS)
+    ap.add_argument("--max-per-user", type=int, default=config.HISTORY_MAX_PER_USER)
+    ap.add_argument("--vacuum-pages", type=int, default=config.VACUUM_PAGES)
+    ap.add_argument("--dry-run", action="store_true", help="only count rows that would be archived")
+    sub = ap.add_subparsers(dest="cmd")
+    show = sub.add_parser("show", help="print an archived entry as JSON")
+    show.add_argument("history_id", type=int)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "show":
+        row = get_archived(args.history_id)
+        print(json.dumps(row, indent=2, ensure_ascii=False) if row else "Not found in archive.")
+        return
+    print(json.dumps(run_maintenance(args.retention_days, args.max_per_user, args.vacuum_pages, args.dry_run)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,522 @@
+"""
+SQLite storage layer shared by auth and history.
+One connection per thread (WAL, busy_timeout, statement cache); schema migrations
+run once per process, tracked with PRAGMA user_version.
+"""
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+_here = Path(__file__).resolve().parent.parent
+DB_PATH = _here / "database" / "coderefine.db"
+
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+PREVIEW_CHARS = 120
+
+_local = threading.local()
+_migrate_lock = threading.Lock()
+_migrated = set()
+
+
+def _connect(path: Path, isolation_level: Optional[str] = "") -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(
+        str(path),
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        isolation_level=isolation_level,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+def get_conn() -> sqlite3.Connection:
+    """Thread-local connection to DB_PATH; the schema is guaranteed to be current.
+    Callers must not close it. Use `with conn:` around writes."""
+    path = DB_PATH
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != path:
+        migrate(path)
+        conn = _connect(path)
+        _local.conn = conn
+        _local.path = path
+    return conn
+
+
+def connect_autocommit(path: Optional[Path] = None) -> sqlite3.Connection:
+    """Fresh migrated connection in autocommit mode, for VACUUM / checkpoints. Caller closes it."""
+    path = path or DB_PATH
+    migrate(path)
+    return _connect(path, isolation_level=None)
+
+
+# ── Migrations ──────────────────────────────────────────────
+# Append new steps; never edit or reorder shipped ones. Step N sets user_version = N.
+
+def _m001_base(conn: sqlite3.Connection) -> None:
+    """users + history tables (also upgrades pre-title history tables)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            name TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            title TEXT DEFAULT '',
+            language_from TEXT,
+            language_to TEXT,
+            code_input TEXT,
+            code_output TEXT,
+            report_json TEXT,
+            score INTEGER,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(history)")}
+    if "title" not in cols:
+        conn.execute("ALTER TABLE history ADD COLUMN title TEXT DEFAULT ''")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_user ON history(user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_created ON history(created_at DESC)")
+
+
+def _m002_user_created_index(conn: sqlite3.Connection) -> None:
+    """Per-user listing by recency becomes one index range scan (no sort)."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_user_created ON history(user_id, created_at)")
+
+
+def _m003_listing_preview(conn: sqlite3.Connection) -> None:
+    """Stored list preview + keyset indexes on (user_id[, type], created_at, id)."""
+    conn.execute("ALTER TABLE history ADD COLUMN preview TEXT")
+    conn.execute(f"""
+        UPDATE history SET preview =
+            substr(replace(code_input, char(10), ' '), 1, {PREVIEW_CHARS})
+            || CASE WHEN length(code_input) > {PREVIEW_CHARS} THEN '...' ELSE '' END
+        WHERE code_input IS NOT NULL
+    """)
+    conn.execute("DROP INDEX IF EXISTS idx_history_user_created")
+    conn.execute("DROP INDEX IF EXISTS idx_history_user")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_user_recent ON history(user_id, created_at DESC, id DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_user_type_recent ON history(user_id, type, created_at DESC, id DESC)")
+
+
+def _m004_user_stats(conn: sqlite3.Connection) -> None:
+    """Per-user, per-type rollup kept current by triggers (history.type is never updated)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            cnt INTEGER NOT NULL DEFAULT 0,
+            score_sum INTEGER NOT NULL DEFAULT 0,
+            score_cnt INTEGER NOT NULL DEFAULT 0,
+            last_activity TEXT,
+            PRIMARY KEY (user_id, type)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_history_stats_insert AFTER INSERT ON history BEGIN
+            INSERT INTO user_stats (user_id, type, cnt, score_sum, score_cnt, last_activity)
+            VALUES (NEW.user_id, NEW.type, 1, coalesce(NEW.score, 0), NEW.score IS NOT NULL, NEW.created_at)
+            ON CONFLICT (user_id, type) DO UPDATE SET
+                cnt = cnt + 1,
+                score_sum = score_sum + excluded.score_sum,
+                score_cnt = score_cnt + excluded.score_cnt,
+                last_activity = max(coalesce(last_activity, ''), excluded.last_activity);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_history_stats_delete AFTER DELETE ON history BEGIN
+            UPDATE user_stats SET
+                cnt = cnt - 1,
+                score_sum = score_sum - coalesce(OLD.score, 0),
+                score_cnt = score_cnt - (OLD.score IS NOT NULL),
+                last_activity = (SELECT max(created_at) FROM history WHERE user_id = OLD.user_id AND type = OLD.type)
+            WHERE user_id = OLD.user_id AND type = OLD.type;
+            DELETE FROM user_stats WHERE user_id = OLD.user_id AND type = OLD.type AND cnt <= 0;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_history_stats_score AFTER UPDATE OF score ON history
+        WHEN OLD.score IS NOT NEW.score BEGIN
+            UPDATE user_stats SET
+                score_sum = score_sum - coalesce(OLD.score, 0) + coalesce(NEW.score, 0),
+                score_cnt = score_cnt - (OLD.score IS NOT NULL) + (NEW.score IS NOT NULL)
+            WHERE user_id = NEW.user_id AND type = NEW.type;
+        END
+    """)
+    conn.execute("DELETE FROM user_stats")
+    conn.execute("""
+        INSERT INTO user_stats (user_id, type, cnt, score_sum, score_cnt, last_activity)
+        SELECT user_id, type, COUNT(*), coalesce(SUM(score), 0), COUNT(score), MAX(created_at)
+        FROM history GROUP BY user_id, type
+    """)
+
+
+def has_fts(conn: sqlite3.Connection) -> bool:
+    """True when history_fts exists (this SQLite has FTS5 + JSON1, or had them when it was built)."""
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'history_fts'").fetchone() is not None
+
+
+# Text leaves of report_json, concatenated for indexing
+_REPORT_TEXT_SQL = """CASE WHEN json_valid({col}) THEN
+    (SELECT group_concat(value, ' ') FROM json_tree({col}) WHERE type = 'text') END"""
+
+
+# Parameterised forms used by the writer once code moved into blobs (migration 6); since migration 8
+# history_fts is contentless, so the values to remove an entry must be the ones that were indexed
+_FTS_VALUES = f":title, :code_input, :code_output, {_REPORT_TEXT_SQL.format(col=':report')}"
+FTS_INSERT_SQL = f"""
+    INSERT INTO history_fts (rowid, title, code_input, code_output, report_text) VALUES (:id, {_FTS_VALUES})
+"""
+_FTS_FORGET_SQL = f"""
+    INSERT INTO history_fts (history_fts, rowid, title, code_input, code_output, report_text)
+    VALUES ('delete', :id, {_FTS_VALUES})
+"""
+
+
+def fts_deletes(conn: sqlite3.Connection) -> bool:
+    """True when history_fts takes plain DELETEs (contentless_delete, SQLite 3.43+)."""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'history_fts'").fetchone()
+    return row is not None and "contentless_delete" in row[0]
+
+
+def fts_unindex(conn: sqlite3.Connection, entries: Sequence[Dict[str, Any]]) -> None:
+    """Remove history_fts entries. `entries` are FTS_INSERT_SQL parameters holding the values
+    that were indexed; without contentless_delete, FTS5 needs them to find the postings."""
+    if fts_deletes(conn):
+        conn.executemany("DELETE FROM history_fts WHERE rowid = :id", entries)
+    else:
+        conn.executemany(_FTS_FORGET_SQL, entries)
+
+
+def _fts_available(conn: sqlite3.Connection) -> bool:
+    """True when this SQLite has FTS5 and JSON1 compiled in."""
+    try:
+        conn.execute("SELECT json_valid('{}')")
+        conn.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp._fts5_probe")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def _m005_history_fts(conn: sqlite3.Connection) -> None:
+    """Full-text index over title, code and report text; skipped if FTS5/JSON1 are not compiled in
+    (migrate() builds it once they are)."""
+    if not _fts_available(conn):
+        return
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+            user_id UNINDEXED, title, code_input, code_output, report_text,
+            tokenize = 'unicode61'
+        )
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_history_fts_insert AFTER INSERT ON history BEGIN
+            INSERT INTO history_fts (rowid, user_id, title, code_input, code_output, report_text)
+            VALUES (NEW.id, NEW.user_id, NEW.title, NEW.code_input, NEW.code_output,
+                    {_REPORT_TEXT_SQL.format(col="NEW.report_json")});
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_history_fts_delete AFTER DELETE ON history BEGIN
+            DELETE FROM history_fts WHERE rowid = OLD.id;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_history_fts_update AFTER UPDATE OF title, report_json ON history BEGIN
+            UPDATE history_fts SET title = NEW.title,
+                report_text = {_REPORT_TEXT_SQL.format(col="NEW.report_json")}
+            WHERE rowid = NEW.id;
+        END
+    """)
+    conn.execute(f"""
+        INSERT INTO history_fts (rowid, user_id, title, code_input, code_output, report_text)
+        SELECT id, user_id, title, code_input, code_output, {_REPORT_TEXT_SQL.format(col="report_json")}
+        FROM history
+    """)
+
+
+def _m006_content_blobs(conn: sqlite3.Connection) -> None:
+    """Move code_input / code_output / report_json into compressed, refcounted blobs."""
+    from utils.blobs import put_blobs
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            id INTEGER PRIMARY KEY,
+            hash TEXT NOT NULL UNIQUE,
+            codec TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for col in ("input_ref", "output_ref", "report_ref"):
+        conn.execute(f"ALTER TABLE history ADD COLUMN {col} TEXT")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_history_{col} ON history({col}) WHERE {col} IS NOT NULL")
+
+    def adjust(ref: str, delta: str) -> str:
+        return f"UPDATE blobs SET refcount = refcount {delta} 1 WHERE hash = {ref};"
+
+    def reclaim(*refs: str) -> str:
+        return f"DELETE FROM blobs WHERE refcount <= 0 AND hash IN ({', '.join(refs)});"
+
+    new_refs = ("NEW.input_ref", "NEW.output_ref", "NEW.report_ref")
+    old_refs = ("OLD.input_ref", "OLD.output_ref", "OLD.report_ref")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_history_blobs_insert AFTER INSERT ON history BEGIN
+            {" ".join(adjust(r, "+") for r in new_refs)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_history_blobs_delete AFTER DELETE ON history BEGIN
+            {" ".join(adjust(r, "-") for r in old_refs)}
+            {reclaim(*old_refs)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_history_blobs_update AFTER UPDATE OF input_ref, output_ref, report_ref ON history BEGIN
+            {" ".join(adjust(r, "-") for r in old_refs)}
+            {" ".join(adjust(r, "+") for r in new_refs)}
+            {reclaim(*old_refs)}
+        END
+    """)
+
+    # Code columns now arrive NULL, so the writer feeds history_fts itself; only renames stay trigger-driven
+    if has_fts(conn):
+        conn.execute("DROP TRIGGER IF EXISTS trg_history_fts_insert")
+        conn.execute("DROP TRIGGER IF EXISTS trg_history_fts_update")
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_history_fts_title AFTER UPDATE OF title ON history BEGIN
+                UPDATE history_fts SET title = NEW.title WHERE rowid = NEW.id;
+            END
+        """)
+
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            """SELECT id, code_input, code_output, report_json FROM history
+               WHERE id > ? AND (code_input IS NOT NULL OR code_output IS NOT NULL OR report_json IS NOT NULL)
+               ORDER BY id LIMIT 500""",
+            (last_id,),
+        ).fetchall()
+        if not rows:
+            break
+        refs = put_blobs(conn, (t for r in rows for t in r[1:]))
+        conn.executemany(
+            """UPDATE history SET input_ref = ?, output_ref = ?, report_ref = ?,
+                   code_input = NULL, code_output = NULL, report_json = NULL WHERE id = ?""",
+            [(refs.get(r[1]), refs.get(r[2]), refs.get(r[3]), r[0]) for r in rows],
+        )
+        last_id = rows[-1][0]
+
+
+def _m007_history_issues(conn: sqlite3.Connection) -> None:
+    """Normalized per-issue table plus its daily rollup for analytics, backfilled from existing reports."""
+    from utils.analytics import flatten_issues, insert_issue_rows
+    from utils.blobs import decode
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS history_issues (
+            history_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            entry_type TEXT NOT NULL,
+            language TEXT,
+            category TEXT NOT NULL,
+            issue_type TEXT NOT NULL,
+            line INTEGER,
+            created_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_issues_history ON history_issues(history_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_issues_user ON history_issues(user_id)")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_history_issues_delete AFTER DELETE ON history BEGIN
+            DELETE FROM history_issues WHERE history_id = OLD.id;
+        END
+    """)
+
+    # Daily rollup the analytics queries read: one row per (user, day, language, entry type, issue type)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS issue_rollup (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            language TEXT NOT NULL,
+            entry_type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            issue_type TEXT NOT NULL,
+            cnt INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, language, entry_type, category, issue_type)
+        ) WITHOUT ROWID
+    """)
+    key = """user_id = OLD.user_id AND day = substr(OLD.created_at, 1, 10) AND language = COALESCE(OLD.language, 'unknown')
+             AND entry_type = OLD.entry_type AND category = OLD.category AND issue_type = OLD.issue_type"""
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_issue_rollup_insert AFTER INSERT ON history_issues BEGIN
+            INSERT INTO issue_rollup (user_id, day, language, entry_type, category, issue_type, cnt)
+            VALUES (NEW.user_id, substr(NEW.created_at, 1, 10), COALESCE(NEW.language, 'unknown'),
+                    NEW.entry_type, NEW.category, NEW.issue_type, 1)
+            ON CONFLICT DO UPDATE SET cnt = cnt + 1;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_issue_rollup_delete AFTER DELETE ON history_issues BEGIN
+            UPDATE issue_rollup SET cnt = cnt - 1 WHERE {key};
+            DELETE FROM issue_rollup WHERE {key} AND cnt <= 0;
+        END
+    """)
+
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            """SELECT h.id, b.codec, b.data FROM history h JOIN blobs b ON b.hash = h.report_ref
+               WHERE h.id > ? ORDER BY h.id LIMIT 500""",
+            (last_id,),
+        ).fetchall()
+        if not rows:
+            break
+        batch = []
+        for hid, codec, data in rows:
+            try:
+                batch.append((hid, flatten_issues(json.loads(decode(codec, data)))))
+            except (ValueError, RuntimeError):
+                continue
+        insert_issue_rows(conn, batch)
+        last_id = rows[-1][0]
+
+
+def _m008_contentless_fts(conn: sqlite3.Connection) -> None:
+    """Rebuild history_fts as a contentless index: the text already lives in blobs, so the
+    table keeps only its postings. Rows are scoped to a user by joining history."""
+    if not has_fts(conn):
+        return
+    conn.execute("DROP TRIGGER IF EXISTS trg_history_fts_title")
+    conn.execute("DROP TRIGGER IF EXISTS trg_history_fts_delete")
+    conn.execute("DROP TABLE history_fts")
+    _create_history_fts(conn)
+
+
+def _create_history_fts(conn: sqlite3.Connection) -> None:
+    """Create the contentless history_fts (and its delete trigger where supported) and index every row."""
+    from utils.blobs import decode
+
+    columns = "title, code_input, code_output, report_text, content = '', tokenize = 'unicode61'"
+    try:
+        conn.execute(f"CREATE VIRTUAL TABLE history_fts USING fts5({columns}, contentless_delete = 1)")
+    except sqlite3.OperationalError:  # SQLite < 3.43
+        conn.execute(f"CREATE VIRTUAL TABLE history_fts USING fts5({columns})")
+    if fts_deletes(conn):
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_history_fts_delete AFTER DELETE ON history BEGIN
+                DELETE FROM history_fts WHERE rowid = OLD.id;
+            END
+        """)
+    # Without contentless_delete, whoever deletes history rows removes their entries with fts_unindex()
+
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            """SELECT h.id, h.title, h.code_input, h.code_output, h.report_json,
+                      bi.codec, bi.data, bo.codec, bo.data, br.codec, br.data
+               FROM history h
+               LEFT JOIN blobs bi ON bi.hash = h.input_ref
+               LEFT JOIN blobs bo ON bo.hash = h.output_ref
+               LEFT JOIN blobs br ON br.hash = h.report_ref
+               WHERE h.id > ? ORDER BY h.id LIMIT 500""",
+            (last_id,),
+        ).fetchall()
+        if not rows:
+            break
+        entries = []
+        for r in rows:
+            try:
+                entries.append({"id": r[0], "title": r[1], "code_input": decode(r[5], r[6]) or r[2],
+                                "code_output": decode(r[7], r[8]) or r[3], "report": decode(r[9], r[10]) or r[4]})
+            except (ValueError, RuntimeError):
+                continue
+        conn.executemany(FTS_INSERT_SQL, entries)
+        last_id = rows[-1][0]
+
+
+def _m009_bugfix_issue_context(conn: sqlite3.Connection) -> None:
+    """Drop a bugfix entry's issue rows (its static_issues) when a quality entry of the same run,
+    i.e. same user and input saved shortly before, already counted them. Quality reports only
+    carry static_issues since that page change, so older bugfix entries, the only record of
+    their run's issues, keep theirs."""
+    conn.execute("""
+        DELETE FROM history_issues WHERE history_id IN (
+            SELECT b.id FROM history b JOIN history q
+              ON q.user_id = b.user_id AND q.input_ref = b.input_ref AND q.type = 'quality' AND q.id < b.id
+             AND q.created_at >= datetime(b.created_at, '-1 hour')
+            WHERE b.type = 'bugfix' AND EXISTS (SELECT 1 FROM history_issues i WHERE i.history_id = q.id))
+    """)
+
+
+def _late_history_fts(conn: sqlite3.Connection) -> None:
+    """Build history_fts for a database that migration 5 left without one because SQLite then
+    lacked FTS5/JSON1. user_version is unchanged: the index is in its current form."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if not has_fts(conn):
+            _create_history_fts(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _m001_base,
+    _m002_user_created_index,
+    _m003_listing_preview,
+    _m004_user_stats,
+    _m005_history_fts,
+    _m006_content_blobs,
+    _m007_history_issues,
+    _m008_contentless_fts,
+    _m009_bugfix_issue_context,
+]
+
+
+def migrate(path: Optional[Path] = None) -> int:
+    """Bring the database at `path` up to date. Runs at most once per process per path.
+    Each step runs in its own BEGIN IMMEDIATE transaction, so concurrent processes
+    serialize on the write lock and skip steps another process already applied."""
+    path = path or DB_PATH
+    with _migrate_lock:
+        if path in _migrated:
+            return len(MIGRATIONS)
+        conn = _connect(path, isolation_level=None)
+        try:
+            current = conn.execute("PRAGMA user_version").fetchone()[0]
+            for version, step in enumerate(MIGRATIONS, 1):
+                if version <= current:
+                    continue
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if conn.execute("PRAGMA user_version").fetchone()[0] < version:
+                        step(conn)
+                        conn.execute(f"PRAGMA user_version = {version}")
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            if not has_fts(conn) and _fts_available(conn):
+                _late_history_fts(conn)
+        finally:
+            conn.close()
+        _migrated.add(path)
+    return len(MIGRATIONS)